@@ -0,0 +1,295 @@
+"""
+End-to-end flashing benchmark.
+Runs the real flashers against the stub openocd, JLinkExe and stm8flash
+from benchmarks/stubs (put first on PATH), which sleep as long as the
+real tools would for the programmed data. For every scenario it measures
+the time per device on one probe and the batch throughput over several
+probes, then compares both with benchmarks/baselines.json.
+
+    python benchmarks/bench_flash.py [--only stm32] [--update-baseline]
+
+Exit code is 1 if a scenario is slower than its baseline by more than
+--threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from firmware_tools import CC, STM8, STM32, Device  # noqa: E402
+from firmware_tools import FlashJob, FlashOrchestrator  # noqa: E402
+from firmware_tools.classes import DevRadio  # noqa: E402
+from firmware_tools.FirmwareImage import FirmwareImage  # noqa: E402
+from firmware_tools.FlashMetrics import FlashMetrics  # noqa: E402
+
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+BASELINES = os.path.join(BENCH_DIR, 'baselines.json')
+BOOTLOADER_SIZE = 0x4000
+
+
+@dataclass
+class Scenario:
+    name: str
+    device: Device
+    flasher: str
+    image_base: int
+    image_size: int
+    with_bootloader: bool = False
+    options: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def family(self) -> str:
+        return type(self.device.processor).__name__
+
+
+def _device(
+        name: str, processor, id_address: int, family=DevRadio.INTRUSION,
+) -> Device:
+    return Device(name, processor, family, id_address=id_address)
+
+
+SCENARIOS = [
+    Scenario(
+        'stm8_flash_8k', _device('DoorProtect', STM8.STM8_6, 0x8080),
+        'STlink', 0x8000, 0x2000,
+    ),
+    Scenario(
+        'stm8_flash_32k', _device('DoorProtect', STM8.STM8_6, 0x8080),
+        'STlink', 0x8000, 0x8000,
+    ),
+    Scenario(
+        'stm8_eeprom_id_32k', _device('DoorProtect', STM8.STM8_6, 0x1010),
+        'STlink', 0x8000, 0x8000,
+    ),
+    Scenario(
+        'stm8_eeprom_delta_32k',
+        _device('DoorProtect', STM8.STM8_6, 0x1010),
+        'STlink', 0x8000, 0x8000, options={'eeprom_delta': True},
+    ),
+    Scenario(
+        'stm32_64k', _device('MotionCam', STM32.STM32_U5, 0x08000400),
+        'STlink', 0x08000000, 0x10000,
+    ),
+    Scenario(
+        'stm32_256k', _device('MotionCam', STM32.STM32_U5, 0x08000400),
+        'STlink', 0x08000000, 0x40000,
+    ),
+    Scenario(
+        'stm32_boot_256k', _device('MotionCam', STM32.STM32_U5, 0x08020400),
+        'STlink', 0x08020000, 0x40000, with_bootloader=True,
+    ),
+    Scenario(
+        'cc1310_64k', _device('KeyPadCombi', CC.CC_1310, 0xE000),
+        'JLink', 0x0, 0x10000,
+    ),
+    Scenario(
+        'cc1310_64k_session', _device('KeyPadCombi', CC.CC_1310, 0xE000),
+        'JLink', 0x0, 0x10000, options={'jlink_session': True},
+    ),
+    Scenario(
+        'cc1310_128k', _device('KeyPadCombi', CC.CC_1310, 0x1E000),
+        'JLink', 0x0, 0x20000,
+    ),
+    Scenario(
+        'cc1352_352k', _device('Bench1352', CC.CC_1352, 0x56000),
+        'JLink', 0x0, 0x58000,
+    ),
+]
+
+
+def write_image(path: str, base: int, size: int, seed: int) -> str:
+    data = random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+    return FirmwareImage.from_bytes(data, base).write_hex(path)
+
+
+def prepare_files(
+        scenario: Scenario, workdir: str, probes: int,
+) -> list[tuple[str, Optional[str]]]:
+    """(firmware, bootloader) per probe, every probe has its own folder"""
+    files = []
+    for probe in range(probes):
+        folder = os.path.join(workdir, scenario.name, f'probe{probe}')
+        os.makedirs(folder, exist_ok=True)
+        name = f'[{scenario.device.name}][1.0.0][EU][0][3B].hex'
+        firmware = write_image(
+            os.path.join(folder, name),
+            scenario.image_base, scenario.image_size, seed=1,
+        )
+        bootloader = None
+        if scenario.with_bootloader:
+            bootloader = write_image(
+                os.path.join(folder, 'bootloader.hex'),
+                0x08000000, BOOTLOADER_SIZE, seed=2,
+            )
+        files.append((firmware, bootloader))
+    return files
+
+
+def make_jobs(
+        scenario: Scenario,
+        files: list[tuple[str, Optional[str]]],
+        devices: int,
+        first_id: int,
+) -> list[FlashJob]:
+    jobs = []
+    for index in range(devices):
+        probe = index % len(files)
+        firmware, bootloader = files[probe]
+        options = dict(scenario.options)
+        if bootloader is not None:
+            options['bootloader'] = bootloader
+        jobs.append(FlashJob(
+            dataclasses.replace(scenario.device),
+            firmware,
+            f'{first_id + index:06X}',
+            programmer_sn=f'BENCH{probe}',
+            flasher=scenario.flasher,
+            options=options,
+        ))
+    return jobs
+
+
+def run_scenario(
+        scenario: Scenario, workdir: str, devices: int, probes: int,
+) -> dict[str, Any]:
+    metrics = FlashMetrics()
+    single = FlashOrchestrator(metrics=metrics).run(make_jobs(
+        scenario, prepare_files(scenario, workdir, 1), devices, 0x100000,
+    ))
+    batch = FlashOrchestrator().run(make_jobs(
+        scenario, prepare_files(scenario, workdir, probes), devices,
+        0x200000,
+    ))
+    job_seconds = metrics.summary()['job_seconds']
+    return {
+        'family': scenario.family,
+        'image_size': scenario.image_size,
+        'per_device_s': job_seconds['mean'],
+        'per_device_p95_s': job_seconds['p95'],
+        'devices_per_minute': round(batch.devices_per_minute, 3),
+        'failed': len(single.failed) + len(batch.failed),
+        'bottleneck': metrics.bottleneck(),
+    }
+
+
+def compare(
+        results: dict[str, dict[str, Any]],
+        baselines: dict[str, dict[str, Any]],
+        threshold: float,
+) -> list[str]:
+    """Descriptions of results worse than baseline by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        if result['per_device_s'] > baseline['per_device_s'] * (
+                1 + threshold
+        ):
+            regressions.append(
+                f"{name}: {result['per_device_s']:.3f}s per device,"
+                f" baseline {baseline['per_device_s']:.3f}s",
+            )
+        if result['devices_per_minute'] < baseline['devices_per_minute'] * (
+                1 - threshold
+        ):
+            regressions.append(
+                f"{name}: {result['devices_per_minute']:.1f} devices/min,"
+                f" baseline {baseline['devices_per_minute']:.1f}",
+            )
+        # a failed job finishes early, any new failure is a regression
+        if result['failed'] > baseline.get('failed', 0):
+            regressions.append(
+                f"{name}: {result['failed']} failed,"
+                f" baseline {baseline.get('failed', 0)}",
+            )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--only', default='', help='scenario name filter')
+    parser.add_argument('--devices', type=int, default=6)
+    parser.add_argument('--probes', type=int, default=3)
+    parser.add_argument(
+        '--scale', type=float, default=0.05,
+        help='stub delay multiplier, 1.0 is real programmer speed',
+    )
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--baselines', default=BASELINES)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--json', default=None, help='write results here')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['PATH'] = STUBS_DIR + os.pathsep + os.environ['PATH']
+    os.environ['FAKE_PROGRAMMER_SCALE'] = str(args.scale)
+    os.environ['FAKE_PROGRAMMER_FAIL_RATE'] = str(args.fail_rate)
+    settings = {
+        'devices': args.devices, 'probes': args.probes, 'scale': args.scale,
+        'fail_rate': args.fail_rate,
+    }
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='bench_flash_')
+    try:
+        for scenario in SCENARIOS:
+            if args.only not in scenario.name:
+                continue
+            result = run_scenario(scenario, workdir, args.devices, args.probes)
+            results[scenario.name] = result
+            print(
+                f"{scenario.name:24} {result['per_device_s']:7.3f}s/device"
+                f" p95 {result['per_device_p95_s']:7.3f}s"
+                f" {result['devices_per_minute']:8.1f} devices/min"
+                f" failed {result['failed']}"
+                f" slowest {result['bottleneck']}",
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'settings': settings, 'results': results}, file,
+                      indent=2)
+
+    stored: dict[str, Any] = {'settings': settings, 'scenarios': {}}
+    if os.path.isfile(args.baselines):
+        with open(args.baselines) as file:
+            stored = json.load(file)
+    if args.update_baseline:
+        failed = [name for name, result in results.items() if result['failed']]
+        if failed:
+            print(f"Jobs failed in {', '.join(failed)}, baselines not written")
+            return 1
+        stored['settings'] = settings
+        stored['scenarios'].update(results)
+        with open(args.baselines, 'w') as file:
+            json.dump(stored, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f'Baselines written to {args.baselines}')
+        return 0
+    if stored['settings'] != settings:
+        print('Settings differ from the baselines, comparison skipped')
+        return 0
+    regressions = compare(results, stored['scenarios'], args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Startup time of the loader CLI.
+Runs `loader.py --help` and `loader.py --list-devices` in fresh
+interpreters and reports the median wall time above a bare `python -c
+pass`, so the numbers do not depend on how slow the interpreter itself
+starts on the station (or in a frozen executable).
+
+    python benchmarks/bench_startup.py [--runs 15] [--budget-ms 80]
+
+Exit code is 1 if a command takes longer than the budget or imports a
+module from HEAVY_MODULES.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+LOADER = os.path.join(ROOT_DIR, 'loader.py')
+
+COMMANDS = {
+    'help': [LOADER, '--help'],
+    'list_devices': [LOADER, '--list-devices'],
+}
+# imported only once a device is flashed or an ID database is opened
+HEAVY_MODULES = (
+    'asyncio', 'sqlite3', 'intelhex', 'concurrent.futures',
+    'firmware_tools.BaseFlasher', 'firmware_tools.flasher_factory',
+    'firmware_tools.IdAllocator',
+)
+
+
+def wall_time(args: list[str], runs: int) -> float:
+    """Median seconds of runs fresh interpreters"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args], check=True, cwd=ROOT_DIR,
+            stdout=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def imported_modules(command: list[str]) -> set[str]:
+    """Modules in sys.modules after command, without running it twice"""
+    code = (
+        'import runpy, sys\n'
+        f'sys.argv = {command!r}\n'
+        'try:\n'
+        f'    runpy.run_path({command[0]!r}, run_name="__main__")\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        'sys.stderr.write("\\n".join(sys.modules))\n'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], check=True, cwd=ROOT_DIR,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    ).stderr
+    return set(output.splitlines())
+
+
+def heavy_imports(command: list[str]) -> list[str]:
+    return sorted(set(HEAVY_MODULES) & imported_modules(command))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument(
+        '--budget-ms', type=float, default=80.0,
+        help='allowed time above a bare interpreter start',
+    )
+    args = parser.parse_args(argv)
+
+    interpreter = wall_time(['-c', 'pass'], args.runs)
+    print(f"{'interpreter':14} {interpreter * 1000:7.1f} ms")
+    failed = False
+    for name, command in COMMANDS.items():
+        startup = wall_time(command, args.runs) - interpreter
+        heavy = heavy_imports(command)
+        over = startup * 1000 > args.budget_ms
+        failed = failed or over or bool(heavy)
+        print(
+            f"{name:14} {startup * 1000:+7.1f} ms"
+            f"{'  OVER BUDGET' if over else ''}"
+            f"{'  imports ' + ', '.join(heavy) if heavy else ''}",
+        )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
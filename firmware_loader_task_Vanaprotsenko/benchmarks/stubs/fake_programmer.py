@@ -0,0 +1,198 @@
+"""
+Stand-ins for openocd, JLinkExe and stm8flash.
+Sleep as long as the real tool would for the amount of data and print
+what the flashers expect. Tuned by environment variables:
+FAKE_PROGRAMMER_SCALE - multiplier for every delay (default 1.0)
+FAKE_PROGRAMMER_FAIL_RATE - probability of a failed run (default 0.0)
+FAKE_PROGRAMMER_LOG - file to append one line per run to
+"""
+import os
+import random
+import shlex
+import sys
+import time
+
+# seconds to start and attach, bytes per second for programming
+TIMINGS = {
+    'openocd': {'startup': 0.25, 'write': 25_000, 'verify': 100_000,
+                'unlock': 0.4, 'lock': 0.3},
+    'JLinkExe': {'startup': 0.15, 'write': 80_000, 'verify': 200_000,
+                 'register': 0.005, 'connect': 0.03},
+    'stm8flash': {'startup': 0.2, 'write': 4_000, 'read': 2_000,
+                  'option': 0.1},
+}
+
+
+def scale() -> float:
+    return float(os.environ.get('FAKE_PROGRAMMER_SCALE', '1.0'))
+
+
+def sleep(seconds: float) -> None:
+    time.sleep(seconds * scale())
+
+
+def data_size(path: str) -> int:
+    """Data bytes of a .hex file or size of any other file"""
+    if not path.endswith('.hex'):
+        return os.path.getsize(path)
+    size = 0
+    with open(path) as file:
+        for line in file:
+            if line.startswith(':') and line[7:9] == '00':
+                size += int(line[1:3], 16)
+    return size
+
+
+def hex_lines(data: bytes, address: int) -> list[str]:
+    lines = []
+    upper = None
+    for offset in range(0, len(data), 16):
+        current = address + offset
+        if current >> 16 != upper:
+            upper = current >> 16
+            lines.append(record(4, 0, upper.to_bytes(2, 'big')))
+        lines.append(record(0, current & 0xFFFF, data[offset:offset + 16]))
+    lines.append(record(1, 0, b''))
+    return lines
+
+
+def record(record_type: int, offset: int, data: bytes) -> str:
+    body = bytes([len(data), offset >> 8, offset & 0xFF, record_type]) + data
+    return f':{body.hex().upper()}{-sum(body) & 0xFF:02X}'
+
+
+def fail(tool: str, message: str) -> None:
+    print(f'Error: {message}', file=sys.stderr)
+    log(tool, 'fail')
+    sys.exit(1)
+
+
+def log(tool: str, result: str) -> None:
+    path = os.environ.get('FAKE_PROGRAMMER_LOG')
+    if path:
+        with open(path, 'a') as file:
+            file.write(f'{tool} {result} {shlex.join(sys.argv[1:])}\n')
+
+
+def maybe_fail(tool: str) -> None:
+    rate = float(os.environ.get('FAKE_PROGRAMMER_FAIL_RATE', '0'))
+    if random.random() < rate:
+        sleep(TIMINGS[tool]['startup'])
+        fail(tool, 'target not responding (simulated)')
+
+
+def openocd(args: list[str]) -> None:
+    timing = TIMINGS['openocd']
+    commands = [args[i + 1] for i, arg in enumerate(args) if arg == '-c']
+    scripts = [args[i + 1] for i, arg in enumerate(args) if arg == '-f']
+    sleep(timing['startup'])
+    print('Info : STLINK V2J37S7 (API v2) VID:PID 0483:3748')
+    for script in scripts:
+        if not os.path.isfile(script):
+            continue  # interface/target scripts of the real installation
+        with open(script) as file:
+            text = file.read()
+        if ' unlock ' in text:
+            sleep(timing['unlock'])
+            print('Info : device unlocked')
+        elif ' lock ' in text:
+            sleep(timing['lock'])
+            print('Info : device locked')
+    for command in commands:
+        words = command.split()
+        if 'write_image' in words:
+            path = words[words.index('write_image') + 1]
+            if path == 'erase':
+                path = words[words.index('write_image') + 2]
+            size = data_size(path)
+            sleep(size / timing['write'])
+            print(f'wrote {size} bytes from file {path}')
+        elif 'verify_image_checksum' in words:
+            size = data_size(words[1])
+            sleep(size / timing['verify'])
+            print('verified')
+    print('** Programming Finished **')
+
+
+def jlink(args: list[str]) -> None:
+    timing = TIMINGS['JLinkExe']
+    sleep(timing['startup'])
+    print('SEGGER J-Link Commander')
+    if '-CommandFile' not in args:
+        jlink_commander(timing)
+        return
+    with open(args[args.index('-CommandFile') + 1]) as file:
+        commands = [line.split() for line in file if line.strip()]
+    for words in commands:
+        jlink_command(words, timing)
+    print('Script processing completed.')
+
+
+def jlink_commander(timing: dict[str, float]) -> None:
+    """Commands from stdin, a prompt after each, as JLinkExe without a file"""
+    rate = float(os.environ.get('FAKE_PROGRAMMER_FAIL_RATE', '0'))
+    while True:
+        print('J-Link>', end='', flush=True)
+        words = sys.stdin.readline().split() or ['']
+        command = words[0].lower()
+        if command in ('exit', 'q', 'qc'):
+            break
+        if command == 'connect':
+            sleep(timing['connect'])
+            if random.random() < rate:
+                print('Cannot connect to target. (simulated)')
+        elif command in ('loadfile', 'verifybin') and not os.path.isfile(
+                words[1],
+        ):
+            print(f'Could not open file {words[1]}')
+        elif command:
+            jlink_command(words, timing)
+
+
+def jlink_command(words: list[str], timing: dict[str, float]) -> None:
+    if words[0] == 'loadfile':
+        size = data_size(words[1])
+        sleep(size / timing['write'])
+        print(f'Downloading file [{words[1]}]...O.K.')
+    elif words[0] == 'verifybin':
+        sleep(data_size(words[1]) / timing['verify'])
+        print('Verify successful.')
+    elif words[0] in ('w1', 'w4'):
+        sleep(timing['register'])
+
+
+def stm8flash(args: list[str]) -> None:
+    timing = TIMINGS['stm8flash']
+    sleep(timing['startup'])
+    if '-u' in args:
+        print('Unlocked device. Option bytes reset to default state.')
+        return
+    memory = args[args.index('-s') + 1]
+    if '-r' in args:
+        path = args[args.index('-r') + 1]
+        data = bytes(2048)
+        sleep(len(data) / timing['read'])
+        if path.endswith('.hex'):
+            with open(path, 'w') as file:
+                file.write('\n'.join(hex_lines(data, 0x1000)) + '\n')
+        else:
+            with open(path, 'wb') as file:
+                file.write(data)
+        print(f'Reading {len(data)} bytes at 0x1000... OK')
+        return
+    path = args[args.index('-w') + 1]
+    if memory == 'opt':
+        sleep(timing['option'])
+    else:
+        size = data_size(path)
+        sleep(size / timing['write'])
+    print('Bytes written: OK')
+
+
+TOOLS = {'openocd': openocd, 'JLinkExe': jlink, 'stm8flash': stm8flash}
+
+
+def main(tool: str) -> None:
+    maybe_fail(tool)
+    TOOLS[tool](sys.argv[1:])
+    log(tool, 'ok')
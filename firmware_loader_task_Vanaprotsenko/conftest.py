@@ -0,0 +1,11 @@
+import pytest
+
+import firmware_tools.Workspace
+
+
+@pytest.fixture(autouse=True)
+def workspace_root(monkeypatch, tmp_path_factory):
+    # job workspaces and caches of tests never go to /dev/shm
+    root = str(tmp_path_factory.mktemp('workspace'))
+    monkeypatch.setattr(firmware_tools.Workspace, 'default_root', lambda: root)
+    return root
@@ -3,20 +3,37 @@ import os
 import re
 import shlex
 import subprocess
-import sys
+import time
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from pathlib import Path
-
-from intelhex import IntelHex
+from typing import Callable, Iterator, Optional
 
 from firmware_tools.classes import STM32, Device
-from firmware_tools.utils import search_id_address
+from firmware_tools.CommandRunner import CommandRunner
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.FlashMetrics import JobMetrics
+from firmware_tools.HexTemplate import HexTemplate
+from firmware_tools.IdAllocator import DuplicateIdError
+from firmware_tools.memory_map import (EEPROM, FLASH, ImageValidationError,
+                                       check_patch, memory_map, preflight)
+from firmware_tools.ScriptCache import ScriptCache
+from firmware_tools.utils import image_checksum, search_id_address
+from firmware_tools.Workspace import Workspace, default_cache_folder
+
+
+STM8_EEPROM_START = 0x1000
+STM8L_EEPROM_SIZE = 6144 - 4096
 
 
 class CalledProcessError(RuntimeError):
     pass
 
 
+class VerificationError(CalledProcessError):
+    pass
+
+
 class EepromReadFailure(Exception):
     pass
 
@@ -29,11 +46,15 @@ class BaseFlasher(ABC):
             device_id: str,
             **kwargs,
     ) -> None:
-        self.cfg_folder = os.path.join(
-            os.path.abspath(
-                os.path.dirname(sys.argv[0]),
-            ), "Config",
+        # shared content-addressed caches, per-job files go to workspace,
+        # the caches create their folders on first write
+        self.cfg_folder = kwargs.get('cfg_folder', None) or (
+            default_cache_folder()
         )
+        self.workspace_root = kwargs.get('workspace_root', None)
+        self._workspace: Optional[Workspace] = None
+        # folder the tools run in, scripts may name workspace files relative
+        self.cwd: Optional[str] = None
         self.device = device
         self.firmware = firmware
         self.device_id = device_id
@@ -51,6 +72,48 @@ class BaseFlasher(ABC):
         self.eeprom_file = kwargs.get('eeprom_file', None)
         self.stm8f_folder = kwargs.get("folder_with_executable", "")
         self.tries_to_execute_cmd = kwargs.get("tries_to_execute_cmd", 1)
+        # parse firmware once per batch and patch only the ID records
+        self.prepared_image = kwargs.get("prepared_image", False)
+        # keep images binary with explicit addresses, no hex conversion
+        self.binary_image = kwargs.get("binary_image", False)
+        self.firmware_base = kwargs.get("firmware_base", None)
+        self.firmware_segments: list[tuple[int, str]] = []
+        # program only sectors that differ from the target
+        self.differential = kwargs.get("differential", False)
+        self.image: Optional[FirmwareImage] = None  # patched flash image
+        # [start, end) flash written by the image, None: not known
+        self.image_spans: Optional[list[tuple[int, int]]] = None
+        # (image, sector_files) of the last image split into sectors
+        self.sectors: Optional[tuple[FirmwareImage, list]] = None
+        # erase the whole chip, not only the sectors the image needs
+        self.full_erase = kwargs.get("full_erase", False)
+        # STM8: write only changed EEPROM bytes, no full read and write back
+        self.eeprom_delta = kwargs.get("eeprom_delta", False)
+        self.eeprom_writes: list[tuple[int, int, str]] = []
+        # check flashed sectors against local CRCs before lock
+        self.verify_image = kwargs.get("verify", False)
+        # kill a programmer tool after this many seconds without output
+        self.stall_timeout = kwargs.get("stall_timeout", 15.0)
+        # slowest expected programming speed, bytes/s: tools writing the
+        # whole image in one silent command get the time to write it too
+        self.min_write_rate = kwargs.get("min_write_rate", 10 * 1024)
+        self.failure_patterns = tuple(kwargs.get("failure_patterns", ()))
+        # progress events of running commands, see CommandRunner
+        self.on_command_event = kwargs.get("on_command_event", None)
+        # out of memory map image data: 'clip' or 'reject'
+        self.out_of_range = kwargs.get("out_of_range", "clip")
+        # IdAllocator: refuse used IDs, commit the ID once flashed
+        self.id_allocator = kwargs.get("id_allocator", None)
+        # interface clock in kHz, None: J-Link 1000, OpenOCD target default
+        self.speed = kwargs.get("speed", None)
+        # ClockTuner: flash at the fastest clock stable on this probe
+        self.clock_tuner = kwargs.get("clock_tuner", None)
+        # (kind, serial, processor, speed) written at, reported after run
+        self.tuned_clock: Optional[tuple[str, str, str, int]] = None
+        # FlashMetrics of the batch, stage timings of this job go there
+        self.metrics = kwargs.get("metrics", None)
+        self.job_metrics = JobMetrics()
+        self.current_stage: Optional[str] = None
         self.programmer_sn = kwargs.get(
             "programmer_sn", "",
         )  # sn -- serial number
@@ -62,19 +125,104 @@ class BaseFlasher(ABC):
             f'{os.path.join(self.stm8f_folder, "stm8flash")}'
             f' -c stlinkv2 -p'
         )
-        logging.basicConfig(
-            filemode="a+", format='%(asctime)s %(levelname)s %(message)s',
-            level=logging.INFO,
-        )
 
     @property
-    def cfg_folder(self) -> str:
-        return self._cfg_folder
+    def workspace(self) -> Workspace:
+        """Private temp folder of this job, made on first use"""
+        if self._workspace is None:
+            self._workspace = Workspace(self.workspace_root)
+        return self._workspace
+
+    def work_file(self, name: str, like: Optional[str] = None) -> Path:
+        """Path in the workspace, with the suffix of like if given"""
+        if like is not None:
+            name += Path(like).suffix
+        return Path(self.workspace.file(name))
+
+    def cleanup(self) -> None:
+        self.unpin_sectors()
+        for file in self.files_to_remove:
+            os.remove(file)
+        self.files_to_remove = set()
+        if self._workspace is not None:
+            self._workspace.cleanup()
+            self._workspace = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add monotonic time spent in the block to stage name"""
+        outer, self.current_stage = self.current_stage, name
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.job_metrics.add_time(name, time.monotonic() - start)
+            self.current_stage = outer
+
+    def timed(self, name: str, action: Callable[[], bool]) -> Callable:
+        def timed_action() -> bool:
+            with self.stage(name):
+                return action()
+        return timed_action
+
+    def add_written(self, region: str, size: int) -> None:
+        written = self.job_metrics.bytes_written
+        written[region] = written.get(region, 0) + size
+
+    def collect_metrics(self) -> None:
+        """Called after run(), flashers add what they measured on their own"""
+
+    def cached_script(self, lines: list[str], suffix: str) -> str:
+        """Return path of a cached script file with given lines"""
+        cache = ScriptCache.for_folder(
+            os.path.join(self.cfg_folder, 'scripts'),
+        )
+        return cache.get(''.join(f'{line}\n' for line in lines), suffix)
+
+    def erase_ranges(self) -> Optional[list[tuple[int, int]]]:
+        """(start, size) of the least flash to erase, None: whole chip"""
+        if self.full_erase or self.image_spans is None:
+            return None
+        return memory_map(self.device.processor).erase_plan(self.image_spans)
+
+    def sector_files(self) -> list[tuple[int, int, str, int]]:
+        """
+        (address, size, file, checksum) of patched image sectors, split
+        once per image. Files are content-addressed, only the ID sector is
+        new per device. The checksum is the one OpenOCD computes on target.
+        """
+        if self.sectors is not None and self.sectors[0] is self.image:
+            return self.sectors[1]
+        self.unpin_sectors()
+        region = memory_map(self.device.processor).regions_of((FLASH,))[0]
+        cache = self.sector_cache()
+        # pinned until the job ends, verify and flashing read them late
+        files = [
+            (
+                address, len(data), cache.get(data, '.bin', pin=True),
+                image_checksum(data),
+            )
+            for address, data in region.sector_images(self.image)
+        ]
+        self.sectors = (self.image, files)
+        return files
 
-    @cfg_folder.setter
-    def cfg_folder(self, value: str) -> None:
-        os.makedirs(value, exist_ok=True)
-        self._cfg_folder = value
+    def sector_cache(self) -> ScriptCache:
+        """Sector files of one processor, sized for its flash"""
+        region = memory_map(self.device.processor).regions_of((FLASH,))[0]
+        return ScriptCache.for_folder(
+            os.path.join(
+                self.cfg_folder, 'sectors', self.device.processor.name,
+            ),
+            4 * region.size,
+        )
+
+    def unpin_sectors(self) -> None:
+        if self.sectors is not None:
+            self.sector_cache().unpin(
+                [path for _, _, path, _ in self.sectors[1]],
+            )
+            self.sectors = None
 
     def search_apply_device_id(self) -> None:
         self.device.id_address = self.device.id_address or search_id_address(
@@ -82,22 +230,25 @@ class BaseFlasher(ABC):
         )
         self.write_id_with_intelhex()
 
-    @staticmethod
-    def create_empty_ih(filepath: str, start_adr: int, end_adr: int) -> None:
-        dict_intel_hex = {el: 0 for el in range(start_adr, end_adr)}
-        ih_empty = IntelHex(dict_intel_hex)
-        ih_empty.write_hex_file(filepath)
+    def firmware_start(self) -> int:
+        """Load address of .bin firmware, start of flash by default"""
+        if self.firmware_base is not None:
+            return self.firmware_base
+        return memory_map(self.device.processor).regions_of((FLASH,))[0].start
+
+    def load_firmware_image(self) -> FirmwareImage:
+        return FirmwareImage.from_file(self.firmware, self.firmware_start())
 
-    def prepare_ih_file(self) -> IntelHex:
-        ih = IntelHex()
+    def prepare_ih_file(self) -> FirmwareImage:
         if self.device.id_address >= 0x8000:
-            ih.fromfile(self.firmware, format='hex')
-            return ih
-        eeprom_file = os.path.join(self.cfg_folder, 'eeprom.hex')
+            return self.load_firmware_image()
+        eeprom_name = 'eeprom.bin' if self.binary_image else 'eeprom.hex'
+        eeprom_file = self.work_file(eeprom_name)
         if self.device.name in self.list_dev_full_erase_eeprom:
             # from 4096 to 6144 - eeprom stm8l151
-            self.create_empty_ih(eeprom_file, 4096, 6144)
             logging.info("Load empty eeprom")
+            self.eeprom_file = eeprom_file
+            return FirmwareImage.from_bytes(bytes(STM8L_EEPROM_SIZE), 4096)
         else:
             eeprom_read_cmd = (
                 f"{self.stm8f_cp} {self.device.processor.value}"
@@ -115,27 +266,26 @@ class BaseFlasher(ABC):
                     f"Command '{e.cmd}' returned an error"
                     f" (code {e.returncode}): {output}",
                 )
-            ih.fromfile(eeprom_file, format='hex')
 
-        self.files_to_remove.add(eeprom_file)
         self.eeprom_file = eeprom_file
-        return ih
+        return FirmwareImage.from_file(eeprom_file, STM8_EEPROM_START)
 
-    def write_id_with_intelhex(self) -> None:
-        ih = self.prepare_ih_file()
+    def id_patch(self) -> dict[int, int]:
+        """Bytes to write for this device as {address: value}"""
+        patch: dict[int, int] = {}
         id_len = len(self.device_id) // 2
         order = -1 if isinstance(self.device.processor, STM32) else 1
         for i, byte in enumerate(re.findall('..', self.device_id)[::order]):
-            ih[self.device.id_address + i] = int(byte, 16)
+            patch[self.device.id_address + i] = int(byte, 16)
         if id_len == 3:
-            ih[self.device.id_address + id_len] = 0x00
+            patch[self.device.id_address + id_len] = 0x00
         if self.device.hardware_type is not None:
-            ih[self.device.id_address + 4] = self.device.hardware_type
+            patch[self.device.id_address + 4] = self.device.hardware_type
         if self.device.subtype is not None:
             if self.device.subtype_address is not None:
-                ih[self.device.subtype_address] = self.device.subtype
+                patch[self.device.subtype_address] = self.device.subtype
             else:
-                ih[
+                patch[
                     self.device.id_address +
                     self.device.subtype_offset
                 ] = self.device.subtype
@@ -145,48 +295,209 @@ class BaseFlasher(ABC):
                     f'Color must be one of {self.device.possible_colors}',
                 )
             color = self.color
-            ih[self.device.id_address + self.device.subtype_offset + 1] = color
+            patch[
+                self.device.id_address + self.device.subtype_offset + 1
+            ] = color
+        return patch
+
+    def checked_patch(self) -> dict[int, int]:
+        patch = self.id_patch()
+        check_patch(patch, self.device.processor)
+        return patch
+
+    def write_id_with_template(self) -> None:
+        template = HexTemplate.for_file(self.firmware)
+        ranges = tuple(
+            (region.start, region.end) for region in
+            memory_map(self.device.processor).regions_of((FLASH,))
+        )
+        if dropped := template.clip(ranges):
+            if self.out_of_range == 'reject':
+                raise ImageValidationError(
+                    f'{len(dropped)} records of {self.firmware}'
+                    f' are out of {self.device.processor.value} flash',
+                )
+            logging.info(
+                f'Drop {len(dropped)} records out of'
+                f' {self.device.processor.value} flash',
+            )
+        patch = self.checked_patch()
+        self.firmware = self.work_file('firmware_to_flash', self.firmware)
+        template.write(self.firmware, patch)
+        if self.verify_image:
+            # sector checksums need the bytes, the template parses once
+            self.image = template.image(patch)
+        self.image_spans = [
+            (address, address + length)
+            for address, _, length in template.records
+        ]
+        self.add_written(
+            FLASH, sum(length for _, _, length in template.records),
+        )
+
+    def check_firmware_file(self) -> None:
+        """Pre-flight check of a firmware file flashed without ID patch"""
+        image = self.load_firmware_image()
+        checked = preflight(
+            image, self.device.processor, (FLASH,), self.out_of_range,
+        )
+        if checked is not image:
+            self.firmware = self.work_file('firmware_to_flash', self.firmware)
+            checked.write_file(self.firmware)
+        self.add_written(FLASH, len(checked))
+
+    def write_bin_segments(self, image: FirmwareImage) -> None:
+        """Write one .bin per contiguous segment, keep its load address"""
+        self.firmware_segments = []
+        for address, data in image.segments():
+            path = str(self.work_file(f'firmware_to_flash_{address:08x}.bin'))
+            with open(path, 'wb') as file:
+                file.write(data)
+            self.firmware_segments.append((address, path))
+        self.firmware = self.firmware_segments[0][1]
+
+    def write_eeprom_delta(self) -> None:
+        """Minimal EEPROM images, one (address, size, file) per byte run"""
+        image = FirmwareImage()
+        image.patch(self.checked_patch())
+        image = preflight(
+            image, self.device.processor, (EEPROM,), self.out_of_range,
+        )
+        self.eeprom_writes = []
+        for address, data in image.segments():
+            path = str(self.work_file(f'eeprom_delta_{address:04x}.bin'))
+            with open(path, 'wb') as file:
+                file.write(data)
+            self.eeprom_writes.append((address, len(data), path))
+            self.add_written(EEPROM, len(data))
+        self.eeprom_file = self.eeprom_writes[0][2]
+
+    def write_id_with_intelhex(self) -> None:
+        if (
+                self.eeprom_delta and self.device.id_address < 0x8000
+                and self.device.name not in self.list_dev_full_erase_eeprom
+        ):
+            with self.stage('write_image'):
+                self.write_eeprom_delta()
+            return
+        if (
+                self.prepared_image and not self.binary_image
+                and not self.differential
+                and self.device.id_address >= 0x8000
+        ):
+            with self.stage('write_image'):
+                self.write_id_with_template()
+            return
+        with self.stage('prepare_ih_file'):
+            image = self.prepare_ih_file()
+        with self.stage('write_image'):
+            self.write_patched_image(image)
+
+    def write_patched_image(self, image: FirmwareImage) -> None:
+        image.patch(self.checked_patch())
+        kinds = (FLASH,) if self.eeprom_file is None else (EEPROM,)
+        image = preflight(
+            image, self.device.processor, kinds, self.out_of_range,
+        )
+        self.add_written(kinds[0], len(image))
         if self.eeprom_file is None:
-            self.firmware = Path(self.firmware).with_stem('firmware_to_flash')
-            self.files_to_remove |= {self.firmware}
-            ih.write_hex_file(self.firmware)
+            self.image = image
+            self.image_spans = [
+                (start, start + len(data)) for start, data in image.segments()
+            ]
+        if self.eeprom_file is None and self.binary_image:
+            self.write_bin_segments(image)
+        elif self.eeprom_file is None:
+            self.firmware = self.work_file('firmware_to_flash', self.firmware)
+            image.write_hex(self.firmware)
         else:
-            self.eeprom_file = Path(
-                self.eeprom_file,
-            ).with_stem('eeprom_to_flash')
-            self.files_to_remove |= {self.eeprom_file}
-            ih.write_hex_file(self.eeprom_file)
+            self.eeprom_file = self.work_file(
+                'eeprom_to_flash', self.eeprom_file,
+            )
+            image.write_file(self.eeprom_file)
+
+    def command_runner(self) -> CommandRunner:
+        success_patterns = []
+        if self.device.processor == STM32.STM32_L0:
+            success_patterns.append(
+                "Info : Unable to match requested speed 300 kHz,"
+                " using 240 kHz",
+            )
+        return CommandRunner(
+            stall_timeout=self.command_stall_timeout(),
+            success_patterns=tuple(success_patterns),
+            failure_patterns=self.failure_patterns,
+            on_event=self.on_command_event,
+        )
+
+    def command_stall_timeout(self) -> float:
+        """stall_timeout, plus the write time in flash and EEPROM stages"""
+        if self.current_stage not in ('flash', 'eeprom'):
+            return self.stall_timeout
+        written = sum(self.job_metrics.bytes_written.values())
+        return self.stall_timeout + written / self.min_write_rate
 
     def execute_cmd(self, cmd: str) -> bool:
         logging.info(cmd)
+        runner = self.command_runner()
         for attempt in range(self.tries_to_execute_cmd):
-            try:
-                subprocess.check_output(
-                    shlex.split(
-                        cmd,
-                    ), stderr=subprocess.STDOUT, timeout=30,
-                )
+            result = runner.run(shlex.split(cmd), self.cwd)
+            if result.success:
                 return True
-            except subprocess.CalledProcessError as e:
-                output = e.output.decode()
-                if (
-                        self.device.processor == STM32.STM32_L0
-                        and "Info : Unable to match requested speed 300 kHz,"
-                            " using 240 kHz" in output.split("\n")[-3]
-                ):
-                    return True
-                elif attempt < self.tries_to_execute_cmd - 1:
-                    logging.error(
-                        f"Command {e.cmd!r} was unuccessful"
-                        f" (code {e.returncode}): {output}",
-                    )
-                else:
-                    raise CalledProcessError(
-                        f"Command '{e.cmd}' returned an error"
-                        f" (code {e.returncode}): {output}",
+            if attempt < self.tries_to_execute_cmd - 1:
+                self.job_metrics.add_retries(
+                    self.current_stage or 'command', 1,
+                )
+            if result.stalled:
+                if attempt == self.tries_to_execute_cmd - 1:
+                    raise subprocess.TimeoutExpired(
+                        cmd, runner.stall_timeout, result.output.encode(),
                     )
+                logging.error(
+                    f"Command {cmd!r} printed nothing for"
+                    f" {runner.stall_timeout}s and was killed",
+                )
+            elif attempt < self.tries_to_execute_cmd - 1:
+                logging.error(
+                    f"Command {cmd!r} was unuccessful"
+                    f" (code {result.returncode}): {result.output}",
+                )
+            else:
+                raise CalledProcessError(
+                    f"Command '{cmd}' returned an error"
+                    f" (code {result.returncode}): {result.output}",
+                )
         return True
 
+    def with_tuned_clock(self, kind: str, attempt: Callable[[], bool]) -> bool:
+        """
+        Run attempt at the clock speeds planned by clock_tuner, the next
+        one after each failure, and report how every speed did. A written
+        image counts for its speed only once the job is verified and
+        done, see run().
+        """
+        key = (kind, self.programmer_sn, self.device.processor.value)
+        speeds = self.clock_tuner.plan(*key)
+        for speed in speeds:
+            self.speed = speed
+            try:
+                success = attempt()
+            except (CalledProcessError, subprocess.TimeoutExpired):
+                self.clock_tuner.record(*key, speed, False)
+                if speed == speeds[-1]:
+                    raise
+                logging.error(f'Failed at {speed} kHz, trying slower')
+                self.job_metrics.add_retries(
+                    self.current_stage or 'command', 1,
+                )
+                continue
+            if success:
+                self.tuned_clock = (*key, speed)
+            else:
+                self.clock_tuner.record(*key, speed, False)
+            return success
+        return False
+
     def safe_execute(self, cmd: str, raise_error: bool = False) -> bool:
         try:
             return self.execute_cmd(cmd)
@@ -205,12 +516,35 @@ class BaseFlasher(ABC):
         raise NotImplementedError
 
     def run(self) -> bool:
+        success = False
+        checked = False  # the ID is in flight for this job
+        start = time.monotonic()
         try:
+            if self.id_allocator is not None:
+                self.id_allocator.check_unused(
+                    self.device_id, self.device.name,
+                )
+                checked = True
             self.setup_firmware_flashing()
-            return self.flash_firmware()
-        except (CalledProcessError, subprocess.TimeoutExpired) as e:
+            success = self.flash_firmware()
+            return success
+        except (
+                CalledProcessError, subprocess.TimeoutExpired,
+                ImageValidationError, DuplicateIdError,
+        ) as e:
             logging.error(f'Write failed: {e}')
             return False
         finally:
-            for file in self.files_to_remove:
-                os.remove(file)
+            if checked:
+                self.id_allocator.finish(
+                    self.device_id, success, self.device.name,
+                )
+            if self.tuned_clock is not None:
+                self.clock_tuner.record(*self.tuned_clock, bool(success))
+                self.tuned_clock = None
+            self.job_metrics.duration = time.monotonic() - start
+            self.job_metrics.success = bool(success)
+            self.collect_metrics()
+            if self.metrics is not None:
+                self.metrics.record(self.job_metrics)
+            self.cleanup()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional
+
+# interface clocks in kHz the probes really support, fastest first
+LADDERS = {
+    'JLink': (12000, 8000, 4000, 2000, 1000, 500, 250),
+    'STlink': (4000, 1800, 1200, 950, 480, 240, 125),
+}
+# speeds used before tuning, known to work on every station
+START_SPEEDS = {'JLink': 1000, 'STlink': 1800}
+# a lock file older than this was left by a crashed station
+STALE_LOCK = 10.0
+
+
+@dataclass
+class ClockState:
+    speed: int  # fastest speed known to work
+    ceiling: Optional[int] = None  # slowest speed seen failing
+    streak: int = 0  # successes at speed since the last change
+
+
+class ClockTuner:
+    """
+    Fastest stable interface clock per probe and processor.
+    Starts at START_SPEEDS, tries one step faster after promote_after
+    good jobs and never again at or above a speed that failed. A speed
+    is lowered only when the job then succeeds one step slower, so a
+    missing or broken device does not drag the clock down.
+    With path the results are kept in a JSON file shared by all runs.
+    """
+
+    def __init__(
+            self, path: Optional[str] = None, promote_after: int = 5,
+    ) -> None:
+        self.path = path
+        self.promote_after = promote_after
+        self.states: dict[str, ClockState] = {}
+        self.lock = threading.Lock()
+        if path and os.path.isfile(path):
+            self.states = self._load()
+
+    def _load(self) -> dict[str, ClockState]:
+        with open(self.path) as file:
+            return {
+                key: ClockState(**state)
+                for key, state in json.load(file).items()
+            }
+
+    @staticmethod
+    def key(kind: str, serial: str, processor: str) -> str:
+        return f'{kind}/{serial or "-"}/{processor}'
+
+    def state(self, kind: str, serial: str, processor: str) -> ClockState:
+        key = self.key(kind, serial, processor)
+        if key not in self.states:
+            self.states[key] = ClockState(START_SPEEDS[kind])
+        return self.states[key]
+
+    @staticmethod
+    def neighbours(
+            kind: str, speed: int,
+    ) -> tuple[Optional[int], Optional[int]]:
+        """(next faster, next slower) speed of the ladder"""
+        ladder = LADDERS[kind]
+        faster = [rung for rung in ladder if rung > speed]
+        slower = [rung for rung in ladder if rung < speed]
+        return (
+            min(faster) if faster else None,
+            max(slower) if slower else None,
+        )
+
+    def plan(self, kind: str, serial: str, processor: str) -> list[int]:
+        """Speeds to try in order: maybe a faster one, the tuned, a slower"""
+        with self.lock:
+            state = self.state(kind, serial, processor)
+            faster, slower = self.neighbours(kind, state.speed)
+            speeds = [state.speed]
+            if faster is not None and state.streak >= self.promote_after and (
+                    state.ceiling is None or faster < state.ceiling
+            ):
+                speeds.insert(0, faster)
+            if slower is not None:
+                speeds.append(slower)
+            return speeds
+
+    def record(
+            self,
+            kind: str,
+            serial: str,
+            processor: str,
+            speed: int,
+            success: bool,
+    ) -> None:
+        with self.lock:
+            state = self.state(kind, serial, processor)
+            changed = False
+            if success and speed == state.speed:
+                state.streak += 1
+            elif success:
+                if speed < state.speed:
+                    # tuned speed failed in this job, the slower one works
+                    state.ceiling = state.speed
+                state.speed, state.streak, changed = speed, 1, True
+            elif speed > state.speed:
+                state.ceiling = min(speed, state.ceiling or speed)
+                state.streak, changed = 0, True
+            elif speed == state.speed:
+                state.streak = 0
+            if changed or state.streak == self.promote_after:
+                self._save(self.key(kind, serial, processor), state)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Lock file next to path, works for stations on a shared folder"""
+        lock_path = f'{self.path}.lock'
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock_path).st_mtime > STALE_LOCK:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def _save(self, key: str, state: ClockState) -> None:
+        if not self.path:
+            return
+        # other stations may tune other probes in the same file
+        with self._file_lock():
+            states = self._load() if os.path.isfile(self.path) else {}
+            states[key] = state
+            tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}'
+            with open(tmp_path, 'w') as file:
+                json.dump(
+                    {key: asdict(state) for key, state in states.items()},
+                    file, indent=2, sort_keys=True,
+                )
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Pattern, Union
+
+LINE_END = re.compile(r'\r\n|\r|\n')
+# an error after a success line means the tool failed after all
+ERROR_LINE = re.compile(r'\bError:')
+
+
+@dataclass
+class CommandEvent:
+    kind: str  # 'start', 'line', 'success', 'failure', 'stall', 'exit'
+    elapsed: float
+    line: str = ''
+    stream: str = ''
+    returncode: Optional[int] = None
+
+
+@dataclass
+class CommandResult:
+    args: list[str]
+    returncode: Optional[int]
+    lines: list[str] = field(default_factory=list)
+    success_match: Optional[str] = None
+    failure_match: Optional[str] = None
+    stalled: bool = False
+
+    @property
+    def output(self) -> str:
+        return '\n'.join(self.lines)
+
+    @property
+    def success(self) -> bool:
+        if self.stalled or self.failure_match is not None:
+            return False
+        return self.returncode == 0 or self.success_match is not None
+
+
+class CommandRunner:
+    """
+    Run a programmer tool, stream its output line by line.
+    The tool is killed when it prints nothing for stall_timeout seconds
+    or as soon as a failure pattern shows up.
+    """
+
+    def __init__(
+            self,
+            stall_timeout: float = 15.0,
+            success_patterns: tuple[Union[str, Pattern], ...] = (),
+            failure_patterns: tuple[Union[str, Pattern], ...] = (),
+            on_event: Optional[Callable[[CommandEvent], None]] = None,
+    ) -> None:
+        self.stall_timeout = stall_timeout
+        self.success_patterns = [re.compile(p) for p in success_patterns]
+        self.failure_patterns = [re.compile(p) for p in failure_patterns]
+        self.on_event = on_event
+
+    def emit(self, kind: str, start: float, **kwargs) -> None:
+        if self.on_event is not None:
+            self.on_event(
+                CommandEvent(kind, time.monotonic() - start, **kwargs),
+            )
+
+    @staticmethod
+    async def pump(
+            stream: asyncio.StreamReader, name: str, queue: asyncio.Queue,
+    ) -> None:
+        while chunk := await stream.read(4096):
+            await queue.put((name, chunk))
+        await queue.put((name, b''))
+
+    def check_line(self, result: CommandResult, line: str) -> Optional[str]:
+        """Return event kind if line matches a pattern"""
+        for pattern in self.failure_patterns:
+            if pattern.search(line):
+                result.failure_match = line
+                return 'failure'
+        if result.success_match is not None and ERROR_LINE.search(line):
+            result.success_match = None
+            return None
+        for pattern in self.success_patterns:
+            if result.success_match is None and pattern.search(line):
+                result.success_match = line
+                return 'success'
+        return None
+
+    async def run_async(
+            self, args: list[str], cwd: Optional[str] = None,
+    ) -> CommandResult:
+        start = time.monotonic()
+        result = CommandResult(list(args), None)
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, cwd=cwd,
+        )
+        self.emit('start', start)
+        queue: asyncio.Queue = asyncio.Queue()
+        pumps = [
+            asyncio.ensure_future(self.pump(process.stdout, 'stdout', queue)),
+            asyncio.ensure_future(self.pump(process.stderr, 'stderr', queue)),
+        ]
+        decoders = {
+            name: codecs.getincrementaldecoder('utf-8')(errors='replace')
+            for name in ('stdout', 'stderr')
+        }
+        buffers = {'stdout': '', 'stderr': ''}
+        open_streams = 2
+        try:
+            while open_streams:
+                try:
+                    name, chunk = await asyncio.wait_for(
+                        queue.get(), self.stall_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    result.stalled = True
+                    self.emit('stall', start)
+                    break
+                final = not chunk
+                open_streams -= final
+                text = buffers[name] + decoders[name].decode(chunk, final)
+                *lines, buffers[name] = LINE_END.split(text)
+                if final and buffers[name]:
+                    lines.append(buffers[name])
+                for line in filter(None, lines):
+                    result.lines.append(line)
+                    self.emit('line', start, line=line, stream=name)
+                    if kind := self.check_line(result, line):
+                        self.emit(kind, start, line=line, stream=name)
+                if result.failure_match is not None:
+                    break
+        finally:
+            if process.returncode is None and open_streams:
+                process.kill()
+            try:
+                result.returncode = await asyncio.wait_for(
+                    process.wait(), self.stall_timeout,
+                )
+            except asyncio.TimeoutError:
+                # streams closed but the tool hangs
+                result.stalled = True
+                process.kill()
+                result.returncode = await process.wait()
+            for task in pumps:
+                task.cancel()
+            await asyncio.gather(*pumps, return_exceptions=True)
+        self.emit('exit', start, returncode=result.returncode)
+        return result
+
+    def run(
+            self, args: list[str], cwd: Optional[str] = None,
+    ) -> CommandResult:
+        return asyncio.run(self.run_async(args, cwd))
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+import os
+from functools import cached_property, lru_cache
+from typing import Any, Optional
+
+from firmware_tools.classes import (CC, STM8, STM32, DevFamily, DevFibra,
+                                    Device, DevRadio, ProcessorType)
+
+CATALOG_FILE = os.path.join(os.path.dirname(__file__), 'devices.json')
+
+PROCESSORS: dict[str, ProcessorType] = {
+    member.name: member for enum in (STM8, STM32, CC) for member in enum
+}
+FAMILIES: dict[str, DevFamily] = {
+    member.name: member for enum in (DevRadio, DevFibra) for member in enum
+}
+ADDRESS_FIELDS = ('hardware_type', 'id_address', 'subtype_address')
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def _address(value: Any) -> Any:
+    """Addresses are kept as "0x..." strings in the data file"""
+    if isinstance(value, str):
+        return int(value, 0)
+    if isinstance(value, dict):
+        return {key: _address(item) for key, item in value.items()}
+    return value
+
+
+def make_device(entry: dict[str, Any]) -> Device:
+    entry = dict(entry)
+    try:
+        processor = PROCESSORS[entry.pop('processor')]
+        family = FAMILIES[entry.pop('family')]
+        name = entry.pop('name')
+    except KeyError as e:
+        raise CatalogError(f'Bad catalog entry {entry}: {e}') from None
+    for field in ADDRESS_FIELDS:
+        if field in entry:
+            entry[field] = _address(entry[field])
+    if 'possible_colors' in entry:
+        entry['possible_colors'] = tuple(entry['possible_colors'])
+    try:
+        return Device(name, processor, family, **entry)
+    except TypeError as e:
+        raise CatalogError(f'Bad catalog entry {name}: {e}') from None
+
+
+class DeviceCatalog:
+    """
+    Device registry loaded from the data file.
+    Categories keep the file order (menu order), lookups are dict based.
+    Entries may set id_address and subtype_address, devices without them
+    take the ID address from the firmware file name. Flash and EEPROM
+    layout is per processor, see memory_map().
+    """
+
+    def __init__(self, categories: dict[str, list[Device]]) -> None:
+        self.categories = categories
+        self.by_name: dict[str, Device] = {}
+        self.by_processor: dict[ProcessorType, list[Device]] = {}
+        self.by_family: dict[DevFamily, list[Device]] = {}
+        for device in self:
+            if device.name in self.by_name:
+                raise CatalogError(f'Duplicate device {device.name}')
+            self.by_name[device.name] = device
+            self.by_processor.setdefault(device.processor, []).append(device)
+            self.by_family.setdefault(device.family, []).append(device)
+
+    @classmethod
+    def from_file(cls, path: str = CATALOG_FILE) -> DeviceCatalog:
+        with open(path) as file:
+            data = json.load(file)
+        return cls({
+            category: [make_device(entry) for entry in entries]
+            for category, entries in data.items()
+        })
+
+    def __iter__(self):
+        for devices in self.categories.values():
+            yield from devices
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def get(self, name: str) -> Optional[Device]:
+        return self.by_name.get(name)
+
+    def __getitem__(self, name: str) -> Device:
+        try:
+            return self.by_name[name]
+        except KeyError:
+            raise KeyError(f'Unknown device {name}') from None
+
+    def category(self, name: str) -> list[Device]:
+        return self.categories[name]
+
+    @cached_property
+    def devices(self) -> list[Device]:
+        """All devices, sorted by name inside every category"""
+        devices = []
+        for category in self.categories.values():
+            devices.extend(sorted(category, key=lambda item: item.name))
+        return devices
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path: str = CATALOG_FILE) -> DeviceCatalog:
+    return DeviceCatalog.from_file(path)
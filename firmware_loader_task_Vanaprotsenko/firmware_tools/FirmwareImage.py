@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Iterator, Optional
+
+from firmware_tools.HexTemplate import (DATA_RECORD, EOF_RECORD,
+                                        EXT_LINEAR_RECORD, EXT_SEGMENT_RECORD,
+                                        make_record)
+
+START_SEGMENT_RECORD = 0x03
+START_LINEAR_RECORD = 0x05
+
+
+class HexFormatError(ValueError):
+    pass
+
+
+class FirmwareImage:
+    """
+    Sparse memory image kept as sorted, non-overlapping bytearray segments.
+    Replaces IntelHex (one dict entry per byte) in the flashing hot path.
+    """
+
+    def __init__(self) -> None:
+        self.starts: list[int] = []
+        self.chunks: list[bytearray] = []
+        self.start_record: Optional[tuple[int, bytes]] = None
+
+    @classmethod
+    def blank(cls, start: int, end: int, fill: int = 0) -> FirmwareImage:
+        image = cls()
+        image.add_segment(start, bytes([fill]) * (end - start))
+        return image
+
+    @classmethod
+    def from_bytes(cls, data: bytes, base: int = 0) -> FirmwareImage:
+        image = cls()
+        image.add_segment(base, data)
+        return image
+
+    @classmethod
+    def from_bin(cls, path: str, base: int = 0) -> FirmwareImage:
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read(), base)
+
+    @classmethod
+    def from_hex(cls, path: str) -> FirmwareImage:
+        with open(path) as file:
+            return cls.from_hex_lines(file)
+
+    @classmethod
+    def from_file(cls, path: str, base: int = 0) -> FirmwareImage:
+        if str(path).endswith('.bin'):
+            return cls.from_bin(path, base)
+        return cls.from_hex(path)
+
+    @classmethod
+    def from_hex_lines(cls, lines) -> FirmwareImage:
+        image = cls()
+        base = 0
+        seg_start: Optional[int] = None
+        seg_data = bytearray()
+        for line_num, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = bytes.fromhex(line[1:])
+            except ValueError:
+                record = b''
+            if (
+                    not line.startswith(':') or len(record) < 5
+                    or len(record) != record[0] + 5 or sum(record) & 0xFF
+            ):
+                raise HexFormatError(f'Bad hex record at line {line_num}')
+            record_type = record[3]
+            data = record[4:-1]
+            if record_type == DATA_RECORD:
+                address = base + ((record[1] << 8) | record[2])
+                if seg_start is not None and (
+                        address == seg_start + len(seg_data)
+                ):
+                    seg_data += data
+                    continue
+                if seg_start is not None:
+                    image.add_segment(seg_start, seg_data)
+                seg_start, seg_data = address, bytearray(data)
+            elif record_type == EXT_SEGMENT_RECORD:
+                base = int.from_bytes(data, 'big') << 4
+            elif record_type == EXT_LINEAR_RECORD:
+                base = int.from_bytes(data, 'big') << 16
+            elif record_type in (START_SEGMENT_RECORD, START_LINEAR_RECORD):
+                image.start_record = (record_type, bytes(data))
+            elif record_type == EOF_RECORD:
+                break
+        if seg_start is not None:
+            image.add_segment(seg_start, seg_data)
+        return image
+
+    def add_segment(
+            self, address: int, data: bytes, overlap: str = 'replace',
+    ) -> None:
+        """
+        Put data at address.
+        overlap: 'replace' - new data wins, 'ignore' - old data wins,
+        'error' - raise ValueError if any byte is already set
+        """
+        if not data:
+            return
+        end = address + len(data)
+        first = bisect_right(self.starts, address) - 1
+        if first >= 0 and self.starts[first] + len(self.chunks[first]) < (
+                address
+        ):
+            first += 1
+        first = max(first, 0)
+        last = bisect_right(self.starts, end)  # segments touching the new one
+        touched = range(first, last)
+        if overlap != 'replace':
+            for i in touched:
+                lo = max(address, self.starts[i])
+                hi = min(end, self.starts[i] + len(self.chunks[i]))
+                if lo < hi and overlap == 'error':
+                    raise ValueError(f'Data overlap at address {hex(lo)}')
+        if not touched:
+            self.starts.insert(first, address)
+            self.chunks.insert(first, bytearray(data))
+            return
+
+        new_start = min(address, self.starts[first])
+        new_end = max(end, self.starts[last - 1] + len(self.chunks[last - 1]))
+        merged = bytearray(new_end - new_start)
+        if overlap == 'ignore':
+            merged[address - new_start:end - new_start] = data
+        for i in touched:
+            offset = self.starts[i] - new_start
+            merged[offset:offset + len(self.chunks[i])] = self.chunks[i]
+        if overlap != 'ignore':
+            merged[address - new_start:end - new_start] = data
+        self.starts[first:last] = [new_start]
+        self.chunks[first:last] = [merged]
+
+    def merge(self, other: FirmwareImage, overlap: str = 'error') -> None:
+        for address, data in other.segments():
+            self.add_segment(address, data, overlap)
+        if other.start_record is not None and (
+                overlap == 'replace' or self.start_record is None
+        ):
+            self.start_record = other.start_record
+
+    def segments(self) -> Iterator[tuple[int, memoryview]]:
+        for start, chunk in zip(self.starts, self.chunks):
+            yield start, memoryview(chunk)
+
+    def locate(self, address: int) -> Optional[int]:
+        index = bisect_right(self.starts, address) - 1
+        if index >= 0 and address < self.starts[index] + len(
+                self.chunks[index],
+        ):
+            return index
+        return None
+
+    def __getitem__(self, address: int) -> int:
+        index = self.locate(address)
+        if index is None:
+            raise KeyError(hex(address))
+        return self.chunks[index][address - self.starts[index]]
+
+    def __setitem__(self, address: int, value: int) -> None:
+        index = self.locate(address)
+        if index is None:
+            self.add_segment(address, bytes([value]))
+        else:
+            self.chunks[index][address - self.starts[index]] = value
+
+    def __contains__(self, address: int) -> bool:
+        return self.locate(address) is not None
+
+    def __len__(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def patch(self, patch: dict[int, int]) -> None:
+        for address, value in patch.items():
+            self[address] = value
+
+    def min_address(self) -> Optional[int]:
+        return self.starts[0] if self.starts else None
+
+    def max_address(self) -> Optional[int]:
+        if not self.starts:
+            return None
+        return self.starts[-1] + len(self.chunks[-1]) - 1
+
+    def todict(self) -> dict[int, int]:
+        return {
+            start + i: byte
+            for start, chunk in zip(self.starts, self.chunks)
+            for i, byte in enumerate(chunk)
+        }
+
+    def tobinarray(self, fill: int = 0xFF) -> bytearray:
+        """Contiguous bytes from min_address to max_address"""
+        if not self.starts:
+            return bytearray()
+        start = self.starts[0]
+        data = bytearray([fill]) * (self.max_address() - start + 1)
+        for address, chunk in zip(self.starts, self.chunks):
+            data[address - start:address - start + len(chunk)] = chunk
+        return data
+
+    def hex_lines(self, record_size: int = 16) -> Iterator[str]:
+        if self.start_record is not None:
+            yield make_record(self.start_record[0], 0, self.start_record[1])
+        upper = 0
+        for start, chunk in zip(self.starts, self.chunks):
+            address, view = start, memoryview(chunk)
+            while view:
+                if address >> 16 != upper:
+                    upper = address >> 16
+                    yield make_record(
+                        EXT_LINEAR_RECORD, 0, upper.to_bytes(2, 'big'),
+                    )
+                # records never cross a 64 KiB boundary
+                size = min(
+                    record_size, 0x10000 - (address & 0xFFFF), len(view),
+                )
+                yield make_record(
+                    DATA_RECORD, address & 0xFFFF, view[:size].tobytes(),
+                )
+                address += size
+                view = view[size:]
+        yield make_record(EOF_RECORD, 0, b'')
+
+    def write_hex(self, path: str) -> str:
+        with open(path, 'w') as file:
+            file.write('\n'.join(self.hex_lines()))
+            file.write('\n')
+        return str(path)
+
+    def write_bin(self, path: str, fill: int = 0xFF) -> str:
+        with open(path, 'wb') as file:
+            file.write(self.tobinarray(fill))
+        return str(path)
+
+    def write_file(self, path: str) -> str:
+        if str(path).endswith('.bin'):
+            return self.write_bin(path)
+        return self.write_hex(path)
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional
+
+from firmware_tools.utils import file_hash, search_id_address
+
+# [device][version][region][subtype][id_type].hex, see Loader.get_firmware
+NAME_PATTERN = re.compile(
+    r'\[(?P<device>[^\]]+)\]\[(?P<version>[^\]]+)\]\[(?P<region>[^\]]+)\]'
+    r'\[(?P<subtype>\d+)\]\[(?P<id_type>[^\]]+)\]\.(?:hex|bin)$',
+)
+INDEX_VERSION = 1
+
+# device, region, subtype, id_type, None matches any subtype or id_type
+Key = tuple[str, str, Optional[int], Optional[str]]
+
+
+def version_key(version: str) -> tuple[tuple[int, int, str], ...]:
+    """
+    5.5.55.5 > 5.5.9.5, numbers compare as numbers,
+    2.0 > 2.0rc1 as a text part sorts before the end of the version
+    """
+    return tuple(
+        (1, int(part), '') if part.isdigit() else (0, 0, part)
+        for part in re.findall(r'\d+|[^\d.]+', version)
+    ) + ((0, 1, ''),)
+
+
+@dataclass(frozen=True)
+class FirmwareName:
+    device: str
+    version: str
+    region: str
+    subtype: int
+    id_type: str
+    id_address: Optional[int] = None  # 0x... anywhere in the path
+
+    @classmethod
+    def parse(cls, path: str) -> Optional[FirmwareName]:
+        match = NAME_PATTERN.fullmatch(os.path.basename(path))
+        if match is None:
+            return None
+        try:
+            id_address = search_id_address(path)
+        except ValueError:
+            id_address = None
+        return cls(
+            match['device'], match['version'], match['region'],
+            int(match['subtype']), match['id_type'], id_address,
+        )
+
+
+@dataclass(frozen=True)
+class FirmwareEntry:
+    path: str
+    name: FirmwareName
+    size: int
+    mtime_ns: int
+    sha256: str
+
+    @property
+    def version_key(self) -> tuple[tuple[int, int, str], ...]:
+        return version_key(self.name.version)
+
+    def keys(self) -> list[Key]:
+        name = self.name
+        return [
+            (name.device, name.region, subtype, id_type)
+            for subtype in (name.subtype, None)
+            for id_type in (name.id_type, None)
+        ]
+
+
+@dataclass
+class ScanStats:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+
+class FirmwareLibrary:
+    """
+    Index of the firmware files under root, names are parsed and files
+    hashed once. scan() only re-reads files whose size or mtime changed,
+    latest() answers from a dict kept up to date on every change.
+    With index_file the index survives restarts of the station tool.
+    """
+
+    def __init__(
+            self, root: str, index_file: Optional[str] = None,
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.index_file = index_file
+        self.entries: dict[str, FirmwareEntry] = {}
+        self.groups: dict[Key, list[FirmwareEntry]] = {}
+        self.newest: dict[Key, FirmwareEntry] = {}
+        self.lock = threading.Lock()
+        if index_file and os.path.isfile(index_file):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[FirmwareEntry]:
+        return iter(self.entries.values())
+
+    def _add(self, entry: FirmwareEntry) -> None:
+        self.entries[entry.path] = entry
+        for key in entry.keys():
+            self.groups.setdefault(key, []).append(entry)
+            newest = self.newest.get(key)
+            if newest is None or entry.version_key > newest.version_key:
+                self.newest[key] = entry
+
+    def _remove(self, path: str) -> None:
+        entry = self.entries.pop(path)
+        for key in entry.keys():
+            group = self.groups[key]
+            group.remove(entry)
+            if not group:
+                del self.groups[key]
+                del self.newest[key]
+            elif self.newest[key] is entry:
+                self.newest[key] = max(
+                    group, key=lambda item: item.version_key,
+                )
+
+    def _files(self) -> Iterator[tuple[str, os.stat_result]]:
+        folders = [self.root]
+        while folders:
+            with os.scandir(folders.pop()) as items:
+                for item in items:
+                    if item.is_dir(follow_symlinks=False):
+                        folders.append(item.path)
+                    elif item.name.endswith(('.hex', '.bin')):
+                        yield item.path, item.stat()
+
+    def scan(self) -> ScanStats:
+        """Bring the index in line with the files on disk"""
+        stats = ScanStats()
+        with self.lock:
+            seen = set()
+            for path, stat in self._files():
+                seen.add(path)
+                entry = self.entries.get(path)
+                if entry is not None and (entry.size, entry.mtime_ns) == (
+                        stat.st_size, stat.st_mtime_ns,
+                ):
+                    stats.unchanged += 1
+                    continue
+                name = FirmwareName.parse(path)
+                if name is None:
+                    continue  # MERGED.hex, bootloaders and other files
+                if entry is not None:
+                    self._remove(path)
+                    stats.updated += 1
+                else:
+                    stats.added += 1
+                self._add(FirmwareEntry(
+                    path, name, stat.st_size, stat.st_mtime_ns,
+                    file_hash(path),
+                ))
+            for path in set(self.entries) - seen:
+                self._remove(path)
+                stats.removed += 1
+        if self.index_file and (stats.added or stats.updated or stats.removed):
+            self.save()
+        return stats
+
+    def get(self, path: str) -> Optional[FirmwareEntry]:
+        return self.entries.get(os.path.abspath(path))
+
+    def latest(
+            self,
+            device: str,
+            region: str,
+            subtype: Optional[int] = None,
+            id_type: Optional[str] = None,
+    ) -> Optional[FirmwareEntry]:
+        return self.newest.get((device, region, subtype, id_type))
+
+    def find(
+            self,
+            device: str,
+            region: str,
+            version: Optional[str] = None,
+            subtype: Optional[int] = None,
+            id_type: Optional[str] = None,
+    ) -> Optional[FirmwareEntry]:
+        """Given version or the latest one"""
+        if version is None:
+            return self.latest(device, region, subtype, id_type)
+        for entry in self.groups.get((device, region, subtype, id_type), ()):
+            if entry.name.version == version:
+                return entry
+        return None
+
+    def save(self) -> str:
+        with self.lock:
+            data = {
+                'version': INDEX_VERSION,
+                'root': self.root,
+                'entries': [
+                    {
+                        'path': os.path.relpath(entry.path, self.root),
+                        'name': asdict(entry.name),
+                        'size': entry.size,
+                        'mtime_ns': entry.mtime_ns,
+                        'sha256': entry.sha256,
+                    }
+                    for entry in self.entries.values()
+                ],
+            }
+        # readers of a shared index must never see a half written file
+        tmp_path = f'{self.index_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.index_file)
+        return self.index_file
+
+    def load(self) -> None:
+        """Entries of index_file, scan() checks them against the disk"""
+        with open(self.index_file) as file:
+            try:
+                data = json.load(file)
+            except json.JSONDecodeError:
+                return  # damaged, rebuilt by the next scan
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            return  # rebuilt by the next scan
+        with self.lock:
+            for item in data['entries']:
+                self._add(FirmwareEntry(
+                    os.path.join(self.root, item['path']),
+                    FirmwareName(**item['name']),
+                    item['size'], item['mtime_ns'], item['sha256'],
+                ))
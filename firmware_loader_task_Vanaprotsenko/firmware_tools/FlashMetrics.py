@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Any
+
+# seconds, a flash job stage takes from milliseconds to a couple of minutes
+DEFAULT_BUCKETS = (
+    0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.samples: list[float] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """(le, count) pairs as Prometheus expects them"""
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            pairs.append((le, total))
+        return pairs
+
+    def summary(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'total': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'max': round(max(self.samples, default=0.0), 6),
+        }
+
+
+@dataclass
+class JobMetrics:
+    """Measurements of one flash job, filled in by the flasher"""
+    stages: dict[str, float] = field(default_factory=dict)  # name -> seconds
+    retries: dict[str, int] = field(default_factory=dict)
+    bytes_written: dict[str, int] = field(default_factory=dict)  # by region
+    duration: float = 0.0
+    success: bool = False
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_retries(self, stage: str, retries: int) -> None:
+        if retries:
+            self.retries[stage] = self.retries.get(stage, 0) + retries
+
+
+class FlashMetrics:
+    """
+    Stage histograms and counters of a batch, shared by all its jobs.
+    Written as a Prometheus textfile (node_exporter textfile collector)
+    and as a JSON summary.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.stages: dict[str, Histogram] = {}
+        self.jobs = Histogram(buckets)
+        self.retries: dict[str, int] = {}
+        self.bytes_written: dict[str, int] = {}
+        self.results = {'success': 0, 'failure': 0}
+        self.wall_time = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, job: JobMetrics) -> None:
+        with self.lock:
+            for stage, seconds in job.stages.items():
+                if stage not in self.stages:
+                    self.stages[stage] = Histogram(self.buckets)
+                self.stages[stage].observe(seconds)
+            for stage, retries in job.retries.items():
+                self.retries[stage] = self.retries.get(stage, 0) + retries
+            # bytes of failed jobs are not on any device
+            written = job.bytes_written if job.success else {}
+            for region, size in written.items():
+                self.bytes_written[region] = (
+                    self.bytes_written.get(region, 0) + size
+                )
+            self.jobs.observe(job.duration)
+            self.results['success' if job.success else 'failure'] += 1
+
+    def bottleneck(self) -> str:
+        """Stage with the largest total time"""
+        return max(
+            self.stages, key=lambda stage: self.stages[stage].sum, default='',
+        )
+
+    def prometheus_lines(self) -> list[str]:
+        lines = [
+            '# HELP flash_stage_seconds Time spent in a flash job stage.',
+            '# TYPE flash_stage_seconds histogram',
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            lines += self._histogram_lines(
+                'flash_stage_seconds', histogram, f'stage="{stage}",',
+            )
+        lines += [
+            '# HELP flash_job_seconds Duration of a whole flash job.',
+            '# TYPE flash_job_seconds histogram',
+        ]
+        lines += self._histogram_lines('flash_job_seconds', self.jobs, '')
+        lines += [
+            '# HELP flash_jobs_total Flash jobs by result.',
+            '# TYPE flash_jobs_total counter',
+        ]
+        lines += [
+            f'flash_jobs_total{{result="{result}"}} {count}'
+            for result, count in self.results.items()
+        ]
+        lines += [
+            '# HELP flash_retries_total Retried attempts by stage.',
+            '# TYPE flash_retries_total counter',
+        ]
+        lines += [
+            f'flash_retries_total{{stage="{stage}"}} {count}'
+            for stage, count in sorted(self.retries.items())
+        ]
+        lines += [
+            '# HELP flash_bytes_written_total Bytes programmed by region.',
+            '# TYPE flash_bytes_written_total counter',
+        ]
+        lines += [
+            f'flash_bytes_written_total{{region="{region}"}} {size}'
+            for region, size in sorted(self.bytes_written.items())
+        ]
+        return lines
+
+    @staticmethod
+    def _histogram_lines(
+            name: str, histogram: Histogram, labels: str,
+    ) -> list[str]:
+        lines = [
+            f'{name}_bucket{{{labels}le="{le}"}} {count}'
+            for le, count in histogram.cumulative()
+        ]
+        label_set = f'{{{labels.rstrip(",")}}}' if labels else ''
+        lines += [
+            f'{name}_sum{label_set} {histogram.sum:.6f}',
+            f'{name}_count{label_set} {histogram.count}',
+        ]
+        return lines
+
+    def summary(self) -> dict[str, Any]:
+        with self.lock:
+            jobs = sum(self.results.values())
+            return {
+                'jobs': jobs,
+                'succeeded': self.results['success'],
+                'failed': self.results['failure'],
+                'wall_time': round(self.wall_time, 6),
+                'devices_per_minute': round(
+                    self.results['success'] * 60 / self.wall_time, 3,
+                ) if self.wall_time else 0.0,
+                'job_seconds': self.jobs.summary(),
+                'stages': {
+                    stage: histogram.summary()
+                    for stage, histogram in self.stages.items()
+                },
+                'bottleneck': self.bottleneck(),
+                'retries': dict(self.retries),
+                'bytes_written': dict(self.bytes_written),
+            }
+
+    @staticmethod
+    def _write(path: str, text: str) -> str:
+        # textfile collectors must never read a half written file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+        return path
+
+    def write_prometheus(self, path: str) -> str:
+        with self.lock:
+            text = '\n'.join(self.prometheus_lines()) + '\n'
+        return self._write(path, text)
+
+    def write_json(self, path: str) -> str:
+        return self._write(path, json.dumps(self.summary(), indent=2) + '\n')
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Optional
+
+
+class StepState(Enum):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+@dataclass
+class Step:
+    name: str
+    action: Callable[[], bool]
+    retries: Optional[int] = None  # pipeline default if None
+
+
+@dataclass
+class StepRecord:
+    name: str
+    state: StepState = StepState.PENDING
+    attempts: int = 0
+    duration: float = 0.0
+    error: Optional[str] = None
+
+
+class FlashPipeline:
+    """
+    Ordered flashing steps with recorded state.
+    A failed step, raising or returning False, is retried on its own
+    with exponential backoff, run() after a failure resumes from that
+    step, finished steps are never repeated.
+    """
+
+    def __init__(
+            self,
+            steps: list[Step],
+            retries: int = 0,
+            backoff: float = 0.5,
+            backoff_factor: float = 2.0,
+            retry_on: tuple[type[BaseException], ...] = (Exception,),
+            sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.steps = steps
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.retry_on = retry_on
+        self.sleep = sleep
+        self.records = {step.name: StepRecord(step.name) for step in steps}
+
+    @property
+    def done(self) -> bool:
+        return all(
+            record.state == StepState.DONE for record in self.records.values()
+        )
+
+    @property
+    def failed_step(self) -> Optional[str]:
+        for record in self.records.values():
+            if record.state == StepState.FAILED:
+                return record.name
+        return None
+
+    def reset(self, from_step: Optional[str] = None) -> None:
+        """Mark from_step (all steps if None) and the following as pending"""
+        pending = from_step is None
+        for step in self.steps:
+            pending = pending or step.name == from_step
+            if pending:
+                self.records[step.name] = StepRecord(step.name)
+
+    def run_step(self, step: Step) -> bool:
+        record = self.records[step.name]
+        retries = self.retries if step.retries is None else step.retries
+        delay = self.backoff
+        for attempt in range(retries + 1):
+            record.attempts += 1
+            start = time.monotonic()
+            try:
+                result = step.action()
+            except self.retry_on as e:
+                record.duration += time.monotonic() - start
+                record.error = str(e)
+                if attempt == retries:
+                    record.state = StepState.FAILED
+                    raise
+            else:
+                record.duration += time.monotonic() - start
+                if result:
+                    record.state = StepState.DONE
+                    record.error = None
+                    return True
+                record.error = 'step returned False'
+                if attempt == retries:
+                    record.state = StepState.FAILED
+                    return False
+            logging.error(
+                f'Step {step.name} failed, retry in {delay:.1f}s:'
+                f' {record.error}',
+            )
+            self.sleep(delay)
+            delay *= self.backoff_factor
+        return False
+
+    def run(self) -> bool:
+        for step in self.steps:
+            if self.records[step.name].state == StepState.DONE:
+                continue
+            if not self.run_step(step):
+                return False
+        return True
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import os
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from firmware_tools.FirmwareImage import FirmwareImage
+
+DATA_RECORD = 0x00
+EOF_RECORD = 0x01
+EXT_SEGMENT_RECORD = 0x02
+EXT_LINEAR_RECORD = 0x04
+
+
+def make_record(record_type: int, offset: int, data: bytes) -> str:
+    record = bytes(
+        [len(data), (offset >> 8) & 0xFF, offset & 0xFF, record_type],
+    ) + bytes(data)
+    checksum = (-sum(record)) & 0xFF
+    return f':{record.hex().upper()}{checksum:02X}'
+
+
+class HexTemplate:
+    """
+    Intel HEX file parsed once, patched per device.
+    Only the records holding patched bytes are decoded and re-encoded,
+    the rest of the file is emitted as is.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        with open(self.path) as file:
+            self.source_lines = file.read().splitlines()
+        self.lines = self.source_lines
+        # ranges the records were last checked against and what they
+        # dropped, see clip()
+        self.checked_ranges: Optional[tuple[tuple[int, int], ...]] = None
+        self.dropped: list[tuple[int, int]] = []
+        # (lines, parsed image) for image(), parsed once per clipped lines
+        self.parsed: Optional[tuple[list[str], FirmwareImage]] = None
+        self.lock = threading.Lock()
+        self.index()
+
+    def index(self) -> None:
+        self.eof_line: Optional[int] = None
+        records: list[tuple[int, int, int]] = []  # (address, line, length)
+        base = 0
+        for line_num, line in enumerate(self.lines):
+            line = line.strip()
+            if not line.startswith(':'):
+                continue
+            length = int(line[1:3], 16)
+            offset = int(line[3:7], 16)
+            record_type = int(line[7:9], 16)
+            if record_type == DATA_RECORD:
+                records.append((base + offset, line_num, length))
+            elif record_type == EXT_SEGMENT_RECORD:
+                base = int(line[9:13], 16) << 4
+            elif record_type == EXT_LINEAR_RECORD:
+                base = int(line[9:13], 16) << 16
+            elif record_type == EOF_RECORD:
+                self.eof_line = line_num
+                break
+        records.sort()
+        self.record_starts = [address for address, _, _ in records]
+        self.records = records
+
+    @classmethod
+    @lru_cache(maxsize=16)
+    def _cached(cls, path: str, mtime_ns: int, size: int) -> HexTemplate:
+        return cls(path)
+
+    @classmethod
+    def for_file(cls, path: str) -> HexTemplate:
+        """Return a template shared by every job using the same file"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return cls._cached(path, stat.st_mtime_ns, stat.st_size)
+
+    def locate(self, address: int) -> Optional[tuple[int, int]]:
+        """Return (line number, byte offset) of address or None"""
+        index = bisect_right(self.record_starts, address) - 1
+        if index < 0:
+            return None
+        start, line_num, length = self.records[index]
+        if address >= start + length:
+            return None
+        return line_num, address - start
+
+    def clip(
+            self, ranges: tuple[tuple[int, int], ...],
+    ) -> list[tuple[int, int]]:
+        """
+        Drop data records not fully inside one of [start, end) ranges.
+        Done once per ranges, every call returns dropped (address, length)
+        so each job applies its own out of range policy.
+        """
+        with self.lock:
+            if self.checked_ranges == ranges:
+                return list(self.dropped)
+            if self.lines is not self.source_lines:
+                self.lines = self.source_lines
+                self.index()
+            dropped_lines = {}
+            for address, line_num, length in self.records:
+                if not any(
+                        start <= address and address + length <= end
+                        for start, end in ranges
+                ):
+                    dropped_lines[line_num] = (address, length)
+            if dropped_lines:
+                self.lines = [
+                    line for line_num, line in enumerate(self.lines)
+                    if line_num not in dropped_lines
+                ]
+                self.index()
+            self.checked_ranges = ranges
+            self.dropped = sorted(dropped_lines.values())
+            return list(self.dropped)
+
+    def render(self, patch: dict[int, int]) -> list[str]:
+        lines = list(self.lines)
+        patched_records: dict[int, bytearray] = {}
+        extra: dict[int, int] = {}
+        for address, value in patch.items():
+            location = self.locate(address)
+            if location is None:
+                extra[address] = value
+                continue
+            line_num, byte_offset = location
+            if line_num not in patched_records:
+                line = lines[line_num].strip()
+                patched_records[line_num] = bytearray.fromhex(line[1:-2])
+            # skip length, offset and type bytes
+            patched_records[line_num][4 + byte_offset] = value
+
+        for line_num, record in patched_records.items():
+            lines[line_num] = make_record(
+                record[3], (record[1] << 8) | record[2], record[4:],
+            )
+
+        if extra:
+            new_records = []
+            for address in sorted(extra):
+                new_records.append(
+                    make_record(
+                        EXT_LINEAR_RECORD, 0,
+                        (address >> 16).to_bytes(2, 'big'),
+                    ),
+                )
+                new_records.append(
+                    make_record(
+                        DATA_RECORD, address & 0xFFFF, bytes([extra[address]]),
+                    ),
+                )
+            eof = len(lines) if self.eof_line is None else self.eof_line
+            lines[eof:eof] = new_records
+        if self.eof_line is None:
+            lines.append(make_record(EOF_RECORD, 0, b''))
+        return lines
+
+    def image(self, patch: dict[int, int]) -> FirmwareImage:
+        """Patched FirmwareImage of the records, for sector checksums"""
+        # FirmwareImage imports the record helpers of this module
+        from firmware_tools.FirmwareImage import FirmwareImage
+
+        with self.lock:
+            if self.parsed is None or self.parsed[0] is not self.lines:
+                self.parsed = (
+                    self.lines, FirmwareImage.from_hex_lines(self.lines),
+                )
+            parsed = self.parsed[1]
+        image = FirmwareImage()
+        image.start_record = parsed.start_record
+        for start, data in parsed.segments():
+            image.add_segment(start, bytes(data))
+        image.patch(patch)
+        return image
+
+    def write(self, path: str, patch: dict[int, int]) -> str:
+        with open(path, 'w') as file:
+            file.write('\n'.join(self.render(patch)))
+            file.write('\n')
+        return str(path)
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+RESERVED = 'reserved'
+IN_FLIGHT = 'in_flight'  # checked by a running job, not flashed yet
+COMMITTED = 'committed'
+FREE = 'free'
+
+# hex ID as flashed, 00AA11 and 0000AA11 are different IDs
+IDS_TABLE = """
+CREATE TABLE IF NOT EXISTS ids (
+    id TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    station TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL
+)"""
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS pools (
+    device TEXT PRIMARY KEY,
+    next INTEGER NOT NULL,
+    last INTEGER NOT NULL,
+    id_len INTEGER NOT NULL
+);
+{IDS_TABLE};
+CREATE INDEX IF NOT EXISTS ids_state ON ids (device, state, station);
+"""
+
+
+class DuplicateIdError(RuntimeError):
+    pass
+
+
+class IdPoolExhausted(RuntimeError):
+    pass
+
+
+class IdAllocator:
+    """
+    Device IDs from a shared SQLite (WAL) database.
+    Every station reserves IDs in blocks, hands them out from memory and
+    marks an ID committed only after the device is flashed. IDs reserved
+    by a crashed run are picked up again when the station starts, so run
+    one allocator per station name. From check_unused() until finish()
+    an ID is in flight and refused to any other job.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            station: Optional[str] = None,
+            block_size: int = 32,
+            timeout: float = 30.0,
+    ) -> None:
+        self.path = path
+        self.station = station or socket.gethostname()
+        self.block_size = block_size
+        self.blocks: dict[str, deque[str]] = {}
+        # in flight ID -> its state before the check, None: no row
+        self.in_flight: dict[str, Optional[str]] = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None,
+            check_same_thread=False,
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.migrate()
+        self.connection.executescript(SCHEMA)
+        self.recover()
+
+    def migrate(self) -> None:
+        """Re-key tables of int(device_id, 16) by the hex ID string"""
+        db = self.connection
+        columns = db.execute('PRAGMA table_info(ids)').fetchall()
+        if not columns or columns[0][2] != 'INTEGER':
+            return
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            widths = dict(db.execute('SELECT device, id_len FROM pools'))
+            rows = db.execute(
+                'SELECT id, device, station, state, updated FROM ids',
+            ).fetchall()
+            db.execute('DROP TABLE ids')
+            db.execute(IDS_TABLE)
+            db.executemany(
+                'INSERT INTO ids VALUES (?, ?, ?, ?, ?)',
+                [
+                    (f'{value:0{2 * widths.get(device, 4)}X}', device,
+                     station, state, updated)
+                    for value, device, station, state, updated in rows
+                ],
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def recover(self) -> None:
+        for device_id, device in self.connection.execute(
+                'SELECT id, device FROM ids WHERE state = ? AND station = ?'
+                ' ORDER BY id',
+                (RESERVED, self.station),
+        ):
+            self.blocks.setdefault(device, deque()).append(device_id)
+        for (device_id,) in self.connection.execute(
+                'SELECT id FROM ids WHERE state = ? AND station = ?',
+                (IN_FLIGHT, self.station),
+        ):
+            # the device may or may not have been flashed, never reused
+            logging.warning(
+                f'Device ID {device_id} was being flashed when'
+                f' {self.station} stopped, check the device and commit'
+                f' or release it',
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> IdAllocator:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add_range(
+            self, device: str, first: int, last: int, id_len: int = 4,
+    ) -> None:
+        """Hand out first..last (inclusive) for device, keeps used IDs"""
+        if id_len not in (3, 4) or not 0 <= first <= last < 1 << 8 * id_len:
+            raise ValueError(
+                f'Bad {id_len} byte ID range {hex(first)}-{hex(last)}',
+            )
+        with self.lock:
+            self.connection.execute(
+                'INSERT INTO pools (device, next, last, id_len)'
+                ' VALUES (?, ?, ?, ?) ON CONFLICT (device) DO UPDATE SET'
+                ' next = max(next, excluded.next), last = excluded.last,'
+                ' id_len = excluded.id_len',
+                (device, first, last, id_len),
+            )
+
+    def reserve_block(self, device: str) -> deque[int]:
+        """Take released and then new IDs in one transaction"""
+        db = self.connection
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            block = [
+                row[0] for row in db.execute(
+                    'SELECT id FROM ids WHERE device = ? AND state = ?'
+                    ' ORDER BY id LIMIT ?',
+                    (device, FREE, self.block_size),
+                )
+            ]
+            pool = db.execute(
+                'SELECT next, last, id_len FROM pools WHERE device = ?',
+                (device,),
+            ).fetchone()
+            if pool is None:
+                raise IdPoolExhausted(f'No ID range for {device}')
+            next_id, last, id_len = pool
+            while len(block) < self.block_size and next_id <= last:
+                device_id = f'{next_id:0{2 * id_len}X}'
+                # IDs entered by hand are already in the table
+                if db.execute(
+                        'SELECT 1 FROM ids WHERE id = ?', (device_id,),
+                ).fetchone() is None:
+                    block.append(device_id)
+                next_id += 1
+            db.execute(
+                'UPDATE pools SET next = ? WHERE device = ?',
+                (next_id, device),
+            )
+            db.executemany(
+                'INSERT INTO ids (id, device, station, state, updated)'
+                ' VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET'
+                ' station = excluded.station, state = excluded.state,'
+                ' updated = excluded.updated',
+                [(i, device, self.station, RESERVED, now) for i in block],
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        if not block:
+            raise IdPoolExhausted(f'No free IDs left for {device}')
+        return deque(sorted(block))
+
+    def allocate(self, device: str) -> str:
+        with self.lock:
+            block = self.blocks.get(device)
+            if not block:
+                block = self.blocks[device] = self.reserve_block(device)
+            return block.popleft()
+
+    def state(self, device_id: str) -> Optional[tuple[str, str]]:
+        """(state, station) of device_id or None if never used"""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT state, station FROM ids WHERE id = ?',
+                (device_id.upper(),),
+            ).fetchone()
+
+    def check_unused(self, device_id: str, device: str = '') -> None:
+        """Mark device_id in flight, DuplicateIdError if it is taken"""
+        device_id = device_id.upper()
+        db = self.connection
+        with self.lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                state = db.execute(
+                    'SELECT state, station FROM ids WHERE id = ?',
+                    (device_id,),
+                ).fetchone()
+                if not (state is None or state[0] == FREE or state == (
+                        RESERVED, self.station,
+                )):
+                    raise DuplicateIdError(
+                        f'Device ID {device_id} is already {state[0]}'
+                        f' by {state[1]}',
+                    )
+                self.upsert(device_id, device, IN_FLIGHT)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            self.in_flight[device_id] = None if state is None else state[0]
+
+    def upsert(self, device_id: str, device: str, state: str) -> None:
+        self.connection.execute(
+            'INSERT INTO ids (id, device, station, state, updated)'
+            ' VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET'
+            ' station = excluded.station, state = excluded.state,'
+            ' updated = excluded.updated,'
+            " device = coalesce(nullif(excluded.device, ''), device)",
+            (device_id, device, self.station, state, time.time()),
+        )
+
+    def commit(self, device_id: str, device: str = '') -> None:
+        device_id = device_id.upper()
+        with self.lock:
+            self.in_flight.pop(device_id, None)
+            self.upsert(device_id, device, COMMITTED)
+
+    def release(self, device_id: str) -> None:
+        """Return a reserved or in flight, never committed ID"""
+        device_id = device_id.upper()
+        with self.lock:
+            previous = self.in_flight.pop(device_id, RESERVED)
+            if previous is None:
+                # typed by hand and failed, as if never used
+                self.connection.execute(
+                    'DELETE FROM ids WHERE id = ? AND state = ?'
+                    ' AND station = ?',
+                    (device_id, IN_FLIGHT, self.station),
+                )
+                return
+            self.connection.execute(
+                'UPDATE ids SET state = ?, updated = ?'
+                ' WHERE id = ? AND state IN (?, ?) AND station = ?',
+                (FREE, time.time(), device_id, RESERVED, IN_FLIGHT,
+                 self.station),
+            )
+
+    def finish(self, device_id: str, success: bool, device: str = '') -> None:
+        if success:
+            self.commit(device_id, device)
+        else:
+            self.release(device_id)
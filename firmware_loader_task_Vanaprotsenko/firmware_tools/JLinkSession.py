@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import re
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from firmware_tools.BaseFlasher import CalledProcessError
+
+# J-Link Commander reports failures in its output, not in an exit code
+ERROR_PATTERN = re.compile(
+    r'\berror\b|cannot connect|could not|failed|unknown command',
+    re.IGNORECASE,
+)
+
+
+class JLinkSession:
+    """
+    Long-lived J-Link Commander fed over stdin.
+    DLL load, USB enumeration, interface and device selection happen once
+    per session, every command batch ends at the next J-Link> prompt.
+    """
+    prompt = 'J-Link>'
+
+    _sessions: dict[str, JLinkSession] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(
+            self,
+            setup: list[str],
+            programmer_sn: str = '',
+            executable: str = 'JLinkExe',
+            startup_timeout: float = 10.0,
+            command_timeout: float = 120.0,
+    ) -> None:
+        self.setup = list(setup)
+        self.programmer_sn = programmer_sn
+        self.executable = executable
+        self.startup_timeout = startup_timeout
+        self.command_timeout = command_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self.output: queue.Queue[str] = queue.Queue()
+        self.lock = threading.Lock()
+
+    def command_line(self) -> list[str]:
+        cmd = [self.executable, '-NoGui', '1', '-ExitOnError', '0']
+        if self.programmer_sn:
+            cmd += ['-USB', self.programmer_sn]
+        return cmd
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> JLinkSession:
+        cmd = self.command_line()
+        logging.info(' '.join(cmd))
+        self.process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, bufsize=0,
+        )
+        # a thread, select() does not work on pipes under Windows
+        threading.Thread(target=self.read_output, daemon=True).start()
+        try:
+            self.read_until_prompt(self.startup_timeout)
+            if self.setup:
+                self.execute(self.setup)
+        except CalledProcessError:
+            self.close()
+            raise
+        return self
+
+    def read_output(self) -> None:
+        # unbuffered binary pipe, read() returns whatever has arrived
+        stdout = self.process.stdout
+        while chunk := stdout.read(1024):
+            self.output.put(chunk.decode(errors='replace'))
+        self.output.put('')  # end of output
+
+    def read_until_prompt(self, timeout: float) -> str:
+        deadline = time.monotonic() + timeout
+        text = ''
+        while not text.rstrip().endswith(self.prompt):
+            try:
+                chunk = self.output.get(
+                    timeout=max(deadline - time.monotonic(), 0),
+                )
+            except queue.Empty:
+                raise CalledProcessError(
+                    f'J-Link printed no prompt for {timeout}s',
+                ) from None
+            if not chunk:
+                raise CalledProcessError(
+                    f'J-Link exited (code {self.process.wait()})',
+                )
+            text += chunk
+        return text.rstrip()[:-len(self.prompt)]
+
+    def execute(self, lines: list[str]) -> str:
+        """Run commands, raise CalledProcessError if one of them fails"""
+        with self.lock:
+            output = []
+            for line in lines:
+                try:
+                    self.process.stdin.write(f'{line}\n'.encode())
+                except OSError:
+                    raise CalledProcessError(
+                        f"J-Link closed on '{line}'",
+                    ) from None
+                try:
+                    reply = self.read_until_prompt(self.command_timeout)
+                except CalledProcessError:
+                    self.close()  # unknown state, start over next time
+                    raise
+                output.append(reply)
+                if ERROR_PATTERN.search(reply):
+                    raise CalledProcessError(
+                        f"Command '{line}' returned an error: {reply.strip()}",
+                    )
+        return ''.join(output)
+
+    def __enter__(self) -> JLinkSession:
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b'Exit\n')
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    @classmethod
+    def for_probe(
+            cls, setup: list[str], programmer_sn: str = '', **kwargs,
+    ) -> JLinkSession:
+        """Return the running session of the probe, start it if needed"""
+        with cls._sessions_lock:
+            session = cls._sessions.get(programmer_sn)
+            if session is not None and (
+                    session.setup == setup and session.alive
+            ):
+                return session
+            if session is not None:
+                session.close()
+            session = cls(setup, programmer_sn, **kwargs).start()
+            cls._sessions[programmer_sn] = session
+            return session
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._sessions_lock:
+            for session in cls._sessions.values():
+                session.close()
+            cls._sessions.clear()
+
+
+atexit.register(JLinkSession.close_all)
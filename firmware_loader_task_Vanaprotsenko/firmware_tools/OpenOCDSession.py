@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import socket
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from firmware_tools.BaseFlasher import CalledProcessError
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class OpenOCDSession:
+    """
+    Long-lived OpenOCD process driven over its Tcl RPC port.
+    Init, probe enumeration and target examination happen once per session
+    instead of once per command.
+    """
+    terminator = b'\x1a'
+
+    _sessions: dict[str, OpenOCDSession] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(
+            self,
+            config_args: list[str],
+            programmer_sn: str = '',
+            host: str = '127.0.0.1',
+            port: Optional[int] = None,
+            spawn: bool = True,
+            executable: str = 'openocd',
+            startup_timeout: float = 10.0,
+            command_timeout: float = 120.0,
+    ) -> None:
+        self.config_args = list(config_args)
+        self.programmer_sn = programmer_sn
+        self.host = host
+        self.port = port
+        self.spawn = spawn
+        self.executable = executable
+        self.startup_timeout = startup_timeout
+        self.command_timeout = command_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self.sock: Optional[socket.socket] = None
+        self.lock = threading.Lock()
+
+    def command_line(self) -> list[str]:
+        cmd = [self.executable, *self.config_args]
+        if self.programmer_sn:
+            cmd += ['-c', f'adapter serial {self.programmer_sn}']
+        cmd += [
+            '-c', f'tcl_port {self.port}',
+            '-c', 'telnet_port disabled',
+            '-c', 'gdb_port disabled',
+            '-c', 'init',
+        ]
+        return cmd
+
+    @property
+    def alive(self) -> bool:
+        if self.sock is None:
+            return False
+        return self.process is None or self.process.poll() is None
+
+    def start(self) -> OpenOCDSession:
+        if self.spawn:
+            self.port = self.port or free_port(self.host)
+            cmd = self.command_line()
+            logging.info(' '.join(cmd))
+            self.process = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        self.connect()
+        return self
+
+    def connect(self) -> None:
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            if self.process is not None and self.process.poll() is not None:
+                raise CalledProcessError(
+                    f"OpenOCD exited during startup"
+                    f" (code {self.process.returncode})",
+                )
+            try:
+                self.sock = socket.create_connection(
+                    (self.host, self.port), timeout=self.command_timeout,
+                )
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise CalledProcessError(
+                        f"Can't connect to OpenOCD on"
+                        f" {self.host}:{self.port}",
+                    ) from None
+                time.sleep(0.05)
+
+    def send(self, cmd: str) -> str:
+        with self.lock:
+            try:
+                self.sock.sendall(cmd.encode() + self.terminator)
+                response = bytearray()
+                while not response.endswith(self.terminator):
+                    chunk = self.sock.recv(4096)
+                    if not chunk:
+                        raise CalledProcessError(
+                            f"OpenOCD closed connection on '{cmd}'",
+                        )
+                    response += chunk
+            except (OSError, CalledProcessError) as e:
+                # a late reply would be read by the next job, start over
+                self.abort()
+                if isinstance(e, CalledProcessError):
+                    raise
+                raise CalledProcessError(
+                    f"No answer from OpenOCD on '{cmd}': {e}",
+                ) from None
+        return response[:-1].decode(errors='replace')
+
+    def abort(self) -> None:
+        """Drop the connection and the process without a shutdown"""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+    def execute(self, cmd: str) -> str:
+        """Run a Tcl script, raise CalledProcessError if it fails"""
+        return self.evaluate(f'capture {{{cmd}}}')
+
+    def evaluate(self, script: str) -> str:
+        """Return Tcl result of script, raise CalledProcessError on error"""
+        response = self.send(
+            f'if {{[catch {{{script}}} msg]}}'
+            f' {{format "ERR %s" $msg}} else {{format "OK %s" $msg}}',
+        )
+        status, _, output = response.partition(' ')
+        if status != 'OK':
+            raise CalledProcessError(
+                f"Command '{script}' returned an error: {output}",
+            )
+        return output
+
+    def close(self) -> None:
+        if self.sock is not None:
+            if self.process is not None:
+                try:
+                    self.send('shutdown')
+                except (OSError, CalledProcessError):
+                    pass
+            self.sock.close()
+            self.sock = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+    def __enter__(self) -> OpenOCDSession:
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @classmethod
+    def for_probe(
+            cls, config_args: list[str], programmer_sn: str = '',
+    ) -> OpenOCDSession:
+        """Return the running session of the probe, start it if needed"""
+        with cls._sessions_lock:
+            session = cls._sessions.get(programmer_sn)
+            if session is not None and (
+                    session.config_args == config_args and session.alive
+            ):
+                return session
+            if session is not None:
+                session.close()
+            session = cls(config_args, programmer_sn).start()
+            cls._sessions[programmer_sn] = session
+            return session
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._sessions_lock:
+            for session in cls._sessions.values():
+                session.close()
+            cls._sessions.clear()
+
+
+atexit.register(OpenOCDSession.close_all)
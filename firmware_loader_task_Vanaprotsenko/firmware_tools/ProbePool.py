@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+SYSFS_USB = '/sys/bus/usb/devices'
+# USB vendor -> flasher, None: any product of the vendor
+USB_PROBES: dict[str, tuple[str, Optional[frozenset[str]]]] = {
+    '0483': ('STlink', frozenset({  # ST-Link/V2, V2-1, V3
+        '3748', '374a', '374b', '374d', '374e', '374f', '3752', '3753',
+        '3754',
+    })),
+    '1366': ('JLink', None),  # SEGGER makes only J-Links
+}
+
+
+class NoProbeError(RuntimeError):
+    pass
+
+
+@dataclass
+class Probe:
+    serial: str
+    kind: str  # FlasherFactory key, 'STlink' or 'JLink'
+    connected: bool = True
+    busy: bool = False
+    jobs: int = 0
+    failures: int = 0
+    total_time: float = 0.0
+    consecutive_failures: int = 0
+    resting_until: float = 0.0  # degraded probes get no work until then
+    recent: deque[bool] = field(default_factory=lambda: deque(maxlen=10))
+
+    @property
+    def failure_rate(self) -> float:
+        if not self.recent:
+            return 0.0
+        return self.recent.count(False) / len(self.recent)
+
+    @property
+    def mean_cycle_time(self) -> float:
+        return self.total_time / self.jobs if self.jobs else 0.0
+
+    def summary(self) -> dict[str, object]:
+        return {
+            'serial': self.serial,
+            'kind': self.kind,
+            'connected': self.connected,
+            'jobs': self.jobs,
+            'failures': self.failures,
+            'failure_rate': round(self.failure_rate, 3),
+            'mean_cycle_time': round(self.mean_cycle_time, 3),
+            'degraded': self.resting_until > time.monotonic(),
+        }
+
+
+class ProbeBackend(ABC):
+    @abstractmethod
+    def discover(self) -> list[tuple[str, str]]:
+        """(kind, serial) of every attached probe"""
+
+
+class UsbProbeBackend(ProbeBackend):
+    """Probes from Linux sysfs, no libusb or vendor tools needed"""
+
+    def __init__(self, root: str = SYSFS_USB) -> None:
+        self.root = root
+
+    @staticmethod
+    def _read(path: str) -> str:
+        try:
+            with open(path, errors='replace') as file:
+                return file.read().strip()
+        except OSError:
+            return ''
+
+    def discover(self) -> list[tuple[str, str]]:
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for name in sorted(os.listdir(self.root)):
+            folder = os.path.join(self.root, name)
+            vendor = self._read(os.path.join(folder, 'idVendor')).lower()
+            product = self._read(os.path.join(folder, 'idProduct')).lower()
+            serial = self._read(os.path.join(folder, 'serial'))
+            if vendor not in USB_PROBES or not serial:
+                continue
+            kind, products = USB_PROBES[vendor]
+            if products is not None and product not in products:
+                continue
+            if kind == 'JLink':
+                # 000260123456 in USB, JLinkExe -USB takes 260123456
+                serial = serial.lstrip('0') or '0'
+            found.append((kind, serial))
+        return found
+
+
+class FakeProbeBackend(ProbeBackend):
+    """Fixed probe list for tests and benchmarks, change attached freely"""
+
+    def __init__(self, attached: Iterable[tuple[str, str]] = ()) -> None:
+        self.attached = list(attached)
+
+    def discover(self) -> list[tuple[str, str]]:
+        return list(self.attached)
+
+
+class ProbePool:
+    """
+    Attached probes leased to flash jobs one at a time.
+    A probe failing max_consecutive_failures jobs in a row, or more than
+    max_failure_rate of its recent jobs, rests for cooldown seconds and
+    gets work again afterwards. Idle healthy probes with the best record
+    are leased first.
+    """
+
+    def __init__(
+            self,
+            backend: Optional[ProbeBackend] = None,
+            max_failure_rate: float = 0.5,
+            max_consecutive_failures: int = 3,
+            min_jobs: int = 4,
+            cooldown: float = 60.0,
+    ) -> None:
+        self.backend = backend or UsbProbeBackend()
+        self.max_failure_rate = max_failure_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.min_jobs = min_jobs  # of the recent ones, for the failure rate
+        self.cooldown = cooldown
+        self.probes: dict[str, Probe] = {}
+        self.condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return sum(probe.connected for probe in self.probes.values())
+
+    def discover(self) -> list[Probe]:
+        """Refresh attached probes, detached ones keep their history"""
+        attached = self.backend.discover()
+        with self.condition:
+            serials = set()
+            for kind, serial in attached:
+                serials.add(serial)
+                probe = self.probes.get(serial)
+                if probe is None:
+                    self.probes[serial] = Probe(serial, kind)
+                else:
+                    probe.connected = True
+            for probe in self.probes.values():
+                if probe.serial not in serials:
+                    probe.connected = False
+            self.condition.notify_all()
+            return [probe for probe in self.probes.values() if probe.connected]
+
+    def _candidates(self, kind: str, serial: Optional[str]) -> list[Probe]:
+        if serial:
+            probe = self.probes.get(serial)
+            if probe is None or not probe.connected:
+                raise NoProbeError(f'Probe {serial} is not connected')
+            if probe.kind != kind:
+                raise NoProbeError(f'Probe {serial} is a {probe.kind}')
+            return [probe]
+        probes = [
+            probe for probe in self.probes.values()
+            if probe.kind == kind and probe.connected
+        ]
+        if not probes:
+            raise NoProbeError(f'No {kind} probe connected')
+        return probes
+
+    def lease(
+            self,
+            kind: str,
+            serial: Optional[str] = None,
+            timeout: Optional[float] = None,
+    ) -> Probe:
+        """
+        Wait for an idle probe of kind, or for the given serial.
+        A requested serial is leased even when degraded, the device is
+        wired to it.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                probes = self._candidates(kind, serial)
+                idle = [
+                    probe for probe in probes if not probe.busy and (
+                        serial or probe.resting_until <= now
+                    )
+                ]
+                if idle:
+                    probe = min(idle, key=lambda item: (
+                        item.failure_rate, item.mean_cycle_time,
+                    ))
+                    probe.busy = True
+                    return probe
+                if deadline is not None and now >= deadline:
+                    raise NoProbeError(f'No {kind} probe free in {timeout}s')
+                # woken up by release(), the end of a rest or the deadline
+                waits = [
+                    probe.resting_until - now for probe in probes
+                    if not probe.busy and probe.resting_until > now
+                ]
+                if deadline is not None:
+                    waits.append(deadline - now)
+                self.condition.wait(min(waits, default=None))
+
+    def release(self, probe: Probe, success: bool, duration: float) -> None:
+        with self.condition:
+            probe.busy = False
+            probe.jobs += 1
+            probe.total_time += duration
+            probe.recent.append(success)
+            if success:
+                probe.consecutive_failures = 0
+            else:
+                probe.failures += 1
+                probe.consecutive_failures += 1
+                if self.degraded(probe):
+                    probe.resting_until = time.monotonic() + self.cooldown
+                    probe.recent.clear()  # a fresh start after the rest
+                    logging.warning(
+                        f'Probe {probe.serial} degraded,'
+                        f' no jobs for {self.cooldown:.0f}s',
+                    )
+            self.condition.notify_all()
+
+    def degraded(self, probe: Probe) -> bool:
+        return (
+            probe.consecutive_failures >= self.max_consecutive_failures
+            or len(probe.recent) >= self.min_jobs
+            and probe.failure_rate > self.max_failure_rate
+        )
+
+    def summary(self) -> list[dict[str, object]]:
+        with self.condition:
+            return [probe.summary() for probe in self.probes.values()]
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+# <content hash><suffix>, temp files of unfinished writes do not match
+CACHED_NAME = re.compile(r'^[0-9a-f]{32}(\.\w+)?$')
+
+
+class ScriptCache:
+    """
+    Content-addressed store for generated programmer scripts.
+    File name is the hash of the content, so a script is written once,
+    reused by every job generating the same text and never mismatched.
+    Least recently used files are deleted above max_bytes, files left by
+    earlier runs count too. Pinned files of running jobs are kept.
+    """
+    max_bytes = 256 * 1024
+
+    _caches: dict[str, ScriptCache] = {}
+    _caches_lock = threading.Lock()
+
+    def __init__(self, folder: str, max_bytes: int = max_bytes) -> None:
+        self.folder = folder
+        self.max_bytes = max_bytes
+        # path -> (size, mtime_ns) of the file as written
+        self.entries: OrderedDict[str, tuple[int, int]] = OrderedDict()
+        self.size = 0
+        self.pinned: dict[str, int] = {}  # path -> jobs using the file
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.load()
+
+    def load(self) -> None:
+        """Adopt files of earlier runs, oldest first, and trim to size"""
+        found = []
+        for entry in os.scandir(self.folder):
+            if CACHED_NAME.match(entry.name) and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime_ns, entry.path, stat.st_size))
+        with self.lock:
+            for mtime_ns, path, size in sorted(found):
+                self.entries[path] = (size, mtime_ns)
+                self.size += size
+            self.trim()
+
+    @classmethod
+    def for_folder(
+            cls, folder: str, max_bytes: Optional[int] = None,
+    ) -> ScriptCache:
+        with cls._caches_lock:
+            if folder not in cls._caches:
+                cls._caches[folder] = cls(folder, max_bytes or cls.max_bytes)
+            return cls._caches[folder]
+
+    @staticmethod
+    def content_hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()[:32]
+
+    def get(
+            self, content: Union[str, bytes], suffix: str, pin: bool = False,
+    ) -> str:
+        """
+        Return path of a file with this content, write it if missing.
+        A pinned file is not deleted before unpin().
+        """
+        data = content.encode() if isinstance(content, str) else content
+        path = os.path.join(self.folder, f'{self.content_hash(data)}{suffix}')
+        with self.lock:
+            if pin:
+                self.pinned[path] = self.pinned.get(path, 0) + 1
+            if self.unchanged(path, len(data)):
+                self.entries.move_to_end(path)
+                return path
+            if not self.matches(path, data):
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+                with open(tmp_path, 'wb') as file:
+                    file.write(data)
+                os.replace(tmp_path, path)
+            self.add(path, len(data))
+        return path
+
+    def unpin(self, paths: list[str]) -> None:
+        with self.lock:
+            for path in paths:
+                if self.pinned.get(path, 0) > 1:
+                    self.pinned[path] -= 1
+                else:
+                    self.pinned.pop(path, None)
+            self.trim()
+
+    def unchanged(self, path: str, size: int) -> bool:
+        """Known file with the size and mtime it was written with"""
+        if path not in self.entries:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return self.entries[path] == (size, stat.st_mtime_ns) == (
+            stat.st_size, stat.st_mtime_ns,
+        )
+
+    def matches(self, path: str, data: bytes) -> bool:
+        # file left by a previous run is adopted only if content is intact
+        try:
+            with open(path, 'rb') as file:
+                return file.read() == data
+        except OSError:
+            return False
+
+    def add(self, path: str, size: int) -> None:
+        self.size -= self.entries.pop(path, (0, 0))[0]
+        self.entries[path] = (size, os.stat(path).st_mtime_ns)
+        self.size += size
+        self.trim()
+
+    def trim(self) -> None:
+        # the newest file was just asked for, it always stays
+        for old_path in list(self.entries)[:-1]:
+            if self.size <= self.max_bytes:
+                break
+            if old_path in self.pinned:
+                continue
+            old_size, _ = self.entries.pop(old_path)
+            self.size -= old_size
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
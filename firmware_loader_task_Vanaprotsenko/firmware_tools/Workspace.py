@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import getpass
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import Optional
+
+SHM_DIR = '/dev/shm'
+
+
+@lru_cache(maxsize=1)
+def default_root() -> str:
+    """RAM-backed /dev/shm when usable, the system temp folder otherwise"""
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK | os.X_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+
+def default_cache_folder() -> str:
+    """Shared folder for content-addressed scripts, sectors and merges"""
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError):
+        user = 'default'
+    return os.path.join(default_root(), f'firmware_tools-{user}')
+
+
+class Workspace:
+    """
+    Private temp folder of one flash job.
+    Every generated file lives here under a fixed name, parallel jobs
+    never share a path, cleanup() removes all of it at once.
+    """
+
+    def __init__(
+            self, root: Optional[str] = None, prefix: str = 'flash_',
+    ) -> None:
+        root = root or default_root()
+        os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=root)
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> Workspace:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
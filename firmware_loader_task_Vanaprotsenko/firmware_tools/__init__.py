@@ -1,14 +1,39 @@
 from __future__ import annotations
 
+from importlib import import_module
+
 from firmware_tools.classes import (CC, STM8, STM32, DevFibra, Device,
                                     DevRadio, ProcessorType)
-from firmware_tools.devices import DEVICES
-from firmware_tools.FlasherFactory import FlasherFactory
-from firmware_tools.JLinkFlasher import JLinkFlasher
-from firmware_tools.STLinkFlasher import STLinkFlasher
+
+# flashers pull in subprocess, asyncio and the image code, the device list
+# reads devices.json: import them on first use to keep startup short.
+# No lazy name may be a submodule name, importing the submodule would
+# bind the module here and __getattr__ would never be asked for the class.
+_LAZY = {
+    'DEVICES': 'firmware_tools.devices',
+    'FlasherFactory': 'firmware_tools.flasher_factory',
+    'FlashOrchestrator': 'firmware_tools.flash_orchestrator',
+    'FlashJob': 'firmware_tools.flash_orchestrator',
+    'JobResult': 'firmware_tools.flash_orchestrator',
+    'BatchResult': 'firmware_tools.flash_orchestrator',
+    'JLinkFlasher': 'firmware_tools.jlink_flasher',
+    'STLinkFlasher': 'firmware_tools.stlink_flasher',
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(
+            f'module {__name__!r} has no attribute {name!r}',
+        )
+    value = getattr(import_module(_LAZY[name]), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
 
 __all__ = [
     "DEVICES", "ProcessorType", "Device", "DevFibra",
     "DevRadio", "STM8", "STM32", "CC",
     "JLinkFlasher", "STLinkFlasher", "FlasherFactory",
+    "FlashOrchestrator", "FlashJob", "JobResult", "BatchResult",
 ]
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import dataclasses
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from firmware_tools.classes import Device
+from firmware_tools.FlashMetrics import FlashMetrics
+from firmware_tools.ProbePool import NoProbeError, ProbePool
+
+
+@dataclass
+class FlashJob:
+    device: Device
+    firmware: str
+    device_id: str
+    programmer_sn: str = ''
+    flasher: str = 'STlink'
+    options: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class JobResult:
+    job: FlashJob
+    success: bool
+    duration: float
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    results: list[JobResult]
+    wall_time: float
+
+    @property
+    def succeeded(self) -> list[JobResult]:
+        return [result for result in self.results if result.success]
+
+    @property
+    def failed(self) -> list[JobResult]:
+        return [result for result in self.results if not result.success]
+
+    @property
+    def devices_per_minute(self) -> float:
+        if not self.wall_time:
+            return 0.0
+        return len(self.succeeded) * 60 / self.wall_time
+
+
+class FlashOrchestrator:
+    """
+    Run flash jobs concurrently, one worker per programmer.
+    Jobs sharing a programmer_sn (or having none) run one after another,
+    so the batch takes about as long as the busiest probe.
+    With a ProbePool, jobs without programmer_sn take any idle healthy
+    probe of their flasher kind instead.
+    """
+
+    def __init__(
+            self,
+            max_workers: Optional[int] = None,
+            metrics: Optional[FlashMetrics] = None,
+            pool: Optional[ProbePool] = None,
+    ) -> None:
+        self.max_workers = max_workers
+        # stage timings of every job are collected here
+        self.metrics = metrics
+        self.pool = pool
+
+    @staticmethod
+    def group_by_probe(
+            jobs: list[FlashJob],
+    ) -> dict[str, list[tuple[int, FlashJob]]]:
+        queues: dict[str, list[tuple[int, FlashJob]]] = OrderedDict()
+        for index, job in enumerate(jobs):
+            queues.setdefault(job.programmer_sn, []).append((index, job))
+        return queues
+
+    @staticmethod
+    def run_job(job: FlashJob) -> JobResult:
+        # flashers are imported with the first job, not with the module
+        from firmware_tools.flasher_factory import FlasherFactory
+
+        start = time.monotonic()
+        try:
+            flasher = FlasherFactory.get_flasher(job.flasher)(
+                # flashers fill in id_address, keep catalog entries intact
+                dataclasses.replace(job.device),
+                job.firmware,
+                job.device_id,
+                programmer_sn=job.programmer_sn,
+                **job.options,
+            )
+            success = flasher.run()
+            error = None if success else 'flasher reported failure'
+        except Exception as e:
+            logging.error(f'Job {job.device_id} failed: {e}')
+            success, error = False, str(e)
+        return JobResult(job, success, time.monotonic() - start, error)
+
+    def run_leased(self, job: FlashJob) -> JobResult:
+        """Run job on a probe leased from the pool"""
+        try:
+            probe = self.pool.lease(job.flasher, job.programmer_sn or None)
+        except NoProbeError as e:
+            logging.error(f'Job {job.device_id} failed: {e}')
+            return JobResult(job, False, 0.0, str(e))
+        result = self.run_job(
+            dataclasses.replace(job, programmer_sn=probe.serial),
+        )
+        self.pool.release(probe, result.success, result.duration)
+        return result
+
+    def run_queue(
+            self, queue: list[tuple[int, FlashJob]],
+    ) -> list[tuple[int, JobResult]]:
+        run = self.run_job if self.pool is None else self.run_leased
+        return [(index, run(job)) for index, job in queue]
+
+    @staticmethod
+    def prune_caches(jobs: list[FlashJob]) -> None:
+        """Drop old merges once no job of the batch can use them"""
+        from firmware_tools.utils import prune_merges
+        from firmware_tools.Workspace import default_cache_folder
+
+        folders = {
+            job.options.get('cfg_folder') or default_cache_folder()
+            for job in jobs if job.options.get('bootloader')
+        }
+        for folder in folders:
+            prune_merges(os.path.join(folder, 'merged'))
+
+    def run(self, jobs: list[FlashJob]) -> BatchResult:
+        if self.metrics is not None:
+            jobs = [
+                dataclasses.replace(
+                    job, options={**job.options, 'metrics': self.metrics},
+                )
+                for job in jobs
+            ]
+        queues = list(self.group_by_probe(jobs).items())
+        workers = len(queues)
+        if self.pool is not None:
+            self.pool.discover()  # pick up probes plugged in since last run
+            pinned = [(sn, queue) for sn, queue in queues if sn]
+            free = [queue for sn, queue in queues if not sn]
+            # every free job is leased on its own, one worker per probe
+            queues = pinned + [
+                ('', [item]) for queue in free for item in queue
+            ]
+            workers = len(pinned) + len(self.pool)
+        start = time.monotonic()
+        results: dict[int, JobResult] = {}
+        workers = self.max_workers or max(workers, 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for queue_results in executor.map(
+                    self.run_queue, [queue for _, queue in queues],
+            ):
+                results.update(queue_results)
+        batch = BatchResult(
+            [results[index] for index in range(len(jobs))],
+            time.monotonic() - start,
+        )
+        if self.metrics is not None:
+            self.metrics.wall_time += batch.wall_time
+        self.prune_caches(jobs)
+        logging.info(
+            f'Batch finished: {len(batch.succeeded)}/{len(jobs)} ok'
+            f' in {batch.wall_time:.1f}s'
+            f' ({batch.devices_per_minute:.1f} devices/min)',
+        )
+        return batch
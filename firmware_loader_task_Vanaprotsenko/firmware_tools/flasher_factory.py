@@ -1,6 +1,6 @@
 from firmware_tools.BaseFlasher import BaseFlasher
-from firmware_tools.JLinkFlasher import JLinkFlasher
-from firmware_tools.STLinkFlasher import STLinkFlasher
+from firmware_tools.jlink_flasher import JLinkFlasher
+from firmware_tools.stlink_flasher import STLinkFlasher
 
 
 class FlasherFactory:
@@ -0,0 +1,218 @@
+import logging
+import os
+from typing import Optional
+
+from firmware_tools import CC, STM32, Device
+from firmware_tools.BaseFlasher import BaseFlasher, CalledProcessError
+from firmware_tools.JLinkSession import JLinkSession
+
+
+class JLinkFlasher(BaseFlasher):
+    def __init__(
+            self,
+            device: Device,
+            firmware: str,
+            device_id: str, **kwargs,
+    ) -> None:
+        super().__init__(device, firmware, device_id, **kwargs)
+        self.processor_config_dict = {
+            CC.CC_1310: self.cc13x0_cfg,
+            CC.CC_1352: self.cc13x2_cfg,
+            STM32.STM32_L0: self.stm32l_cfg,
+        }
+        self.processor_lines_dict = {
+            CC.CC_1310: self.cc13x0_lines,
+            CC.CC_1352: self.cc13x2_lines,
+            STM32.STM32_L0: self.stm32l_lines,
+        }
+        self._config_file = kwargs.get('config_file', None)
+        # the mass erase clears the readout protection set by the lock
+        # write, only known unprotected parts may erase sectors alone
+        self.full_erase = kwargs.get('full_erase', True)
+        # keep one J-Link Commander per probe and feed it over stdin
+        self.jlink_session = kwargs.get('jlink_session', False)
+        self.session: Optional[JLinkSession] = None
+
+    @property
+    def config_file(self) -> str:
+        return self._config_file
+
+    @config_file.setter
+    def config_file(self, value: str) -> None:
+        self._config_file = value
+
+    def script_path(self, path: str) -> str:
+        """
+        Workspace files by name, JLinkExe runs in the workspace, so the
+        script is the same for every job and its cached file is shared.
+        Other files by absolute path, relative ones would miss there.
+        """
+        path = str(path)
+        if self.cwd is None or os.path.dirname(path) != self.cwd:
+            return os.path.abspath(path)
+        return os.path.basename(path)
+
+    def load_lines(self) -> list[str]:
+        """A .bin has no load address, give it with every segment"""
+        if not self.firmware_segments:
+            return [f'loadfile {self.script_path(self.firmware)}']
+        return [
+            f'loadfile {self.script_path(path)} {hex(address)}'
+            for address, path in self.firmware_segments
+        ]
+
+    def verify_lines(self) -> list[str]:
+        """J-Link verifies by CRC on target, before lock registers"""
+        if not self.verify_image or self.image is None:
+            return []
+        return [
+            f'verifybin {self.script_path(path)} {hex(address)}'
+            for address, _, path, _ in self.sector_files()
+        ]
+
+    def cc13x0_cfg(self) -> str:
+        return self.cached_script(self.cc13x0_lines(), '.jlink')
+
+    def cc13x2_cfg(self) -> str:
+        return self.cached_script(self.cc13x2_lines(), '.jlink')
+
+    def stm32l_cfg(self) -> str:
+        return self.cached_script(self.stm32l_lines(), '.jlink')
+
+    def erase_lines(self) -> list[str]:
+        """Mass erase (unlock) unless full_erase is off and sectors known"""
+        ranges = self.erase_ranges()
+        if ranges is None:
+            return ['erase']  # unlock
+        # end address is inclusive for J-Link Commander
+        return [
+            f'erase {hex(start)} {hex(start + size - 1)}'
+            for start, size in ranges
+        ]
+
+    def cc13x0_lines(self) -> list[str]:
+        processor_code = f'{self.device.processor.value.upper()}F128'
+        lock_registers = ('0001FFD8', '0001FFE4', '0001FFE6')
+        return self.cc_lines(processor_code, lock_registers)
+
+    def cc13x2_lines(self) -> list[str]:
+        processor_code = f'{self.device.processor.value.upper()}R1F3'
+        lock_registers = ('00057FE4', '00057FE8', '00057FD8')
+        return self.cc_lines(processor_code, lock_registers)
+
+    def cc_lines(
+            self,
+            processor_code: str,
+            lock_registers: tuple[str, ...],
+    ) -> list[str]:
+        """
+        Commands for JLink programmer device
+        Command's here: https://wiki.segger.com/J-Link_Commander
+        """
+        lines = [
+            'SelectInterface cJTAG',
+            'JTAGConf -1 -1',
+            f'Speed {self.speed or 1000}',
+            f'Device {processor_code}',
+            'Reset',
+            'Halt',
+            *self.load_lines(),
+        ]
+        if self.bootloader is not None and self.device.id_address is not None:
+            lines.append(
+                f'loadfile {self.script_path(self.bootloader)}'
+                f' {hex(self.device.id_address)}',
+            )
+        lines += self.verify_lines()
+        # Write to CCFG registers for lock mcu
+        lines += [f'w1 {registry} 00' for registry in lock_registers]
+        lines.append('Exit')
+        return lines
+
+    def stm32l_lines(self) -> list[str]:
+        """
+        Commands for JLink programmer device
+        Command's here: https://wiki.segger.com/J-Link_Commander
+        """
+        return [
+            'SelectInterface SWD',
+            f'Speed {self.speed or 1000}',
+            'Device STM32L051K8 (ALLOW OPT. BYTES)',
+            'r',  # reset
+            'h',  # halt
+            *self.erase_lines(),
+            *self.load_lines(),  # flash
+            *self.verify_lines(),
+            'w4 0x1FF80000 0xFF4400BB',
+            'r',
+            'Exit',
+        ]
+
+    def setup_firmware_flashing(self) -> None:
+        self.search_apply_device_id()
+        if self._workspace is not None and not self.jlink_session:
+            # a session runs elsewhere and needs full paths
+            self.cwd = self._workspace.path
+        with self.stage('config'):
+            self.config_file = self.processor_config_dict[
+                self.device.processor
+            ]()
+
+    def jlink_cmd(self) -> str:
+        serial_number_opt = ""
+        if self.programmer_sn:
+            serial_number_opt = f"-USB {self.programmer_sn}"
+        return (
+            f'JLinkExe -ExitOnError 1'
+            f' -NoGui 1 {serial_number_opt}'
+            f' -CommandFile {os.path.abspath(self.config_file)}'
+        )
+
+    def flash_tuned(self) -> bool:
+        """Flash with a script for the speed set by with_tuned_clock"""
+        if self.jlink_session:
+            return self.flash_session()
+        self.config_file = self.processor_config_dict[
+            self.device.processor
+        ]()
+        return self.execute_cmd(self.jlink_cmd())
+
+    def flash_session(self) -> bool:
+        """
+        Connection lines start the probe's session once, the rest runs
+        over it for every device, a connect first as the target changed
+        """
+        lines = self.processor_lines_dict[self.device.processor]()
+        start = next(
+            i for i, line in enumerate(lines) if line in ('Reset', 'r')
+        )
+        device_lines = [
+            'Connect', *(line for line in lines[start:] if line != 'Exit'),
+        ]
+        for attempt in range(self.tries_to_execute_cmd):
+            try:
+                self.session = JLinkSession.for_probe(
+                    lines[:start], self.programmer_sn,
+                )
+                logging.info('; '.join(device_lines))
+                self.session.execute(device_lines)
+                return True
+            except CalledProcessError as e:
+                if attempt == self.tries_to_execute_cmd - 1:
+                    raise
+                self.job_metrics.add_retries(
+                    self.current_stage or 'command', 1,
+                )
+                logging.error(e)
+        return True
+
+    def flash_firmware(self) -> bool:
+        # JLinkExe unlocks, flashes and locks in one run
+        with self.stage('flash'):
+            if self.clock_tuner is not None and not self.flash_cmd:
+                return self.with_tuned_clock('JLink', self.flash_tuned)
+            if self.jlink_session and not self.flash_cmd:
+                return self.flash_session()
+            if not self.flash_cmd:
+                self.flash_cmd = self.jlink_cmd()
+            return self.execute_cmd(self.flash_cmd)
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import csv
+import dataclasses
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+from firmware_tools.classes import Device
+from firmware_tools.DeviceCatalog import DeviceCatalog, load_catalog
+from firmware_tools.FirmwareLibrary import FirmwareLibrary
+from firmware_tools.flash_orchestrator import FlashJob
+from firmware_tools.IdAllocator import IdAllocator, IdPoolExhausted
+from firmware_tools.validation import (FIELDS, parse_device_id,
+                                       parse_flasher, parse_subtype)
+
+
+@dataclass
+class ManifestRow:
+    line: int
+    data: dict[str, str]
+    job: Optional[FlashJob] = None
+    error: Optional[str] = None
+
+
+def read_records(
+        path: str,
+) -> Iterator[tuple[int, dict[str, Any], Optional[str]]]:
+    """
+    Stream (line number, record, error) from a .csv or .jsonl manifest,
+    a line that is not a JSON object gives an empty record and error
+    """
+    with open(path, newline='') as file:
+        if path.endswith(('.jsonl', '.json')):
+            for line_num, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_num, {}, f'Invalid JSON: {e.msg}.'
+                    continue
+                if not isinstance(record, dict):
+                    yield line_num, {}, 'Record is not a JSON object.'
+                    continue
+                yield line_num, record, None
+            return
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record, None
+
+
+def _text(value: Any) -> str:
+    return '' if value is None else str(value).strip()
+
+
+def make_job(
+        data: dict[str, str],
+        catalog: DeviceCatalog,
+        base_dir: str = '',
+        allocator: Optional[IdAllocator] = None,
+        library: Optional[FirmwareLibrary] = None,
+) -> FlashJob:
+    """
+    Same rules as Loader prompts, ValueError instead of asking again.
+    Empty device_id is taken from allocator, empty firmware is looked up
+    in library by device, region and optional version.
+    """
+    device = catalog.get(data['device'])
+    if device is None:
+        raise ValueError(f"Unknown device '{data['device']}'.")
+    if data['subtype']:
+        device = dataclasses.replace(
+            device, subtype=parse_subtype(data['subtype']),
+        )
+    options: dict[str, Any] = {}
+    if data['color']:
+        try:
+            options['color'] = int(data['color'])
+        except ValueError:
+            raise ValueError(
+                'Invalid color. Color should be a number.',
+            ) from None
+        if options['color'] not in device.possible_colors:
+            raise ValueError(
+                f'Invalid color. Color must be one of'
+                f' {device.possible_colors}.',
+            )
+    device_id = data['device_id']
+    allocated = False
+    if allocator is not None:
+        options['id_allocator'] = allocator
+        if not device_id:
+            # the ID length picks the [3B] or [4B] firmware
+            device_id = allocator.allocate(device.name)
+            allocated = True
+    try:
+        if not data['firmware'] and library is not None:
+            firmware = library_firmware(data, device, device_id, library)
+        else:
+            firmware = os.path.join(base_dir, data['firmware'])
+            if not data['firmware'] or not os.path.isfile(firmware):
+                raise ValueError(f"No firmware file '{data['firmware']}'.")
+    except ValueError:
+        if allocated:
+            allocator.release(device_id)
+        raise
+    return FlashJob(
+        device,
+        firmware,
+        parse_device_id(device_id),
+        programmer_sn=data['programmer_sn'],
+        flasher=parse_flasher(data['flasher']),
+        options=options,
+    )
+
+
+def library_firmware(
+        data: dict[str, str],
+        device: Device,
+        device_id: str,
+        library: FirmwareLibrary,
+) -> str:
+    if not data['region']:
+        raise ValueError('No firmware file and no region to look it up.')
+    entry = library.find(
+        device.name,
+        data['region'],
+        data['version'] or None,
+        parse_subtype(data['subtype']) if data['subtype'] else None,
+        # [3B] or [4B] part of the name
+        f'{len(device_id) // 2}B' if device_id else None,
+    )
+    if entry is None:
+        raise ValueError(
+            f"No {data['version'] or 'firmware'} for {device.name}"
+            f" in region {data['region']}.",
+        )
+    return entry.path
+
+
+def read_manifest(
+        path: str,
+        catalog: Optional[DeviceCatalog] = None,
+        allocator: Optional[IdAllocator] = None,
+        library: Optional[FirmwareLibrary] = None,
+) -> Iterator[ManifestRow]:
+    """
+    Rows of a manifest with columns from FIELDS, firmware paths are
+    relative to the manifest. Invalid rows carry error instead of job.
+    """
+    catalog = catalog or load_catalog()
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for line_num, record, error in read_records(path):
+        data = {name: _text(record.get(name)) for name in FIELDS}
+        row = ManifestRow(line_num, data, error=error)
+        if error is not None:
+            yield row
+            continue
+        try:
+            row.job = make_job(
+                data, catalog, base_dir, allocator, library,
+            )
+            data['device_id'] = row.job.device_id
+        except (ValueError, IdPoolExhausted) as e:
+            row.error = str(e)
+        yield row
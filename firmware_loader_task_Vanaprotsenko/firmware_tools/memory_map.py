@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+from firmware_tools.classes import CC, STM8, STM32, ProcessorType
+from firmware_tools.FirmwareImage import FirmwareImage
+
+FLASH = 'flash'
+EEPROM = 'eeprom'
+OPTION_BYTES = 'option'
+OTP = 'otp'
+
+
+class ImageValidationError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class MemoryRegion:
+    name: str
+    kind: str
+    start: int
+    size: int
+    sector_size: int = 0
+    # sizes of non-uniform sectors from start (STM32F4), overrides sector_size
+    sector_layout: tuple[int, ...] = ()
+
+    @property
+    def end(self) -> int:
+        return self.start + self.size
+
+    def __contains__(self, address: int) -> bool:
+        return self.start <= address < self.end
+
+    def sectors(self) -> Iterator[tuple[int, int]]:
+        """(start, size) of every erasable sector"""
+        address = self.start
+        if self.sector_layout:
+            for size in self.sector_layout:
+                yield address, size
+                address += size
+            return
+        step = self.sector_size or self.size
+        while address < self.end:
+            yield address, step
+            address += step
+
+    def touched_sectors(
+            self, image: FirmwareImage,
+    ) -> list[tuple[int, int]]:
+        """(start, size) of sectors holding any image byte"""
+        return self.covering_sectors(
+            (start, start + len(data)) for start, data in image.segments()
+        )
+
+    def covering_sectors(
+            self, spans: Iterable[tuple[int, int]],
+    ) -> list[tuple[int, int]]:
+        """(start, size) of sectors holding any byte of [start, end) spans"""
+        sectors = list(self.sectors())
+        starts = [start for start, _ in sectors]
+        touched: dict[int, int] = {}
+        for start, end in spans:
+            lo, hi = max(start, self.start), min(end, self.end)
+            if lo >= hi:
+                continue
+            index = bisect_right(starts, lo) - 1
+            while index < len(sectors) and sectors[index][0] < hi:
+                touched.setdefault(*sectors[index])
+                index += 1
+        return sorted(touched.items())
+
+    def sector_images(
+            self, image: FirmwareImage,
+    ) -> list[tuple[int, bytes]]:
+        """Content of every touched sector, bytes not in image are 0xFF"""
+        sector_data = []
+        segments = list(image.segments())
+        for sector_start, size in self.touched_sectors(image):
+            data = bytearray(b'\xff') * size
+            for start, chunk in segments:
+                lo = max(start, sector_start)
+                hi = min(start + len(chunk), sector_start + size)
+                if lo < hi:
+                    data[lo - sector_start:hi - sector_start] = (
+                        chunk[lo - start:hi - start]
+                    )
+            sector_data.append((sector_start, bytes(data)))
+        return sector_data
+
+
+@dataclass(frozen=True)
+class MemoryMap:
+    processor: ProcessorType
+    regions: tuple[MemoryRegion, ...]
+
+    def region_at(self, address: int) -> Optional[MemoryRegion]:
+        for region in self.regions:
+            if address in region:
+                return region
+        return None
+
+    def regions_of(self, kinds: tuple[str, ...]) -> list[MemoryRegion]:
+        return [region for region in self.regions if region.kind in kinds]
+
+    def erase_plan(
+            self,
+            spans: Iterable[tuple[int, int]],
+            kinds: tuple[str, ...] = (FLASH,),
+    ) -> list[tuple[int, int]]:
+        """
+        Fewest (start, size) ranges erasing every sector the [start, end)
+        spans write to, adjacent sectors are joined into one range.
+        """
+        spans = list(spans)
+        plan: list[tuple[int, int]] = []
+        for region in self.regions_of(kinds):
+            for start, size in region.covering_sectors(spans):
+                if plan and sum(plan[-1]) == start:
+                    plan[-1] = (plan[-1][0], plan[-1][1] + size)
+                else:
+                    plan.append((start, size))
+        return plan
+
+    def clip(
+            self, image: FirmwareImage, kinds: tuple[str, ...] = (FLASH,),
+    ) -> tuple[FirmwareImage, list[tuple[int, int]]]:
+        """Return image limited to regions of kinds and dropped ranges"""
+        regions = self.regions_of(kinds)
+        clipped = FirmwareImage()
+        clipped.start_record = image.start_record
+        dropped: list[tuple[int, int]] = []
+        for start, data in image.segments():
+            end = start + len(data)
+            kept: list[tuple[int, int]] = []
+            for region in regions:
+                lo, hi = max(start, region.start), min(end, region.end)
+                if lo < hi:
+                    clipped.add_segment(lo, data[lo - start:hi - start])
+                    kept.append((lo, hi))
+            address = start
+            for lo, hi in sorted(kept) + [(end, end)]:
+                if address < lo:
+                    dropped.append((address, lo))
+                address = max(address, hi)
+        return clipped, dropped
+
+
+def _stm32_flash(size: int, sector_size: int = 0, **kwargs) -> MemoryRegion:
+    return MemoryRegion(
+        'flash', FLASH, 0x08000000, size, sector_size, **kwargs,
+    )
+
+
+MEMORY_MAPS: dict[ProcessorType, MemoryMap] = {
+    STM8.STM8_6: MemoryMap(STM8.STM8_6, (
+        MemoryRegion('flash', FLASH, 0x8000, 0x8000, 128),
+        # blank eeprom image covers 4096 - 6144 for every stm8l151
+        MemoryRegion('eeprom', EEPROM, 0x1000, 0x800, 128),
+        MemoryRegion('option', OPTION_BYTES, 0x4800, 0x80),
+    )),
+    STM8.STM8_8: MemoryMap(STM8.STM8_8, (
+        MemoryRegion('flash', FLASH, 0x8000, 0x10000, 128),
+        MemoryRegion('eeprom', EEPROM, 0x1000, 0x800, 128),
+        MemoryRegion('option', OPTION_BYTES, 0x4800, 0x80),
+    )),
+    STM32.STM32_F1X: MemoryMap(STM32.STM32_F1X, (
+        _stm32_flash(0x80000, 0x800),
+        MemoryRegion('option', OPTION_BYTES, 0x1FFFF800, 0x10),
+    )),
+    STM32.STM32_F4X: MemoryMap(STM32.STM32_F4X, (
+        _stm32_flash(
+            0x100000,
+            sector_layout=(0x4000,) * 4 + (0x10000,) + (0x20000,) * 7,
+        ),
+        MemoryRegion('otp', OTP, 0x1FFF7800, 0x210),
+        MemoryRegion('option', OPTION_BYTES, 0x1FFFC000, 0x10),
+    )),
+    STM32.STM32_L0: MemoryMap(STM32.STM32_L0, (
+        _stm32_flash(0x10000, 0x80),
+        MemoryRegion('eeprom', EEPROM, 0x08080000, 0x800, 4),
+        MemoryRegion('option', OPTION_BYTES, 0x1FF80000, 0x20),
+    )),
+    STM32.STM32_U5: MemoryMap(STM32.STM32_U5, (
+        _stm32_flash(0x200000, 0x2000),
+    )),
+    CC.CC_1310: MemoryMap(CC.CC_1310, (
+        # CCFG lock registers live in the last sector
+        MemoryRegion('flash', FLASH, 0x0, 0x20000, 0x1000),
+    )),
+    CC.CC_1352: MemoryMap(CC.CC_1352, (
+        MemoryRegion('flash', FLASH, 0x0, 0x58000, 0x2000),
+    )),
+}
+
+
+def memory_map(processor: ProcessorType) -> MemoryMap:
+    return MEMORY_MAPS[processor]
+
+
+def preflight(
+        image: FirmwareImage,
+        processor: ProcessorType,
+        kinds: tuple[str, ...] = (FLASH,),
+        policy: str = 'clip',
+) -> FirmwareImage:
+    """
+    Check image against processor memory before touching the programmer.
+    policy: 'clip' - drop out-of-range bytes, 'reject' - raise
+    """
+    mem_map = memory_map(processor)
+    if not mem_map.regions_of(kinds):
+        return image
+    clipped, dropped = mem_map.clip(image, kinds)
+    if not dropped:
+        return image
+    ranges = ', '.join(f'{hex(lo)}-{hex(hi - 1)}' for lo, hi in dropped)
+    if policy == 'reject':
+        raise ImageValidationError(
+            f'Image data out of {processor.value} {"/".join(kinds)}: {ranges}',
+        )
+    logging.info(f'Drop data out of {processor.value} memory: {ranges}')
+    return clipped
+
+
+def check_patch(
+        patch: dict[int, int],
+        processor: ProcessorType,
+        kinds: tuple[str, ...] = (FLASH, EEPROM),
+) -> None:
+    """Device ID bytes must land in programmable memory"""
+    mem_map = memory_map(processor)
+    regions = mem_map.regions_of(kinds)
+    if not regions:
+        return
+    for address in patch:
+        if not any(address in region for region in regions):
+            raise ImageValidationError(
+                f'ID byte address {hex(address)} is out of'
+                f' {processor.value} memory',
+            )
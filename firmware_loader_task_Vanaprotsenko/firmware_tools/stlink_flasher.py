@@ -0,0 +1,427 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+from firmware_tools import STM8, STM32, Device
+from firmware_tools.BaseFlasher import (BaseFlasher, CalledProcessError,
+                                        VerificationError)
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.FlashPipeline import FlashPipeline, Step
+from firmware_tools.OpenOCDSession import OpenOCDSession
+from firmware_tools.utils import cached_merge, search_id_address
+
+
+class STLinkFlasher(BaseFlasher):
+    def __init__(
+            self, device: Device, firmware: str, device_id: str, **kwargs,
+    ) -> None:
+        super().__init__(device, firmware, device_id, **kwargs)
+        self.setup_config = {
+            STM8: self.stm8_cfg,
+            STM32: self.stm32_cfg,
+        }
+        self.setup_target = {
+            STM8: self.target_stm8,
+            STM32: self.target_stm32,
+        }
+        self.custom_openocd_scripts_path = os.path.join(
+            os.path.dirname(__file__), "openocd", "scripts",
+        )
+        # keep one OpenOCD process per probe and talk to it over Tcl
+        self.openocd_session = kwargs.get('openocd_session', False)
+        self.session: Optional[OpenOCDSession] = None
+        # a failed step is retried alone, not the whole unlock-lock chain,
+        # off by default as execute_cmd already tries tries_to_execute_cmd
+        self.step_retries = kwargs.get('step_retries', 0)
+        self.step_backoff = kwargs.get('step_backoff', 0.5)
+        self.pipeline: Optional[FlashPipeline] = None
+        self.openocd_args = ''
+        self.images: list[tuple[str, str]] = []  # (file, write_image args)
+        # sector addresses the differential flash found already on target
+        self.matched_sectors: set[int] = set()
+        self.eeprom_cmds: list[str] = []
+        # firmware is the cached merge, the bootloader is already in it
+        self.merged = False
+        if self.programmer_sn:
+            self.stm8f_cp = (
+                f'{os.path.join(self.stm8f_folder, "stm8flash")}'
+                f' -c stlinkv2 -S {self.programmer_sn} -p'
+            )
+
+    def search_apply_device_id(self) -> None:
+        if self.device.name == "KeyPadPlus":
+            with self.stage('check_image'):
+                self.check_firmware_file()
+            return
+        self.device.id_address = self.device.id_address or search_id_address(
+            self.firmware,
+        )
+        if isinstance(self.device.processor, STM32) and not self.binary_image:
+            # if firmware_tools or bootloader in .bin -> make it .hex
+            with self.stage('merge_files'):
+                if self.bootloader:
+                    # same for the whole batch, converted and merged once
+                    self.firmware = cached_merge(
+                        self.bootloader, self.firmware,
+                        os.path.join(self.cfg_folder, 'merged'),
+                    )
+                    self.merged = True
+                else:
+                    self.firmware = self.hex_from_bin(
+                        self.firmware, int(0x08000000),
+                    )
+
+        self.write_id_with_intelhex()
+        if self.eeprom_file is not None:
+            # ID went to EEPROM, firmware is flashed as is
+            with self.stage('check_image'):
+                self.check_firmware_file()
+
+    def load_firmware_image(self) -> FirmwareImage:
+        if self.merged or not (
+                self.bootloader and isinstance(self.device.processor, STM32)
+        ):
+            return super().load_firmware_image()
+        image = FirmwareImage.from_file(self.bootloader, 0x08000000)
+        image.merge(
+            FirmwareImage.from_file(self.firmware, 0x08020000),
+            overlap='replace',
+        )
+        return image
+
+    def stm8_cfg(self) -> None:
+        processor_type = self.device.processor.value.replace('?', '_')
+        lines = [':0148000000B7', ':0148020000B5']
+        if processor_type.endswith('_8'):
+            lines.append(':0148070000B0')
+        lines += [
+            ':0148080000AF',
+            ':0148090000AE',
+            ':01480A0000AD',
+            ':01480B0000AC',
+            ':01480C0000AB',
+            ':00000001FF',
+        ]
+        self.locker = self.locker or self.cached_script(lines, '.hex')
+
+    def stm32_cfg(self) -> None:
+        if self.openocd_session:
+            # unlock/lock go over the session, no config files needed
+            return
+        pattern = re.sub(r'0$', 'x', self.device.processor.value)
+        unlocker, locker = (
+            self.cached_script(
+                [
+                    'init',
+                    'reset halt',
+                    f'{pattern} {operation} 0',
+                    'reset halt',
+                    'exit',
+                ],
+                '.cfg',
+            )
+            for operation in ('unlock', 'lock')
+        )
+        self.locker = self.locker or locker
+        self.unlocker = self.unlocker or unlocker
+
+    def target_stm8(self) -> None:
+        self.unlock_cmd = f"{self.stm8f_cp} {self.device.processor.value} -u"
+        self.flash_cmd = (
+            f"{self.stm8f_cp} {self.device.processor.value}"
+            f" -s flash -w '{self.firmware}'"
+        )
+        self.eeprom_cmd = (
+            f"{self.stm8f_cp} {self.device.processor.value}"
+            f" -s eeprom -w '{self.eeprom_file}'"
+        )
+        self.lock_cmd = (
+            f"{self.stm8f_cp} {self.device.processor.value}"
+            f" -s opt -w '{self.locker}'"
+        )
+        self.eeprom_cmds = [
+            f"{self.stm8f_cp} {self.device.processor.value}"
+            f" -s {hex(address)} -b {size} -w '{path}'"
+            for address, size, path in self.eeprom_writes
+        ]
+
+    def hex_from_bin(self, file: str, offset: int) -> str:
+        if file.endswith('.bin'):
+            file = FirmwareImage.from_bin(file, offset).write_hex(
+                str(self.work_file(Path(file).stem, '.hex')),
+            )
+        return file
+
+    def target_stm32(self) -> None:
+        if self.firmware_segments:
+            # (file, write_image arguments) per binary segment
+            images = [
+                (os.path.abspath(path), f' {hex(address)} bin')
+                for address, path in self.firmware_segments
+            ]
+        else:
+            # remove '[' and ']' from filename
+            if re.findall(r"\[|]", str(self.firmware)):
+                fw_file_name_no_braces = re.sub(
+                    r"\[|]", '_', os.path.basename(self.firmware),
+                )
+                self.firmware = shutil.copy(
+                    self.firmware, self.work_file(fw_file_name_no_braces),
+                )
+            images = [(os.path.abspath(self.firmware), '')]
+
+        interface = 'interface/stlink.cfg'
+        target = f'target/{self.device.processor.value}.cfg'
+        if self.device.processor == STM32.STM32_L0:
+            special_config = (
+                f'{self.custom_openocd_scripts_path}/'
+                f'target/{self.device.processor.value}.cfg'
+            )
+            if Path(special_config).exists():
+                target = special_config
+
+        self.openocd_args = f"-f {interface} -f '{target}'"
+        self.images = images
+        if self.openocd_session:
+            self.target_stm32_session(interface, target)
+            return
+
+        self.unlock_cmd = (
+            f"openocd -f {interface} -f '{target}'"
+            f" -f '{self.unlocker}'"
+        )
+        self.lock_cmd = (
+            f"openocd -f {interface} -f '{target}'"
+            f" -f '{self.locker}'"
+        )
+        self.flash_cmd = self.stm32_flash_cmd()
+
+    def target_stm32_session(self, interface: str, target: str) -> None:
+        self.session = OpenOCDSession.for_probe(
+            ['-f', interface, '-f', target], self.programmer_sn,
+        )
+        pattern = re.sub(r'0$', 'x', self.device.processor.value)
+        self.unlock_cmd = f'reset halt; {pattern} unlock 0; reset halt'
+        self.lock_cmd = f'reset halt; {pattern} lock 0; reset halt'
+        self.flash_cmd = self.stm32_flash_cmd()
+
+    def stm32_flash_cmd(self) -> str:
+        """Program self.images, at self.speed kHz once reset init is done"""
+        # erase the planned sectors up front, write_image erases on its own
+        # only when the image is not known
+        ranges = self.erase_ranges()
+        erase = ' erase' if ranges is None else ''
+        # reset-init handlers of target scripts set their own clock
+        if self.session is not None:
+            clock = f'adapter speed {self.speed}; ' if self.speed else ''
+            erases = ''.join(
+                f'flash erase_address {hex(start)} {hex(size)}; '
+                for start, size in ranges or ()
+            )
+            writes = ''.join(
+                f'flash write_image{erase} {{{path}}}{args}; '
+                for path, args in self.images
+            )
+            return f'reset init; {clock}{erases}{writes}reset'
+        clock = f" -c 'adapter speed {self.speed}'" if self.speed else ''
+        return (
+            f"openocd {self.openocd_args} -c 'init' -c 'reset init'{clock}"
+            + ''.join(
+                f" -c 'flash erase_address {hex(start)} {hex(size)}'"
+                for start, size in ranges or ()
+            )
+            + ''.join(
+                f" -c 'flash write_image{erase} {path}{args}'"
+                for path, args in self.images
+            )
+            + " -c 'reset' -c 'shutdown'"
+        )
+
+    def execute_cmd(self, cmd: str) -> bool:
+        if self.session is None:
+            return super().execute_cmd(cmd)
+        logging.info(cmd)
+        for attempt in range(self.tries_to_execute_cmd):
+            try:
+                self.session.execute(cmd)
+                return True
+            except CalledProcessError as e:
+                if attempt == self.tries_to_execute_cmd - 1:
+                    raise
+                self.job_metrics.add_retries(
+                    self.current_stage or 'command', 1,
+                )
+                logging.error(e)
+        return True
+
+    def flash_pipeline(self) -> FlashPipeline:
+        if self.pipeline is None:
+            self.pipeline = FlashPipeline(
+                [
+                    Step('unlock', self.timed('unlock', self.unlock)),
+                    Step('flash', self.timed('flash', self.flash)),
+                    # a mismatch is fixed by flashing again, not re-verifying
+                    Step(
+                        'verify', self.timed('verify', self.verify),
+                        retries=0,
+                    ),
+                    Step(
+                        'write_eerprom',
+                        self.timed('eeprom', self.write_eerprom),
+                    ),
+                    Step('lock', self.timed('lock', self.lock)),
+                ],
+                retries=self.step_retries,
+                backoff=self.step_backoff,
+                retry_on=(CalledProcessError, subprocess.TimeoutExpired),
+            )
+        return self.pipeline
+
+    def flash_stm(self, raise_error: bool = True) -> bool:
+        # called again after a failure, resumes from the failed step
+        try:
+            return self.flash_pipeline().run()
+        except VerificationError:
+            self.pipeline.reset('flash')
+            if raise_error:
+                raise
+        except subprocess.CalledProcessError as e:
+            [logging.info(line) for line in e.stderr.decode().split('\n')]
+            if raise_error:
+                raise
+        except CalledProcessError:
+            if raise_error:
+                raise
+        return False
+
+    def unlock(self, raise_error: bool = True) -> bool:
+        if not self.unlocked:
+            return self.safe_execute(self.unlock_cmd, raise_error=raise_error)
+        else:
+            return True
+
+    def flash(self, raise_error: bool = True) -> bool:
+        if self.differential and self.session and self.image is not None:
+            return self.flash_differential()
+        if self.clock_tuner is not None and isinstance(
+                self.device.processor, STM32,
+        ):
+            return self.with_tuned_clock('STlink', self.flash_tuned)
+        return self.safe_execute(self.flash_cmd, raise_error=raise_error)
+
+    def flash_tuned(self) -> bool:
+        """Flash at the speed set by with_tuned_clock"""
+        self.flash_cmd = self.stm32_flash_cmd()
+        return self.safe_execute(self.flash_cmd, raise_error=True)
+
+    def mismatched_sectors(
+            self, sectors: list[tuple[int, int, str, int]],
+    ) -> list[str]:
+        """Addresses of sectors failing target-side checksum, one round trip"""
+        pairs = ' '.join(
+            f'{{{path}}} {hex(address)}' for address, _, path, _ in sectors
+        )
+        return self.session.evaluate(
+            f'reset init; set bad {{}};'
+            f' foreach {{file address}} {{{pairs}}} {{'
+            f' if {{[catch {{verify_image_checksum $file $address bin}}]}}'
+            f' {{lappend bad $address}}}}; set bad',
+        ).split()
+
+    def flash_differential(self) -> bool:
+        """Erase and program only sectors whose target checksum differs"""
+        sectors = self.sector_files()
+        bad = self.mismatched_sectors(sectors)
+        logging.info(f'{len(bad)}/{len(sectors)} sectors differ')
+        self.matched_sectors = {
+            address for address, _, _, _ in sectors
+            if hex(address) not in bad
+        }
+        self.job_metrics.bytes_written['flash'] = sum(
+            size for address, size, _, _ in sectors if hex(address) in bad
+        )
+        writes = ''.join(
+            f'flash erase_address {hex(address)} {hex(size)};'
+            f' flash write_image {{{path}}} {hex(address)} bin; '
+            for address, size, path, _ in sectors
+            if hex(address) in bad
+        )
+        return self.execute_cmd(f'{writes}reset')
+
+    def verify(self, raise_error: bool = True) -> bool:
+        """Compare flashed sectors with the checksums of the image"""
+        if not self.verify_image or self.image is None:
+            return True
+        if self.session is None and not self.openocd_args:
+            # stm8flash targets have no OpenOCD configuration
+            logging.warning(
+                f'No on-target verify for {self.device.processor.value}',
+            )
+            return True
+        sectors = [
+            sector for sector in self.sector_files()
+            if sector[0] not in self.matched_sectors
+        ]
+        if not sectors:
+            return True
+        if self.session is not None:
+            bad = self.mismatched_sectors(sectors)
+            if bad:
+                checksums = {
+                    hex(address): checksum
+                    for address, _, _, checksum in sectors
+                }
+                raise VerificationError(
+                    'Verify failed, expected checksum ' + ', '.join(
+                        f'{address}: {checksums[address]:08x}'
+                        for address in bad
+                    ),
+                )
+            return True
+        checks = ''.join(
+            f" -c 'verify_image_checksum {path} {hex(address)} bin'"
+            for address, _, path, _ in sectors
+        )
+        cmd = (
+            f"openocd {self.openocd_args} -c 'init' -c 'reset init'"
+            f"{checks} -c 'shutdown'"
+        )
+        try:
+            return self.safe_execute(cmd, raise_error=raise_error)
+        except CalledProcessError as e:
+            raise VerificationError(f'Verify failed: {e}') from None
+
+    def write_eerprom(self, raise_error: bool = True) -> bool:
+        if self.eeprom_cmds:
+            return all(
+                self.safe_execute(cmd, raise_error=raise_error)
+                for cmd in self.eeprom_cmds
+            )
+        if self.eeprom_file is not None:
+            return self.safe_execute(self.eeprom_cmd, raise_error=raise_error)
+        else:
+            return True
+
+    def lock(self, raise_error: bool = True) -> bool:
+        return self.safe_execute(self.lock_cmd, raise_error=raise_error)
+
+    def collect_metrics(self) -> None:
+        if self.pipeline is None:
+            return
+        for record in self.pipeline.records.values():
+            stage = 'eeprom' if record.name == 'write_eerprom' else record.name
+            self.job_metrics.add_retries(stage, max(record.attempts - 1, 0))
+
+    def setup_firmware_flashing(self) -> None:
+        self.search_apply_device_id()
+        with self.stage('config'):
+            self.setup_config[type(self.device.processor)]()
+            self.setup_target[type(self.device.processor)]()
+
+    def flash_firmware(self) -> bool:
+        # out of range data is handled by pre-flight, before any programmer
+        return self.flash_stm()
@@ -1,9 +1,15 @@
+import hashlib
 import os
 import re
+import threading
+import zlib
+from functools import lru_cache
+from typing import Optional
 
-from intelhex import IntelHex
+from firmware_tools.FirmwareImage import FirmwareImage
 
 
+@lru_cache(maxsize=256)  # same firmware path for every job of a batch
 def search_id_address(firmware: str) -> int:
     try:
         return int(re.findall(r"0x[\dA-Fa-f]*", firmware)[0], 16)
@@ -11,27 +17,110 @@ def search_id_address(firmware: str) -> int:
         raise ValueError("no ID address in fw name") from None
 
 
-def merge_files(file1_boot: str, file2_firm: str) -> str:
-    boot = IntelHex()
-    firm = IntelHex()
-    merge = IntelHex()
-    boot.fromfile(file1_boot, format='hex')
-    firm.fromfile(file2_firm, format='hex')
+# every byte with its bits in reverse order
+REVERSED_BITS = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
 
-    merge.merge(boot, overlap='error')
-    merge.merge(firm, overlap='replace')
 
-    #  NAME FINAL FILE
-    path = os.path.abspath(os.path.dirname(file1_boot))
-    merge_name = os.path.join(path, "MERGED.hex")
-    merge.write_hex_file(merge_name)
+@lru_cache(maxsize=512)  # sectors without the ID repeat for every device
+def image_checksum(data: bytes) -> int:
+    """
+    CRC32 of OpenOCD verify_image_checksum: MSB first, no final xor.
+    Same polynomial as zlib, which runs LSB first, so it is computed
+    on bit-reversed bytes and the result is reversed back.
+    """
+    crc = zlib.crc32(data.translate(REVERSED_BITS)) ^ 0xFFFFFFFF
+    return int(f'{crc:032b}'[::-1], 2)
+
+
+def merge_files(
+        file1_boot: str, file2_firm: str, merge_name: Optional[str] = None,
+) -> str:
+    merge = FirmwareImage()
+    merge.merge(FirmwareImage.from_hex(file1_boot), overlap='error')
+    merge.merge(FirmwareImage.from_hex(file2_firm), overlap='replace')
+
+    #  NAME FINAL FILE, pass a job workspace path when running in parallel
+    if merge_name is None:
+        path = os.path.abspath(os.path.dirname(file1_boot))
+        merge_name = os.path.join(path, "MERGED.hex")
+    merge.write_hex(merge_name)
+    return merge_name
+
+
+@lru_cache(maxsize=64)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """sha256 of file content, recomputed only when the file changes"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+def cached_merge(
+        bootloader: str,
+        firmware: str,
+        cache_folder: str,
+        boot_offset: int = 0x08000000,
+        firm_offset: int = 0x08020000,
+) -> str:
+    """
+    Merge bootloader and firmware (.hex or .bin) into one hex file stored
+    under the hash of both inputs, so a batch converts and merges once.
+    A .sha256 file next to it holds the hash of the merged content.
+    """
+    key = hashlib.sha256(
+        f'{file_hash(bootloader)}:{boot_offset}:'
+        f'{file_hash(firmware)}:{firm_offset}'.encode(),
+    ).hexdigest()[:32]
+    merge_name = os.path.join(cache_folder, f'{key}.hex')
+    hash_name = os.path.join(cache_folder, f'{key}.sha256')
+    try:
+        with open(hash_name) as file:
+            if file.read() == file_hash(merge_name):
+                return merge_name
+    except OSError:
+        pass
+
+    os.makedirs(cache_folder, exist_ok=True)
+    merge = FirmwareImage()
+    merge.merge(
+        FirmwareImage.from_file(bootloader, boot_offset), overlap='error',
+    )
+    merge.merge(
+        FirmwareImage.from_file(firmware, firm_offset), overlap='replace',
+    )
+    # threads of one process merge the same files in parallel
+    tmp_name = f'{merge_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    merge.write_hex(tmp_name)
+    with open(f'{tmp_name}.sha256', 'w') as file:
+        file.write(file_hash(tmp_name))
+    os.replace(f'{tmp_name}.sha256', hash_name)
+    os.replace(tmp_name, merge_name)
     return merge_name
 
 
-def delete_line(file: str, line_num: int) -> str:
-    with open(file, "r") as f:
-        lines = f.readlines()
-    with open(file, "w") as f:
-        for i, line in enumerate(lines, start=1):
-            i != line_num and f.write(line)
-    return file
+def prune_merges(cache_folder: str, keep_files: int = 8) -> None:
+    """
+    Keep the newest merged files of cached_merge. Not safe while jobs
+    may still flash a merge, called once a batch is over.
+    """
+    if not os.path.isdir(cache_folder):
+        return
+    merged_files = sorted(
+        (entry for entry in os.scandir(cache_folder)
+         if entry.name.endswith('.hex') and len(entry.name) == 36),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in merged_files[:-keep_files]:
+        for path in (entry.path, f'{entry.path[:-4]}.sha256'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,55 @@
+FLASHERS = {'jlink': 'JLink', 'stlink': 'STlink'}  # input -> FlasherFactory
+
+# manifest columns, here so the CLI help needs no manifest import
+FIELDS = (
+    'device', 'firmware', 'device_id', 'subtype', 'color', 'flasher',
+    'programmer_sn', 'region', 'version',
+)
+
+
+def parse_device_id(value: str) -> str:
+    # device id can only be 3 or 4 byte, and it`s hexadecimal
+    try:
+        int(value, 16)
+    except ValueError:
+        raise ValueError('Invalid hexadecimal format.') from None
+    if len(value) not in [6, 8]:
+        raise ValueError(
+            'Invalid length. Device ID should be 3 or 4 bytes'
+            ' in hexadecimal format.',
+        )
+    return value
+
+
+def parse_subtype(value: str) -> int:
+    # subtype only digital in range 0 - 255
+    try:
+        subtype = int(value)
+    except ValueError:
+        raise ValueError(
+            'Invalid input. Subtype should be a number.',
+        ) from None
+    if not 0 <= subtype <= 255:
+        raise ValueError(
+            'Invalid range. Subtype should be a number between 0 and 255.',
+        )
+    return subtype
+
+
+def parse_yes_no(value: str) -> bool:
+    answer = value.lower()
+    if answer not in ('y', 'n'):
+        raise ValueError(
+            "Invalid choice. Please enter 'y' for yes or 'n' for no.",
+        )
+    return answer == 'y'
+
+
+def parse_flasher(value: str) -> str:
+    """Return FlasherFactory key for JLink/STLink in any case"""
+    try:
+        return FLASHERS[value.lower()]
+    except KeyError:
+        raise ValueError(
+            "Invalid choice. Please enter 'JLink' or 'STLink'.",
+        ) from None
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
+import argparse
+import sys
 from itertools import zip_longest
+from typing import TYPE_CHECKING, Optional
 
-from firmware_tools import Device, JLinkFlasher, STLinkFlasher
-from firmware_tools.devices import INTRUSION, SMART_HOME, SIRENS, FIRE, OTHER
+from firmware_tools import Device
+from firmware_tools.validation import (FIELDS, parse_device_id,
+                                       parse_flasher, parse_subtype,
+                                       parse_yes_no)
+
+if TYPE_CHECKING:
+    from firmware_tools import JLinkFlasher, STLinkFlasher
+    from firmware_tools.ClockTuner import ClockTuner
+    from firmware_tools.FirmwareLibrary import FirmwareLibrary
+    from firmware_tools.FlashMetrics import FlashMetrics
+    from firmware_tools.IdAllocator import IdAllocator
+    from firmware_tools.manifest import ManifestRow
+    from firmware_tools.ProbePool import ProbePool
+
+# flashers, the device catalog and the ID database are imported where they
+# are used, --help and --list-devices must not wait for them
 
 
 class Loader:
@@ -36,11 +53,14 @@ class Loader:
         print()
 
     def get_device(self) -> Device:
+        from firmware_tools import devices
+
         print("Choose device category:")
         
-        categories = ["INTRUSION", "SMART_HOME", "SIRENS", "FIRE", "OTHER"]
-        category_mapping = {str(i): device for i, device in enumerate(
-            [INTRUSION, SMART_HOME, SIRENS, FIRE, OTHER], start=1)
+        categories = devices.CATEGORIES
+        category_mapping = {
+            str(i): getattr(devices, category)
+            for i, category in enumerate(categories, start=1)
         }
         for i, category in enumerate(categories, start=1):
             print(f"{i}. {category}")
@@ -86,29 +106,20 @@ class Loader:
             device_id = input("Enter device ID (hexadecimal, 3 or 4 bytes): ")
 
             try:
-                int(device_id, 16)
-            except ValueError:
-                print("Invalid hexadecimal format. Please try again.")
-                continue
-            if len(device_id) in [6, 8]:
-                return device_id
-            else:
-                print("Invalid length. Device ID should be 3 or 4 bytes in hexadecimal format. Please try again.")
+                return parse_device_id(device_id)
+            except ValueError as e:
+                print(f"{e} Please try again.")
 
     def color_to_flash(self) -> bool:
         while True:
             flash_color = input(
                 "Do you want to flash in color? (y/n): "
-            ).lower()
+            )
 
-            if flash_color == 'y':
-                return True
-            elif flash_color == 'n':
-                return False
-            else:
-                print(
-                    "Invalid choice. Please enter 'y' for yes or 'n' for no."
-                )
+            try:
+                return parse_yes_no(flash_color)
+            except ValueError as e:
+                print(e)
 
     def choose_subtype(self) -> int:
         # TODO subtype only digital in range 0 - 255
@@ -116,24 +127,188 @@ class Loader:
             subtype = input("Enter subtype (0 - 255): ")
 
             try:
-                subtype_int = int(subtype)
-                if 0 <= subtype_int <= 255:
-                    return subtype_int
-                else:
-                    print(
-                        "Invalid range. Subtype should be a number between 0 and 255. Please try again."
-                    )
-            except ValueError:
-                print(
-                    "Invalid input. Subtype should be a number. Please try again."
-                )
+                return parse_subtype(subtype)
+            except ValueError as e:
+                print(f"{e} Please try again.")
 
     def choose_flasher(self) -> type[JLinkFlasher] | type[STLinkFlasher]:
+        from firmware_tools.flasher_factory import FlasherFactory
+
         while True:
-            flasher_type = input("Choose flasher type (JLink/STLink): ").lower()
+            flasher_type = input("Choose flasher type (JLink/STLink): ")
 
-            if flasher_type in ['jlink', 'stlink']:
-                return JLinkFlasher if flasher_type == 'jlink' else STLinkFlasher
-            else:
-                print("Invalid choice. Please enter 'JLink' or 'STLink'.")
+            try:
+                return FlasherFactory.get_flasher(parse_flasher(flasher_type))
+            except ValueError as e:
+                print(e)
+
+    def batch(
+            self,
+            manifest: str,
+            max_workers: Optional[int] = None,
+            allocator: Optional[IdAllocator] = None,
+            metrics: Optional[FlashMetrics] = None,
+            library: Optional[FirmwareLibrary] = None,
+            pool: Optional[ProbePool] = None,
+            clock_tuner: Optional[ClockTuner] = None,
+    ) -> bool:
+        """Flash every valid manifest row, never prompt"""
+        from firmware_tools.flash_orchestrator import FlashOrchestrator
+        from firmware_tools.manifest import read_manifest
+
+        # invalid rows are reported while reading, only jobs are kept
+        rows, total = [], 0
+        for row in read_manifest(
+                manifest, allocator=allocator, library=library,
+        ):
+            total += 1
+            if row.job is None:
+                self.print_row(row, f"INVALID: {row.error}")
+                continue
+            if clock_tuner is not None:
+                row.job.options['clock_tuner'] = clock_tuner
+            rows.append(row)
+        batch = FlashOrchestrator(max_workers, metrics, pool).run(
+            [row.job for row in rows],
+        )
+        for row, result in zip(rows, batch.results):
+            status = "OK" if result.success else f"FAILED: {result.error}"
+            self.print_row(row, status)
+        print(
+            f"{len(batch.succeeded)}/{total} devices flashed"
+            f" in {batch.wall_time:.1f}s"
+            f" ({batch.devices_per_minute:.1f} devices/min)"
+        )
+        if metrics is not None and metrics.bottleneck():
+            print(f"Slowest stage: {metrics.bottleneck()}")
+        for probe in pool.summary() if pool is not None else []:
+            print(
+                f"Probe {probe['serial']}: {probe['jobs']} jobs,"
+                f" {probe['failures']} failed,"
+                f" {probe['mean_cycle_time']:.1f}s per device"
+                f"{' DEGRADED' if probe['degraded'] else ''}"
+            )
+        return len(batch.succeeded) == total
+
+    @staticmethod
+    def print_row(row: ManifestRow, status: str) -> None:
+        print(
+            f"{row.line:5}. {row.data['device']}"
+            f" {row.data['device_id']} {status}"
+        )
+
+
+def list_devices() -> None:
+    """Catalog names as the manifest device column expects them"""
+    from firmware_tools.DeviceCatalog import load_catalog
+
+    catalog = load_catalog()
+    for category in catalog.categories:
+        for device in catalog.category(category):
+            print(f"{category:10} {device.name}")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Flash devices listed in a manifest without prompts.",
+    )
+    parser.add_argument(
+        "manifest", nargs="?",
+        help=f"CSV or JSONL file, columns: {', '.join(FIELDS)}",
+    )
+    parser.add_argument(
+        "--list-devices", action="store_true",
+        help="print the device catalog and exit",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="parallel programmers (default: one per programmer_sn)",
+    )
+    parser.add_argument(
+        "--id-db", default=None,
+        help="device ID database, rows without device_id get the next ID",
+    )
+    parser.add_argument(
+        "--station", default=None,
+        help="station name in the ID database (default: host name)",
+    )
+    parser.add_argument(
+        "--metrics-prom", default=None,
+        help="write stage histograms to this Prometheus textfile",
+    )
+    parser.add_argument(
+        "--metrics-json", default=None,
+        help="write the batch timing summary to this JSON file",
+    )
+    parser.add_argument(
+        "--library", default=None,
+        help="firmware folder, rows without firmware take the latest"
+             " version for their device and region from it",
+    )
+    parser.add_argument(
+        "--library-index", default=None,
+        help="keep the firmware index in this file between runs",
+    )
+    parser.add_argument(
+        "--probe-pool", action="store_true",
+        help="find attached ST-Link and J-Link probes, rows without"
+             " programmer_sn take any idle healthy one",
+    )
+    parser.add_argument(
+        "--clock-cache", default=None,
+        help="tune the programming clock per probe and processor, keep"
+             " the results in this file",
+    )
+    args = parser.parse_args(argv)
+    if args.list_devices:
+        list_devices()
+        return 0
+    if args.manifest is None:
+        parser.error("the following arguments are required: manifest")
+
+    import logging
+
+    from firmware_tools.FlashMetrics import FlashMetrics
+    from firmware_tools.IdAllocator import IdAllocator
+
+    logging.basicConfig(
+        filemode="a+", format='%(asctime)s %(levelname)s %(message)s',
+        level=logging.INFO,
+    )
+    allocator = None
+    if args.id_db:
+        allocator = IdAllocator(args.id_db, args.station)
+    library = None
+    if args.library:
+        from firmware_tools.FirmwareLibrary import FirmwareLibrary
+
+        library = FirmwareLibrary(args.library, args.library_index)
+        library.scan()
+    pool = None
+    if args.probe_pool:
+        from firmware_tools.ProbePool import ProbePool
+
+        pool = ProbePool()
+    clock_tuner = None
+    if args.clock_cache:
+        from firmware_tools.ClockTuner import ClockTuner
+
+        clock_tuner = ClockTuner(args.clock_cache)
+    metrics = FlashMetrics()
+    try:
+        return 0 if Loader().batch(
+            args.manifest, args.workers, allocator, metrics, library, pool,
+            clock_tuner,
+        ) else 1
+    finally:
+        if allocator is not None:
+            allocator.close()
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
                 
\ No newline at end of file
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'benchmarks'))
+
+import bench_flash  # noqa: E402
+import bench_startup  # noqa: E402
+
+
+@pytest.fixture
+def stubs(monkeypatch, tmp_path):
+    log = tmp_path / 'calls.log'
+    monkeypatch.setenv(
+        'PATH', bench_flash.STUBS_DIR + os.pathsep + os.environ['PATH'],
+    )
+    monkeypatch.setenv('FAKE_PROGRAMMER_SCALE', '0')
+    monkeypatch.setenv('FAKE_PROGRAMMER_LOG', str(log))
+    return log
+
+
+@pytest.mark.parametrize('name', ['stm8_flash_8k', 'stm32_64k', 'cc1310_64k'])
+def test_scenario_runs_on_stubs(stubs, tmp_path, name):
+    scenario = next(s for s in bench_flash.SCENARIOS if s.name == name)
+    result = bench_flash.run_scenario(scenario, str(tmp_path), 2, 1)
+
+    assert result['failed'] == 0
+    assert result['devices_per_minute'] > 0
+    calls = stubs.read_text().splitlines()
+    assert calls and all(' ok ' in call for call in calls)
+
+
+def test_compare_flags_regressions():
+    baselines = {
+        'a': {'per_device_s': 1.0, 'devices_per_minute': 60.0, 'failed': 0},
+    }
+    assert bench_flash.compare(
+        {'a': {'per_device_s': 1.2, 'devices_per_minute': 50.0, 'failed': 0}},
+        baselines, 0.25,
+    ) == []
+    assert len(bench_flash.compare(
+        {'a': {'per_device_s': 1.3, 'devices_per_minute': 40.0, 'failed': 0}},
+        baselines, 0.25,
+    )) == 2
+    assert bench_flash.compare(
+        {'a': {'per_device_s': 0.5, 'devices_per_minute': 90.0, 'failed': 1}},
+        baselines, 0.25,
+    ) == ['a: 1 failed, baseline 0']
+
+
+def test_baselines_recorded_without_failures():
+    with open(bench_flash.BASELINES) as file:
+        scenarios = json.load(file)['scenarios']
+    assert all(result['failed'] == 0 for result in scenarios.values())
+
+
+@pytest.mark.parametrize('name', list(bench_startup.COMMANDS))
+def test_cli_startup_skips_heavy_imports(name):
+    assert bench_startup.heavy_imports(bench_startup.COMMANDS[name]) == []
@@ -0,0 +1,63 @@
+from firmware_tools import (
+    CC, STM8, STM32, Device, JLinkFlasher, STLinkFlasher,
+)
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage
+
+
+def test_stm32_bootloader_and_firmware_stay_binary(tmp_path):
+    boot, firm = tmp_path / 'boot.bin', tmp_path / 'firm.bin'
+    boot.write_bytes(b'\xAA' * 64)
+    firm.write_bytes(b'\xBB' * 64)
+    device = Device(
+        'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+        id_address=0x08020010,
+    )
+    flasher = STLinkFlasher(
+        device, str(firm), '1ABC2D3E',
+        bootloader=str(boot), binary_image=True,
+    )
+    flasher.cfg_folder = str(tmp_path)
+    flasher.setup_firmware_flashing()
+
+    addresses = [address for address, _ in flasher.firmware_segments]
+    assert addresses == [0x08000000, 0x08020000]
+    assert f"{flasher.firmware_segments[1][1]} 0x8020000 bin'" in (
+        flasher.flash_cmd
+    )
+    app = FirmwareImage.from_bin(flasher.firmware_segments[1][1], 0x08020000)
+    assert bytes(app.tobinarray()[0x10:0x14]) == bytes.fromhex('3E2DBC1A')
+    assert not list(tmp_path.glob('*.hex'))
+
+
+def test_stm8_blank_eeprom_is_written_as_binary(tmp_path):
+    device = Device(
+        'LQC_Wireless', STM8.STM8_6, DevRadio.OTHER, id_address=0x1000,
+    )
+    flasher = STLinkFlasher(
+        device, 'fw.hex', '1ABC2D3E', binary_image=True,
+    )
+    flasher.cfg_folder = str(tmp_path)
+    flasher.write_id_with_intelhex()
+
+    assert str(flasher.eeprom_file).endswith('eeprom_to_flash.bin')
+    data = flasher.eeprom_file.read_bytes()
+    assert len(data) == 2048
+    assert data[:4] == bytes.fromhex('1ABC2D3E')
+
+
+def test_jlink_loads_binary_segments_at_their_address(tmp_path):
+    firm = tmp_path / 'firm.hex'
+    image = FirmwareImage.from_bytes(b'\xBB' * 0x100, 0x8000)
+    image.merge(FirmwareImage.from_bytes(b'\xCC' * 0x10, 0x10000))
+    image.write_hex(str(firm))
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x8080,
+    )
+    flasher = JLinkFlasher(device, str(firm), '1ABC2D', binary_image=True)
+    flasher.cfg_folder = str(tmp_path)
+    flasher.setup_firmware_flashing()
+
+    loads = [line for line in flasher.cc13x0_lines() if 'loadfile' in line]
+    assert [line.split()[2] for line in loads] == ['0x8000', '0x10000']
+    assert all(line.split()[1].endswith('.bin') for line in loads)
@@ -0,0 +1,201 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from firmware_tools import CC, STM32, Device, JLinkFlasher, STLinkFlasher
+from firmware_tools.BaseFlasher import (BaseFlasher, CalledProcessError,
+                                        VerificationError)
+from firmware_tools.classes import DevRadio
+from firmware_tools.ClockTuner import ClockTuner
+
+KEY = ('JLink', 'SN1', 'cc1310')
+
+
+def succeed(tuner, speed, times=1):
+    for _ in range(times):
+        tuner.record(*KEY, speed, True)
+
+
+def test_promotes_after_good_jobs():
+    tuner = ClockTuner(promote_after=3)
+    assert tuner.plan(*KEY) == [1000, 500]
+
+    succeed(tuner, 1000, 3)
+    assert tuner.plan(*KEY) == [2000, 1000, 500]
+    succeed(tuner, 2000)
+    assert tuner.plan(*KEY) == [2000, 1000]
+    assert tuner.states['JLink/SN1/cc1310'].speed == 2000
+
+
+def test_failed_speed_is_not_tried_again():
+    tuner = ClockTuner(promote_after=1)
+    succeed(tuner, 1000)
+    tuner.record(*KEY, 2000, False)
+    succeed(tuner, 1000, 5)
+
+    assert tuner.plan(*KEY) == [1000, 500]
+
+
+def test_backs_off_only_when_slower_speed_works():
+    tuner = ClockTuner()
+    tuner.record(*KEY, 1000, False)
+    tuner.record(*KEY, 500, False)  # no device on the fixture
+    assert tuner.plan(*KEY) == [1000, 500]
+
+    tuner.record(*KEY, 1000, False)
+    succeed(tuner, 500)
+    state = tuner.states['JLink/SN1/cc1310']
+    assert (state.speed, state.ceiling) == (500, 1000)
+    assert tuner.plan('JLink', 'SN2', 'cc1310') == [1000, 500]
+
+
+def test_results_are_kept_in_file(tmp_path):
+    path = str(tmp_path / 'clock.json')
+    tuner = ClockTuner(path, promote_after=1)
+    succeed(tuner, 1000)
+    succeed(tuner, 2000)
+    other = ClockTuner(path)
+    other.record('STlink', '', 'stm32u5x', 1800, False)
+    other.record('STlink', '', 'stm32u5x', 1200, True)
+
+    with open(path) as file:
+        data = json.load(file)
+    assert data['JLink/SN1/cc1310']['speed'] == 2000
+    assert data['STlink/-/stm32u5x'] == {
+        'speed': 1200, 'ceiling': 1800, 'streak': 1,
+    }
+    assert ClockTuner(path).plan(*KEY) == [2000, 1000]
+
+
+def speed_of(cmd):
+    with open(cmd.split()[-1]) as file:
+        return next(
+            int(line.split()[1]) for line in file if line.startswith('Speed')
+        )
+
+
+def test_jlink_retries_slower():
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x1000,
+    )
+    tuner = ClockTuner(promote_after=1)
+    succeed(tuner, 1000)
+    flasher = JLinkFlasher(
+        device, 'fw.hex', '1ABC2D', programmer_sn='SN1', clock_tuner=tuner,
+    )
+    flasher.config_file = flasher.cc13x0_cfg()
+    speeds = []
+
+    def execute_cmd(cmd):
+        speeds.append(speed_of(cmd))
+        if speeds[-1] > 1000:
+            raise CalledProcessError('Could not connect to target')
+        return True
+
+    with patch.object(flasher, 'execute_cmd', side_effect=execute_cmd):
+        assert flasher.flash_firmware()
+
+    assert speeds == [2000, 1000]
+    assert flasher.job_metrics.retries == {'flash': 1}
+    assert tuner.plan(*KEY) == [1000, 500]
+
+
+def test_jlink_without_tuner_keeps_default():
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x1000,
+    )
+    flasher = JLinkFlasher(device, 'fw.hex', '1ABC2D')
+    flasher.config_file = flasher.cc13x0_cfg()
+
+    assert speed_of(flasher.jlink_cmd()) == 1000
+
+
+def test_stm32_flash_sets_adapter_speed(tmp_path):
+    device = Device(
+        'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+        id_address=0x08000400,
+    )
+    firmware = tmp_path / 'fw.hex'
+    firmware.write_text(':00000001FF\n')
+    tuner = ClockTuner()
+    flasher = STLinkFlasher(
+        device, str(firmware), '1ABC2D', clock_tuner=tuner,
+    )
+    flasher.stm32_cfg()
+    flasher.target_stm32()
+    commands = []
+
+    def execute_cmd(cmd):
+        commands.append(cmd)
+        if "adapter speed 1800'" in cmd:
+            raise CalledProcessError('SWD DPIDR 0x00000000 mismatch')
+        return True
+
+    with patch.object(flasher, 'execute_cmd', side_effect=execute_cmd):
+        assert flasher.flash()
+
+    assert len(commands) == 2
+    assert "-c 'reset init' -c 'adapter speed 1200'" in commands[1]
+    # the write alone does not count, run() reports the finished job
+    assert flasher.tuned_clock == ('STlink', '', 'stm32u5x', 1200)
+    assert tuner.states['STlink/-/stm32u5x'].speed == 1800
+
+
+def test_all_speeds_failing_raises():
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x1000,
+    )
+    flasher = JLinkFlasher(
+        device, 'fw.hex', '1ABC2D', clock_tuner=ClockTuner(),
+    )
+    with patch.object(
+            flasher, 'execute_cmd', side_effect=CalledProcessError('no'),
+    ):
+        with pytest.raises(CalledProcessError):
+            flasher.flash_firmware()
+    assert flasher.clock_tuner.plan('JLink', '', 'cc1310') == [1000, 500]
+
+
+class VerifiedFlasher(BaseFlasher):
+    verified = True
+
+    def setup_firmware_flashing(self) -> None:
+        pass
+
+    def flash_firmware(self) -> bool:
+        self.with_tuned_clock('JLink', lambda: True)
+        if not self.verified:
+            raise VerificationError('Verify failed')
+        return True
+
+
+@pytest.mark.parametrize('verified', [True, False])
+def test_speed_counts_only_after_verify(verified):
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x1000,
+    )
+    tuner = ClockTuner()
+    flasher = VerifiedFlasher(device, 'fw.hex', '1ABC2D', clock_tuner=tuner)
+    flasher.verified = verified
+
+    assert flasher.run() is verified
+    assert tuner.states['JLink/-/cc1310'].streak == int(verified)
+
+
+def test_stations_share_file(tmp_path):
+    path = str(tmp_path / 'clock.json')
+
+    def station(index):
+        tuner = ClockTuner(path)
+        for speed in (2000, 1000):
+            tuner.record('JLink', f'SN{index}', 'cc1310', speed, True)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(station, range(8)))
+
+    with open(path) as file:
+        assert len(json.load(file)) == 8
+    assert not os.path.exists(f'{path}.lock')
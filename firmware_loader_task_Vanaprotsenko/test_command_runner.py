@@ -0,0 +1,93 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from firmware_tools import STM32, Device, STLinkFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.CommandRunner import CommandRunner
+
+
+def script(code):
+    return [sys.executable, '-c', code]
+
+
+def test_lines_are_streamed_as_events():
+    events = []
+    result = CommandRunner(on_event=events.append).run(
+        script("import sys; print('a'); print('b', file=sys.stderr)"),
+    )
+
+    assert result.success
+    assert sorted(result.lines) == ['a', 'b']
+    kinds = [event.kind for event in events]
+    assert kinds[0] == 'start' and kinds[-1] == 'exit'
+    assert kinds.count('line') == 2
+
+
+def test_silent_tool_is_killed_after_stall_timeout():
+    start = time.monotonic()
+    result = CommandRunner(stall_timeout=0.3).run(
+        script("print('hi', flush=True); import time; time.sleep(30)"),
+    )
+
+    assert result.stalled and not result.success
+    assert result.lines == ['hi']
+    assert time.monotonic() - start < 5
+
+
+def test_failure_pattern_stops_tool_early():
+    start = time.monotonic()
+    result = CommandRunner(failure_patterns=('Error: open failed',)).run(
+        script(
+            "print('Error: open failed', flush=True);"
+            " import time; time.sleep(30)",
+        ),
+    )
+
+    assert result.failure_match == 'Error: open failed'
+    assert not result.success
+    assert time.monotonic() - start < 5
+
+
+def test_success_pattern_accepts_nonzero_exit():
+    result = CommandRunner(success_patterns=(r'using 240 kHz',)).run(
+        script("print('Info : using 240 kHz'); raise SystemExit(1)"),
+    )
+    assert result.returncode == 1 and result.success
+
+
+def test_error_after_success_pattern_fails():
+    result = CommandRunner(success_patterns=(r'using 240 kHz',)).run(
+        script(
+            "print('Info : using 240 kHz');"
+            " print('Error: error writing to flash at address 0x08000000');"
+            " raise SystemExit(1)",
+        ),
+    )
+    assert result.success_match is None and not result.success
+
+
+def test_flasher_reports_stall_as_timeout():
+    device = Device('MotionCam', STM32.STM32_U5, DevRadio.INTRUSION)
+    flasher = STLinkFlasher(device, 'fw.hex', '1ABC2D', stall_timeout=0.3)
+    with pytest.raises(subprocess.TimeoutExpired):
+        flasher.execute_cmd(
+            f"'{sys.executable}' -c 'import time; time.sleep(30)'",
+        )
+
+
+def test_silent_flash_write_gets_time_for_image_size():
+    device = Device('MotionCam', STM32.STM32_U5, DevRadio.INTRUSION)
+    flasher = STLinkFlasher(
+        device, 'fw.hex', '1ABC2D', stall_timeout=0.3, min_write_rate=1024,
+    )
+    flasher.add_written('flash', 2048)  # two seconds to write
+    cmd = f"'{sys.executable}' -c 'import time; time.sleep(1)'"
+
+    with flasher.stage('flash'):
+        assert flasher.execute_cmd(cmd)
+    with pytest.raises(subprocess.TimeoutExpired):
+        with flasher.stage('unlock'):
+            flasher.execute_cmd(cmd)
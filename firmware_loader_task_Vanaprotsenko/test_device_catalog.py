@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from firmware_tools.classes import STM8, STM32, DevFibra, DevRadio
+from firmware_tools.devices import DEVICES, INTRUSION, SIRENS
+from firmware_tools.DeviceCatalog import (CatalogError, DeviceCatalog,
+                                          load_catalog)
+
+
+def test_catalog_keeps_module_lists():
+    catalog = load_catalog()
+    assert len(catalog) == len(DEVICES) == 19
+    assert INTRUSION[0].name == 'MotionCam'
+    assert INTRUSION is catalog.category('INTRUSION')
+    assert [d.name for d in DEVICES[:5]] == sorted(d.name for d in INTRUSION)
+    assert SIRENS[1].family == DevFibra.SIRENS_FIBRA
+
+
+def test_catalog_lookup():
+    catalog = load_catalog()
+    assert catalog['GlassProtectS'].subtype == 1
+    assert catalog.get('Unknown') is None
+    assert 'KeyPad' in catalog
+    assert all(
+        d.processor == STM8.STM8_8 for d in catalog.by_processor[STM8.STM8_8]
+    )
+    assert len(catalog.by_family[DevRadio.FIRE]) == 3
+    with pytest.raises(KeyError):
+        catalog['Unknown']
+
+
+def test_catalog_layout(tmp_path):
+    path = tmp_path / 'devices.json'
+    path.write_text(json.dumps({'TEST': [
+        {
+            'name': 'Probe', 'processor': 'STM8_6', 'family': 'OTHER',
+            'id_address': '0x1010', 'subtype_address': '0x1020',
+        },
+        {
+            'name': 'Cam', 'processor': 'STM32_U5', 'family': 'INTRUSION',
+            'hardware_type': {'A': '0x10', 'B': '0x11'},
+        },
+    ]}))
+    catalog = DeviceCatalog.from_file(str(path))
+    probe = catalog['Probe']
+    assert probe.id_address == 0x1010
+    assert probe.subtype_address == 0x1020
+    cam = catalog['Cam']
+    assert cam.processor == STM32.STM32_U5
+    assert cam.hardware_type == {'A': 0x10, 'B': 0x11}
+
+
+def test_catalog_errors(tmp_path):
+    path = tmp_path / 'devices.json'
+    path.write_text(json.dumps({'TEST': [
+        {'name': 'A', 'processor': 'STM9', 'family': 'OTHER'},
+    ]}))
+    with pytest.raises(CatalogError):
+        DeviceCatalog.from_file(str(path))
+    path.write_text(json.dumps({'TEST': [
+        {'name': 'A', 'processor': 'STM8_6', 'family': 'OTHER'},
+        {'name': 'A', 'processor': 'STM8_8', 'family': 'OTHER'},
+    ]}))
+    with pytest.raises(CatalogError):
+        DeviceCatalog.from_file(str(path))
@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+from firmware_tools import STM8, Device, STLinkFlasher
+from firmware_tools.classes import DevRadio
+
+
+def make_flasher(tmp_path, name='DoorProtect', **kwargs):
+    device = Device(
+        name, STM8.STM8_6, DevRadio.INTRUSION, id_address=0x1010, subtype=3,
+    )
+    flasher = STLinkFlasher(device, 'fw.hex', '1ABC2D', **kwargs)
+    flasher.cfg_folder = str(tmp_path)
+    return flasher
+
+
+def test_delta_mode_writes_only_changed_bytes(tmp_path):
+    flasher = make_flasher(tmp_path, eeprom_delta=True, color=2)
+    with patch('subprocess.run') as run:
+        flasher.write_id_with_intelhex()
+    run.assert_not_called()  # no EEPROM read
+
+    address, size, path = flasher.eeprom_writes[0]
+    assert (address, size) == (0x1010, 6)
+    with open(path, 'rb') as file:
+        assert file.read() == bytes.fromhex('1ABC2D00') + b'\x03\x02'
+
+    flasher.target_stm8()
+    assert flasher.eeprom_cmds == [
+        f"{flasher.stm8f_cp} stm8l151?6 -s 0x1010 -b 6 -w '{path}'",
+    ]
+
+
+def test_full_erase_device_keeps_whole_eeprom(tmp_path):
+    flasher = make_flasher(tmp_path, 'LQC_Wireless', eeprom_delta=True)
+    flasher.write_id_with_intelhex()
+
+    assert flasher.eeprom_writes == []
+    assert flasher.eeprom_file.name == 'eeprom_to_flash.hex'
+    assert str(flasher.eeprom_file.parent) == flasher.workspace.path
+    flasher.cleanup()
+    assert not flasher.eeprom_file.exists()
@@ -0,0 +1,175 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from intelhex import IntelHex
+
+from firmware_tools import STM32, Device, STLinkFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage, HexFormatError
+from firmware_tools.utils import (cached_merge, image_checksum, merge_files,
+                                  prune_merges)
+
+
+@pytest.fixture
+def hex_file(tmp_path):
+    ih = IntelHex()
+    ih.frombytes(bytes(range(256)) * 300, 0x0800FF00)
+    ih[0x08080000] = 0x42
+    ih.start_addr = {'EIP': 0x08000123}
+    path = str(tmp_path / 'fw.hex')
+    ih.write_hex_file(path)
+    return path
+
+
+def test_hex_round_trip_matches_intelhex(hex_file, tmp_path):
+    image = FirmwareImage.from_hex(hex_file)
+    out = image.write_hex(str(tmp_path / 'out.hex'))
+
+    with open(hex_file) as expected, open(out) as result:
+        assert result.read() == expected.read()
+    assert len(image.starts) == 2
+
+
+def test_bad_checksum_is_rejected(tmp_path):
+    path = tmp_path / 'bad.hex'
+    path.write_text(':0100000001FF\n:00000001FF\n')
+    with pytest.raises(HexFormatError):
+        FirmwareImage.from_hex(str(path))
+
+
+def test_patch_outside_segments_adds_bytes():
+    image = FirmwareImage.blank(4096, 4100)
+    image.patch({4100: 1, 4102: 2})
+
+    assert image.starts == [4096, 4102]
+    assert image[4100] == 1 and 4101 not in image
+
+
+@pytest.mark.parametrize('overlap, expected', [
+    ('replace', b'\x01\x01\x02\x02\x02'),
+    ('ignore', b'\x01\x01\x01\x01\x02'),
+])
+def test_merge_overlap_policy(overlap, expected):
+    image = FirmwareImage.from_bytes(b'\x01' * 4, 0x100)
+    image.merge(FirmwareImage.from_bytes(b'\x02' * 3, 0x102), overlap)
+    assert image.tobinarray() == expected
+
+
+def test_merge_overlap_error():
+    image = FirmwareImage.from_bytes(b'\x01' * 4, 0x100)
+    with pytest.raises(ValueError):
+        image.merge(FirmwareImage.from_bytes(b'\x02', 0x103))
+
+
+def test_bin_round_trip(tmp_path):
+    data = bytes(range(200))
+    path = FirmwareImage.from_bytes(data, 0x08000000).write_bin(
+        str(tmp_path / 'fw.bin'),
+    )
+    image = FirmwareImage.from_file(path, 0x08000000)
+    assert image.min_address() == 0x08000000
+    assert image.tobinarray() == data
+
+
+def test_merge_files(tmp_path):
+    boot, firm = tmp_path / 'boot.hex', tmp_path / 'firm.hex'
+    FirmwareImage.from_bytes(b'\xAA' * 32, 0x08000000).write_hex(str(boot))
+    FirmwareImage.from_bytes(b'\xBB' * 32, 0x08020000).write_hex(str(firm))
+
+    merged = IntelHex(merge_files(str(boot), str(firm)))
+    assert merged[0x08000000] == 0xAA
+    assert merged[0x0802001F] == 0xBB
+
+
+def test_cached_merge_runs_once_per_inputs(tmp_path, monkeypatch):
+    boot, firm = tmp_path / 'boot.bin', tmp_path / 'firm.bin'
+    boot.write_bytes(b'\xAA' * 64)
+    firm.write_bytes(b'\xBB' * 64)
+    calls = []
+    from_file = FirmwareImage.from_file
+    monkeypatch.setattr(
+        FirmwareImage, 'from_file',
+        classmethod(lambda cls, *args: calls.append(args) or from_file(*args)),
+    )
+    cache = str(tmp_path / 'merged')
+
+    first = cached_merge(str(boot), str(firm), cache)
+    assert cached_merge(str(boot), str(firm), cache) == first
+    assert len(calls) == 2
+
+    firm.write_bytes(b'\xCC' * 64)
+    second = cached_merge(str(boot), str(firm), cache)
+    assert second != first
+    assert IntelHex(second)[0x08020000] == 0xCC
+    assert IntelHex(second)[0x08000000] == 0xAA
+
+
+def test_merged_firmware_is_not_merged_again(tmp_path, monkeypatch):
+    boot, firm = tmp_path / 'boot.bin', tmp_path / 'firm.bin'
+    boot.write_bytes(b'\xAA' * 64)
+    firm.write_bytes(b'\xBB' * 64)
+    calls = []
+    from_file = FirmwareImage.from_file
+    monkeypatch.setattr(
+        FirmwareImage, 'from_file',
+        classmethod(lambda cls, *args: calls.append(args) or from_file(*args)),
+    )
+    for device_id in ('1ABC2D3E', '1ABC2D3F'):
+        device = Device(
+            'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+            id_address=0x08020010,
+        )
+        flasher = STLinkFlasher(
+            device, str(firm), device_id, bootloader=str(boot),
+        )
+        flasher.cfg_folder = str(tmp_path)
+        flasher.search_apply_device_id()
+
+    # boot and firm once for the batch, then the merge once per job
+    assert [args[0] for args in calls].count(str(boot)) == 1
+    assert len(calls) == 4
+    assert IntelHex(str(flasher.firmware))[0x08000000] == 0xAA
+
+
+def test_cached_merge_checks_content_and_threads(tmp_path):
+    boot, firm = tmp_path / 'boot.bin', tmp_path / 'firm.bin'
+    boot.write_bytes(b'\xAA' * 64)
+    firm.write_bytes(b'\xBB' * 0x4000)
+    cache = str(tmp_path / 'merged')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        merged = set(executor.map(
+            lambda _: cached_merge(str(boot), str(firm), cache), range(16),
+        ))
+    assert len(merged) == 1
+    path = merged.pop()
+    assert sorted(os.listdir(cache)) == sorted(
+        [os.path.basename(path), os.path.basename(path)[:-4] + '.sha256'],
+    )
+
+    with open(path, 'w') as file:
+        file.write(':00000001FF\n')  # truncated by a crash
+    assert cached_merge(str(boot), str(firm), cache) == path
+    assert IntelHex(path)[0x08020000] == 0xBB
+
+
+def test_prune_merges_keeps_newest(tmp_path):
+    boot = tmp_path / 'boot.bin'
+    boot.write_bytes(b'\xAA' * 16)
+    cache = str(tmp_path / 'merged')
+    paths = []
+    for value in range(3):
+        firm = tmp_path / f'firm{value}.bin'
+        firm.write_bytes(bytes([value]) * 16)
+        paths.append(cached_merge(str(boot), str(firm), cache))
+        os.utime(paths[-1], (value, value))
+
+    prune_merges(cache, keep_files=1)
+    assert [os.path.isfile(path) for path in paths] == [False, False, True]
+    assert len(os.listdir(cache)) == 2
+
+
+def test_image_checksum_is_openocd_crc32():
+    # CRC-32/MPEG-2 check value, the algorithm of OpenOCD image checksums
+    assert image_checksum(b'123456789') == 0x0376E6E7
+    assert image_checksum(b'') == 0xFFFFFFFF
@@ -0,0 +1,155 @@
+import os
+
+import pytest
+
+from firmware_tools import FirmwareLibrary as library_module
+from firmware_tools.FirmwareLibrary import (FirmwareLibrary, FirmwareName,
+                                            version_key)
+from firmware_tools.IdAllocator import FREE, IdAllocator
+from firmware_tools.manifest import read_manifest
+
+
+def write(folder, name, text=':00000001FF\n'):
+    path = folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+
+@pytest.fixture
+def firmware(tmp_path):
+    root = tmp_path / 'firmware'
+    write(root, '[DoorProtect][5.5.9.5][EU][0][3B].hex')
+    write(root, 'old/[DoorProtect][5.5.55.5][EU][0][3B].hex')
+    write(root, '[DoorProtect][6.0.0.1][EU][0][4B].hex')
+    write(root, '[DoorProtect][7.0.0.0][US][0][3B].hex')
+    write(root, '[KeyPad][1.2.0][EU][1][3B].bin')
+    write(root, 'MERGED.hex')
+    return root
+
+
+def test_parse_name():
+    name = FirmwareName.parse(
+        '/fw/0x08000400/[MotionCam][1.0.0][EU][2][4B].hex',
+    )
+    assert name == FirmwareName(
+        'MotionCam', '1.0.0', 'EU', 2, '4B', 0x08000400,
+    )
+    assert FirmwareName.parse('[DoorProtect][5.5.55.5][EU][0][3B].hex')
+    assert FirmwareName.parse('MERGED.hex') is None
+    assert FirmwareName.parse('[A][1][EU][x][3B].hex') is None
+
+
+def test_version_order():
+    assert version_key('5.5.55.5') > version_key('5.5.9.5')
+    assert version_key('1.10') > version_key('1.9.9')
+    assert version_key('2.0') > version_key('2.0rc1')
+
+
+def test_latest(firmware):
+    library = FirmwareLibrary(str(firmware))
+    stats = library.scan()
+
+    assert (stats.added, stats.unchanged) == (5, 0)
+    assert library.latest('DoorProtect', 'EU').name.version == '6.0.0.1'
+    assert library.latest('DoorProtect', 'EU', 0, '3B').name.version == (
+        '5.5.55.5'
+    )
+    assert library.latest('DoorProtect', 'US').name.version == '7.0.0.0'
+    assert library.latest('KeyPad', 'EU', 1).path.endswith('.bin')
+    assert library.latest('KeyPad', 'US') is None
+    assert library.find('DoorProtect', 'EU', '5.5.9.5').name.version == (
+        '5.5.9.5'
+    )
+    assert library.find('DoorProtect', 'EU', '9.9') is None
+    entry = library.get(str(firmware / '[KeyPad][1.2.0][EU][1][3B].bin'))
+    assert entry.size == 12 and len(entry.sha256) == 64
+
+
+def test_scan_is_incremental(firmware):
+    library = FirmwareLibrary(str(firmware))
+    library.scan()
+    newest = firmware / '[DoorProtect][6.0.0.1][EU][0][4B].hex'
+    old = firmware / 'old' / '[DoorProtect][5.5.55.5][EU][0][3B].hex'
+    sha256 = library.get(str(old)).sha256
+
+    old.write_text(':0000000AFF\n\n')
+    os.remove(newest)
+    stats = library.scan()
+
+    assert (stats.added, stats.updated, stats.removed, stats.unchanged) == (
+        0, 1, 1, 3,
+    )
+    assert library.get(str(old)).sha256 != sha256
+    assert library.latest('DoorProtect', 'EU').name.version == '5.5.55.5'
+    assert library.latest('DoorProtect', 'EU', 0, '4B') is None
+
+
+def test_index_file_skips_hashing(firmware, tmp_path, monkeypatch):
+    index = str(tmp_path / 'index.json')
+    FirmwareLibrary(str(firmware), index).scan()
+    monkeypatch.setattr(
+        library_module, 'file_hash', pytest.fail, raising=True,
+    )
+
+    library = FirmwareLibrary(str(firmware), index)
+    assert len(library) == 5
+    assert library.scan().unchanged == 5
+    assert library.latest('DoorProtect', 'EU').name.version == '6.0.0.1'
+
+
+def test_damaged_index_file_is_rebuilt(firmware, tmp_path):
+    index = tmp_path / 'index.json'
+    index.write_text('{"version": 1, "entr')
+
+    library = FirmwareLibrary(str(firmware), str(index))
+    assert len(library) == 0
+    assert library.scan().added == 5
+
+
+def test_manifest_takes_latest_firmware(firmware, tmp_path):
+    library = FirmwareLibrary(str(firmware))
+    library.scan()
+    manifest = tmp_path / 'batch.csv'
+    manifest.write_text(
+        'device,device_id,region,version,flasher\n'
+        'DoorProtect,1ABC2D,EU,,stlink\n'
+        'DoorProtect,1ABC2D3E,EU,,stlink\n'
+        'DoorProtect,1ABC2D,EU,5.5.9.5,stlink\n'
+        'DoorProtect,1ABC2D,EU,1.0,stlink\n'
+        'DoorProtect,1ABC2D,,,stlink\n'
+    )
+
+    rows = list(read_manifest(str(manifest), library=library))
+
+    assert [os.path.basename(row.job.firmware) for row in rows[:3]] == [
+        '[DoorProtect][5.5.55.5][EU][0][3B].hex',
+        '[DoorProtect][6.0.0.1][EU][0][4B].hex',
+        '[DoorProtect][5.5.9.5][EU][0][3B].hex',
+    ]
+    assert rows[3].error == 'No 1.0 for DoorProtect in region EU.'
+    assert rows[4].error == 'No firmware file and no region to look it up.'
+
+
+def test_allocated_id_selects_firmware_by_length(firmware, tmp_path):
+    library = FirmwareLibrary(str(firmware))
+    library.scan()
+    manifest = tmp_path / 'batch.csv'
+    manifest.write_text(
+        'device,region,version,flasher\n'
+        'DoorProtect,EU,,stlink\n'
+        'DoorProtect,EU,1.0,stlink\n'
+    )
+
+    with IdAllocator(str(tmp_path / 'ids.db'), 'A') as allocator:
+        allocator.add_range('DoorProtect', 0x10, 0xFF, id_len=3)
+        rows = list(read_manifest(
+            str(manifest), allocator=allocator, library=library,
+        ))
+        assert allocator.state('000011')[0] == FREE
+
+    assert rows[0].job.device_id == '000010'
+    assert os.path.basename(rows[0].job.firmware) == (
+        '[DoorProtect][5.5.55.5][EU][0][3B].hex'
+    )
+    assert rows[1].error == 'No 1.0 for DoorProtect in region EU.'
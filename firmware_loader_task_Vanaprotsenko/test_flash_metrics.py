@@ -0,0 +1,94 @@
+import json
+import time
+
+from firmware_tools import STM8, Device, FlasherFactory, FlashJob
+from firmware_tools import FlashOrchestrator, STLinkFlasher
+from firmware_tools.BaseFlasher import BaseFlasher
+from firmware_tools.BaseFlasher import CalledProcessError
+from firmware_tools.classes import DevRadio
+from firmware_tools.FlashMetrics import FlashMetrics, Histogram, JobMetrics
+
+
+class StagedFlasher(BaseFlasher):
+    def setup_firmware_flashing(self) -> None:
+        with self.stage('config'):
+            time.sleep(0.01)
+        self.add_written('flash', 1024)
+
+    def flash_firmware(self) -> bool:
+        with self.stage('flash'):
+            time.sleep(0.03)
+        return self.device_id != 'BAD000'
+
+
+def test_histogram_buckets():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [('0.1', 2), ('1.0', 3), ('+Inf', 4)]
+    assert histogram.count == 4
+    assert histogram.quantile(0.5) == 0.5
+
+
+def test_batch_metrics_export(monkeypatch, tmp_path):
+    monkeypatch.setitem(FlasherFactory.flashers_dict, 'Staged', StagedFlasher)
+    device = Device('DoorProtect', STM8.STM8_6, DevRadio.INTRUSION)
+    jobs = [
+        FlashJob(device, 'fw.hex', device_id, flasher='Staged')
+        for device_id in ('1ABC2D', '1ABC2E', 'BAD000')
+    ]
+    metrics = FlashMetrics()
+    FlashOrchestrator(metrics=metrics).run(jobs)
+
+    summary = json.loads(
+        open(metrics.write_json(str(tmp_path / 'batch.json'))).read(),
+    )
+    assert summary['jobs'] == 3 and summary['failed'] == 1
+    assert summary['bottleneck'] == 'flash'
+    assert summary['stages']['config']['count'] == 3
+    assert summary['stages']['flash']['p50'] >= 0.03
+    assert summary['bytes_written'] == {'flash': 2048}
+    assert summary['devices_per_minute'] > 0
+
+    text = open(metrics.write_prometheus(str(tmp_path / 'flash.prom'))).read()
+    assert 'flash_stage_seconds_bucket{stage="flash",le="+Inf"} 3' in text
+    assert 'flash_stage_seconds_count{stage="config"} 3' in text
+    assert 'flash_jobs_total{result="failure"} 1' in text
+    assert 'flash_bytes_written_total{region="flash"} 2048' in text
+    assert 'flash_job_seconds_count 3' in text
+
+
+def test_pipeline_stages_and_retries(monkeypatch):
+    device = Device('DoorProtect', STM8.STM8_6, DevRadio.INTRUSION)
+    metrics = FlashMetrics()
+    flasher = STLinkFlasher(
+        device, 'fw.hex', '1ABC2D', step_retries=1, step_backoff=0,
+        metrics=metrics,
+    )
+    flasher.unlock_cmd, flasher.flash_cmd = 'unlock', 'flash'
+    flasher.lock_cmd = 'lock'
+    failures = {'lock': 1}
+
+    def execute_cmd(cmd):
+        if failures.get(cmd):
+            failures[cmd] -= 1
+            raise CalledProcessError(cmd)
+        return True
+
+    monkeypatch.setattr(flasher, 'execute_cmd', execute_cmd)
+    monkeypatch.setattr(flasher, 'setup_firmware_flashing', lambda: None)
+
+    assert flasher.run() is True
+    job = flasher.job_metrics
+    assert set(job.stages) == {'unlock', 'flash', 'verify', 'eeprom', 'lock'}
+    assert job.retries == {'lock': 1}
+    assert metrics.retries == {'lock': 1}
+    assert metrics.results == {'success': 1, 'failure': 0}
+
+
+def test_failed_job_bytes_not_counted():
+    metrics = FlashMetrics()
+    metrics.record(JobMetrics(bytes_written={'eeprom': 8}, success=False))
+    metrics.record(JobMetrics(bytes_written={'eeprom': 8}, success=True))
+    assert metrics.bytes_written == {'eeprom': 8}
@@ -0,0 +1,81 @@
+import pytest
+
+from firmware_tools import STM8, Device, STLinkFlasher
+from firmware_tools.BaseFlasher import CalledProcessError
+from firmware_tools.classes import DevRadio
+from firmware_tools.FlashPipeline import FlashPipeline, Step, StepState
+
+
+def flaky(calls, name, failures):
+    def action():
+        calls.append(name)
+        if calls.count(name) <= failures:
+            raise CalledProcessError(f'{name} failed')
+        return True
+    return action
+
+
+def test_failed_step_is_retried_alone_with_backoff():
+    calls, sleeps = [], []
+    pipeline = FlashPipeline(
+        [Step('flash', flaky(calls, 'flash', 0)),
+         Step('lock', flaky(calls, 'lock', 2))],
+        retries=2, backoff=0.1, sleep=sleeps.append,
+    )
+
+    assert pipeline.run() is True
+    assert calls == ['flash', 'lock', 'lock', 'lock']
+    assert sleeps == [0.1, 0.2]
+    assert pipeline.records['lock'].attempts == 3
+
+
+def test_run_resumes_from_failed_step():
+    calls = []
+    pipeline = FlashPipeline(
+        [Step('unlock', flaky(calls, 'unlock', 0)),
+         Step('flash', flaky(calls, 'flash', 1))],
+    )
+    with pytest.raises(CalledProcessError):
+        pipeline.run()
+    assert pipeline.failed_step == 'flash'
+
+    pipeline.run()
+    assert calls == ['unlock', 'flash', 'flash']
+    assert pipeline.records['flash'].state == StepState.DONE
+
+
+def test_lock_failure_does_not_repeat_flash(monkeypatch):
+    device = Device('DoorProtect', STM8.STM8_6, DevRadio.INTRUSION)
+    flasher = STLinkFlasher(
+        device, 'fw.hex', '1ABC2D', step_retries=1, step_backoff=0,
+    )
+    flasher.unlock_cmd, flasher.flash_cmd = 'unlock', 'flash'
+    flasher.lock_cmd = 'lock'
+    calls = []
+    monkeypatch.setattr(
+        flasher, 'execute_cmd',
+        lambda cmd: flaky(calls, cmd, 1 if cmd == 'lock' else 0)(),
+    )
+
+    assert flasher.flash_firmware() is True
+    assert calls == ['unlock', 'flash', 'lock', 'lock']
+
+
+def test_step_returning_false_fails_the_run():
+    calls = []
+    results = iter([False, False, True])
+
+    def unlock():
+        calls.append('unlock')
+        return next(results)
+
+    pipeline = FlashPipeline(
+        [Step('unlock', unlock), Step('lock', flaky(calls, 'lock', 0))],
+        retries=1, sleep=lambda delay: None,
+    )
+
+    assert pipeline.run() is False
+    assert pipeline.failed_step == 'unlock'
+    assert calls == ['unlock', 'unlock']
+    assert pipeline.run() is True
+    assert calls == ['unlock', 'unlock', 'unlock', 'lock']
@@ -0,0 +1,58 @@
+from intelhex import IntelHex
+
+from firmware_tools import STM32, Device, STLinkFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.HexTemplate import HexTemplate
+
+
+def make_firmware(path, start=0x08000000, size=0x400):
+    ih = IntelHex()
+    for i in range(size):
+        ih[start + i] = i & 0xFF
+    ih.write_hex_file(str(path))
+    return str(path)
+
+
+def test_render_matches_intelhex_patch(tmp_path):
+    firmware = make_firmware(tmp_path / 'fw.hex')
+    patch = {0x08000100: 0xAA, 0x0800010F: 0xBB, 0x08000110: 0xCC}
+
+    out = HexTemplate(firmware).write(str(tmp_path / 'out.hex'), patch)
+
+    expected = IntelHex(firmware)
+    for address, value in patch.items():
+        expected[address] = value
+    assert IntelHex(out).todict() == expected.todict()
+
+
+def test_address_outside_records_is_appended(tmp_path):
+    firmware = make_firmware(tmp_path / 'fw.hex', size=0x20)
+    out = HexTemplate(firmware).write(
+        str(tmp_path / 'out.hex'), {0x08080000: 0x42},
+    )
+
+    ih = IntelHex(out)
+    assert ih[0x08080000] == 0x42
+    assert ih[0x08000001] == 0x01
+
+
+def test_template_is_cached_per_file(tmp_path):
+    firmware = make_firmware(tmp_path / 'fw.hex')
+    assert HexTemplate.for_file(firmware) is HexTemplate.for_file(firmware)
+
+
+def test_prepared_image_mode_matches_full_rewrite(tmp_path):
+    firmware = make_firmware(tmp_path / 'fw.hex')
+    outputs = []
+    for prepared_image in (False, True):
+        device = Device(
+            'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+            id_address=0x08000200, subtype=3,
+        )
+        flasher = STLinkFlasher(
+            device, firmware, '1ABC2D', color=2,
+            prepared_image=prepared_image,
+        )
+        flasher.write_id_with_intelhex()
+        outputs.append(IntelHex(str(flasher.firmware)).todict())
+    assert outputs[0] == outputs[1]
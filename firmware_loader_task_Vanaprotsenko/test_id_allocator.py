@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+
+import pytest
+
+from firmware_tools import STM8, Device
+from firmware_tools.BaseFlasher import BaseFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.IdAllocator import (COMMITTED, FREE, IN_FLIGHT,
+                                        DuplicateIdError, IdAllocator,
+                                        IdPoolExhausted)
+
+
+class FakeFlasher(BaseFlasher):
+    def setup_firmware_flashing(self) -> None:
+        pass
+
+    def flash_firmware(self) -> bool:
+        return self.device_id != '00000102'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'ids.db')
+    with IdAllocator(path, 'setup') as allocator:
+        allocator.add_range('DoorProtect', 0x100, 0x10F)
+    return path
+
+
+def test_sequential_blocks(db_path):
+    with IdAllocator(db_path, 'A', block_size=4) as a, \
+            IdAllocator(db_path, 'B', block_size=4) as b:
+        assert [a.allocate('DoorProtect') for _ in range(2)] == [
+            '00000100', '00000101',
+        ]
+        assert b.allocate('DoorProtect') == '00000104'
+        assert a.allocate('DoorProtect') == '00000102'
+
+
+def test_commit_and_duplicates(db_path):
+    with IdAllocator(db_path, 'A', block_size=4) as a, \
+            IdAllocator(db_path, 'B') as b:
+        device_id = a.allocate('DoorProtect')
+        a.check_unused(device_id)
+        with pytest.raises(DuplicateIdError):
+            b.check_unused(device_id)
+        a.commit(device_id)
+        assert a.state(device_id) == (COMMITTED, 'A')
+        with pytest.raises(DuplicateIdError):
+            a.check_unused(device_id)
+        # typed by hand, never handed out again
+        b.commit('00000105')
+        assert [a.allocate('DoorProtect') for _ in range(5)] == [
+            '00000101', '00000102', '00000103', '00000104', '00000106',
+        ]
+
+
+def test_release_and_recover(db_path):
+    with IdAllocator(db_path, 'A', block_size=2) as a:
+        first, second = a.allocate('DoorProtect'), a.allocate('DoorProtect')
+        a.release(first)
+        assert a.state(first) == (FREE, 'A')
+    # second was reserved when the station went down
+    with IdAllocator(db_path, 'A', block_size=2) as a:
+        assert a.allocate('DoorProtect') == second
+        assert a.allocate('DoorProtect') == first
+
+
+def test_exhausted(tmp_path):
+    with IdAllocator(str(tmp_path / 'ids.db'), 'A') as a:
+        with pytest.raises(IdPoolExhausted):
+            a.allocate('KeyPad')
+        a.add_range('KeyPad', 0xAA0000, 0xAA0000, id_len=3)
+        assert a.allocate('KeyPad') == 'AA0000'
+        with pytest.raises(IdPoolExhausted):
+            a.allocate('KeyPad')
+        with pytest.raises(ValueError):
+            a.add_range('KeyPad', 0, 0x1000000, id_len=3)
+
+
+def test_parallel_stations_never_share(db_path):
+    with IdAllocator(db_path, 'setup') as allocator:
+        allocator.add_range('Socket', 0, 999)
+    allocated: list[str] = []
+
+    def station(name):
+        with IdAllocator(db_path, name, block_size=8) as allocator:
+            ids = [allocator.allocate('Socket') for _ in range(100)]
+        allocated.extend(ids)
+
+    threads = [
+        threading.Thread(target=station, args=(f'S{i}',)) for i in range(4)
+    ]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert len(allocated) == len(set(allocated)) == 400
+
+
+def test_flasher_commits_only_on_success(db_path, tmp_path):
+    device = Device('DoorProtect', STM8.STM8_6, DevRadio.INTRUSION)
+    with IdAllocator(db_path, 'A') as a:
+        ok_id, bad_id = a.allocate('DoorProtect'), '00000102'
+        a.allocate('DoorProtect')
+        for device_id in (ok_id, bad_id):
+            FakeFlasher(device, 'fw.hex', device_id, id_allocator=a).run()
+        assert a.state(ok_id)[0] == COMMITTED
+        assert a.state(bad_id)[0] == FREE
+        assert not FakeFlasher(device, 'fw.hex', ok_id, id_allocator=a).run()
+        assert a.state(ok_id)[0] == COMMITTED
+
+
+def test_same_id_twice_on_one_station(db_path):
+    with IdAllocator(db_path, 'A') as a:
+        a.check_unused('0000aa11', 'DoorProtect')
+        assert a.state('0000AA11') == (IN_FLIGHT, 'A')
+        with pytest.raises(DuplicateIdError, match='in_flight by A'):
+            a.check_unused('0000AA11')
+        a.check_unused('00AA11')  # 3-byte ID, another device
+
+        a.finish('0000AA11', False)
+        assert a.state('0000AA11') is None
+        a.finish('00AA11', True)
+        assert a.state('00AA11') == (COMMITTED, 'A')
+
+
+def test_integer_ids_are_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    db = sqlite3.connect(path)
+    db.executescript(
+        'CREATE TABLE pools (device TEXT PRIMARY KEY, next INTEGER NOT NULL,'
+        ' last INTEGER NOT NULL, id_len INTEGER NOT NULL);'
+        'CREATE TABLE ids (id INTEGER PRIMARY KEY, device TEXT NOT NULL,'
+        ' station TEXT NOT NULL, state TEXT NOT NULL, updated REAL NOT NULL);'
+        "INSERT INTO pools VALUES ('KeyPad', 2, 9, 3);"
+        "INSERT INTO ids VALUES (1, 'KeyPad', 'A', 'committed', 0);"
+        "INSERT INTO ids VALUES (43537, 'Hub', 'A', 'committed', 0);",
+    )
+    db.commit()
+    db.close()
+
+    with IdAllocator(path, 'A') as a:
+        assert a.state('000001') == (COMMITTED, 'A')
+        assert a.state('0000AA11') == (COMMITTED, 'A')
+        assert a.allocate('KeyPad') == '000002'
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from firmware_tools import CC, Device, JLinkFlasher
+from firmware_tools.BaseFlasher import CalledProcessError
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.JLinkSession import JLinkSession
+
+STUBS_DIR = os.path.join(os.path.dirname(__file__), 'benchmarks', 'stubs')
+SETUP = ['SelectInterface cJTAG', 'JTAGConf -1 -1', 'Speed 1000']
+
+
+@pytest.fixture
+def runs(tmp_path, monkeypatch):
+    """Log of the stand-in JLinkExe, one line per process"""
+    log = tmp_path / 'runs.log'
+    monkeypatch.setenv('PATH', STUBS_DIR + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_PROGRAMMER_SCALE', '0')
+    monkeypatch.setenv('FAKE_PROGRAMMER_LOG', str(log))
+    yield lambda: log.read_text().splitlines() if log.exists() else []
+    JLinkSession.close_all()
+
+
+def test_session_runs_commands(tmp_path, runs):
+    firmware = tmp_path / 'fw.bin'
+    firmware.write_bytes(bytes(64))
+    with JLinkSession(SETUP, 'SN1') as session:
+        output = session.execute(['Reset', f'loadfile {firmware}'])
+        assert 'O.K.' in output
+        with pytest.raises(CalledProcessError, match='Could not open file'):
+            session.execute(['loadfile missing.hex'])
+        assert session.alive
+        session.execute(['w1 0001FFD8 00'])
+
+    assert runs() == ['JLinkExe ok -NoGui 1 -ExitOnError 0 -USB SN1']
+
+
+def test_for_probe_restarts_on_new_setup(runs):
+    first = JLinkSession.for_probe(SETUP, 'SN1')
+    assert JLinkSession.for_probe(SETUP, 'SN1') is first
+    second = JLinkSession.for_probe(SETUP[:2], 'SN1')
+
+    assert second is not first and not first.alive
+    assert JLinkSession.for_probe(SETUP[:2], 'SN2') is not second
+    assert len(runs()) == 1
+
+
+def test_flasher_reuses_session_for_many_devices(tmp_path, runs):
+    firmware = FirmwareImage.from_bytes(bytes(0x100), 0x8000).write_hex(
+        str(tmp_path / 'fw.hex'),
+    )
+    sessions = set()
+    for device_id in ('1ABC2D', '1ABC2E'):
+        device = Device(
+            'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x8080,
+        )
+        flasher = JLinkFlasher(
+            device, firmware, device_id, programmer_sn='SN1',
+            jlink_session=True,
+        )
+        assert flasher.run() is True
+        sessions.add(flasher.session)
+
+    assert len(sessions) == 1
+    assert runs() == []  # still open for the next device
+    JLinkSession.close_all()
+    assert len(runs()) == 1
+
+
+def test_session_failure_is_retried(tmp_path, runs, monkeypatch):
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x0,
+    )
+    flasher = JLinkFlasher(
+        device, str(tmp_path / 'missing.hex'), '1ABC2D', jlink_session=True,
+    )
+    flasher.tries_to_execute_cmd = 2
+    with pytest.raises(CalledProcessError, match='Could not open file'):
+        flasher.flash_firmware()
+    assert flasher.job_metrics.retries == {'flash': 1}
@@ -1,8 +1,14 @@
+import os
+import subprocess
+import sys
+
 import pytest
 from unittest.mock import patch
-from firmware_tools import Device, JLinkFlasher, STLinkFlasher
+from firmware_tools import Device, FlasherFactory, JLinkFlasher, STLinkFlasher
+from firmware_tools.BaseFlasher import BaseFlasher
 from firmware_tools.classes import DevRadio
-from loader import Loader
+from firmware_tools.IdAllocator import COMMITTED, IdAllocator
+from loader import Loader, main
 
 
 @pytest.fixture
@@ -73,5 +79,140 @@ def test_choose_flasher_jlink(loader_instance):
     assert flasher_type_jlink == JLinkFlasher
 
 
+def test_choose_flasher_retries_invalid(loader_instance, capsys):
+    with patch('builtins.input', side_effect=['usb', 'STLink']):
+        flasher_type = loader_instance.choose_flasher()
+
+    assert flasher_type == STLinkFlasher
+    assert "Please enter 'JLink' or 'STLink'" in capsys.readouterr().out
+
+
+class RecordingFlasher(BaseFlasher):
+    flashed: list[tuple[str, int, object]] = []
+
+    def setup_firmware_flashing(self) -> None:
+        pass
+
+    def flash_firmware(self) -> bool:
+        self.flashed.append((self.device_id, self.device.subtype, self.color))
+        return True
+
+
+def test_batch_manifest(loader_instance, tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(
+        FlasherFactory.flashers_dict, 'STlink', RecordingFlasher,
+    )
+    monkeypatch.setattr(RecordingFlasher, 'flashed', [])
+    (tmp_path / 'fw.hex').write_text(':00000001FF\n')
+    manifest = tmp_path / 'batch.csv'
+    manifest.write_text(
+        'device,firmware,device_id,subtype,color,flasher,programmer_sn\n'
+        'GlassProtect,fw.hex,1ABC2D,7,2,STLink,A\n'
+        'GlassProtect,fw.hex,1ABC2,,,STLink,A\n'
+        'Unknown,fw.hex,1ABC2D,,,STLink,A\n'
+        'DoorProtect,fw.hex,1ABC2D3E,300,,STLink,B\n'
+        'DoorProtect,fw.hex,1ABC2D3E,,,stlink,B\n'
+    )
+
+    with patch('builtins.input', side_effect=AssertionError('prompted')):
+        assert loader_instance.batch(str(manifest)) is False
+
+    assert sorted(RecordingFlasher.flashed) == [
+        ('1ABC2D', 7, 2), ('1ABC2D3E', None, None),
+    ]
+    out = capsys.readouterr().out
+    assert '2. GlassProtect 1ABC2D OK' in out
+    assert '3. GlassProtect 1ABC2 INVALID: Invalid length' in out
+    assert "4. Unknown 1ABC2D INVALID: Unknown device 'Unknown'" in out
+    assert '5. DoorProtect 1ABC2D3E INVALID: Invalid range' in out
+    assert '2/5 devices flashed' in out
+
+
+def test_batch_jsonl_manifest(loader_instance, tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        FlasherFactory.flashers_dict, 'STlink', RecordingFlasher,
+    )
+    monkeypatch.setattr(RecordingFlasher, 'flashed', [])
+    (tmp_path / 'fw.hex').write_text(':00000001FF\n')
+    manifest = tmp_path / 'batch.jsonl'
+    manifest.write_text(
+        '{"device": "KeyPad", "firmware": "fw.hex", "device_id": "00AA11",'
+        ' "flasher": "stlink"}\n'
+    )
+
+    assert loader_instance.batch(str(manifest)) is True
+    assert RecordingFlasher.flashed == [('00AA11', None, None)]
+
+
+def test_batch_jsonl_bad_lines(loader_instance, tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(
+        FlasherFactory.flashers_dict, 'STlink', RecordingFlasher,
+    )
+    monkeypatch.setattr(RecordingFlasher, 'flashed', [])
+    (tmp_path / 'fw.hex').write_text(':00000001FF\n')
+    manifest = tmp_path / 'batch.jsonl'
+    manifest.write_text(
+        '{"device": "KeyPad", "firmware": "fw.hex"\n'
+        '["KeyPad", "fw.hex"]\n'
+        '{"device": "KeyPad", "firmware": "fw.hex", "device_id": "00AA11",'
+        ' "flasher": "stlink"}\n'
+    )
+
+    assert loader_instance.batch(str(manifest)) is False
+    assert RecordingFlasher.flashed == [('00AA11', None, None)]
+    out = capsys.readouterr().out
+    assert '1.   INVALID: Invalid JSON' in out
+    assert '2.   INVALID: Record is not a JSON object.' in out
+    assert '1/3 devices flashed' in out
+
+
+def test_batch_allocates_ids(loader_instance, tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        FlasherFactory.flashers_dict, 'STlink', RecordingFlasher,
+    )
+    monkeypatch.setattr(RecordingFlasher, 'flashed', [])
+    (tmp_path / 'fw.hex').write_text(':00000001FF\n')
+    manifest = tmp_path / 'batch.csv'
+    manifest.write_text(
+        'device,firmware,device_id,flasher\n'
+        'KeyPad,fw.hex,,stlink\n'
+        'KeyPad,fw.hex,,stlink\n'
+    )
+    with IdAllocator(str(tmp_path / 'ids.db'), 'A') as allocator:
+        allocator.add_range('KeyPad', 0x10, 0xFF, id_len=3)
+        assert loader_instance.batch(str(manifest), allocator=allocator)
+        assert allocator.state('000011')[0] == COMMITTED
+
+    assert sorted(RecordingFlasher.flashed) == [
+        ('000010', None, None), ('000011', None, None),
+    ]
+
+
+def test_package_exports_classes_after_factory_import():
+    code = (
+        'import firmware_tools.flasher_factory\n'
+        'from firmware_tools import FlasherFactory, JLinkFlasher,'
+        ' STLinkFlasher\n'
+        'assert FlasherFactory.get_flasher("JLink") is JLinkFlasher\n'
+        'assert FlasherFactory.get_flasher("STlink") is STLinkFlasher\n'
+    )
+    subprocess.run(
+        [sys.executable, '-c', code], check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def test_list_devices(capsys):
+    assert main(['--list-devices']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert 'INTRUSION  DoorProtect' in lines
+    assert 'SMART_HOME KeyPad' in lines
+
+
+def test_manifest_required():
+    with pytest.raises(SystemExit):
+        main([])
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,124 @@
+from unittest.mock import patch
+
+import pytest
+
+from firmware_tools import STM32, Device, JLinkFlasher, STLinkFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.HexTemplate import HexTemplate
+from firmware_tools.memory_map import (ImageValidationError, memory_map,
+                                       preflight)
+
+
+@pytest.fixture
+def image():
+    image = FirmwareImage.from_bytes(b'\x01' * 0x20, 0x0800FFF0)
+    image.add_segment(0x08080000, b'\x02' * 4)  # L0 EEPROM, not flash
+    return image
+
+
+def test_clip_drops_data_out_of_flash(image):
+    clipped = preflight(image, STM32.STM32_L0)
+
+    assert clipped.starts == [0x0800FFF0]
+    assert clipped.max_address() == 0x0800FFFF
+
+
+def test_reject_policy_raises(image):
+    with pytest.raises(ImageValidationError):
+        preflight(image, STM32.STM32_L0, policy='reject')
+
+
+def test_image_in_range_is_returned_as_is():
+    image = FirmwareImage.from_bytes(b'\x01' * 16, 0x08000000)
+    assert preflight(image, STM32.STM32_U5) is image
+
+
+def test_f4_sector_layout_covers_flash():
+    flash = memory_map(STM32.STM32_F4X).regions[0]
+    assert sum(size for _, size in flash.sectors()) == flash.size
+
+
+def test_template_clip_is_done_once(tmp_path, image):
+    path = image.write_hex(str(tmp_path / 'fw.hex'))
+    template = HexTemplate(path)
+    ranges = ((0x08000000, 0x08010000),)
+
+    assert template.clip(ranges) == [(0x08010000, 16), (0x08080000, 4)]
+    assert template.clip(ranges) == [(0x08010000, 16), (0x08080000, 4)]
+    assert template.locate(0x08080000) is None
+
+
+def test_reject_applies_to_every_job_on_template(tmp_path, image):
+    path = image.write_hex(str(tmp_path / 'fw.hex'))
+    results = []
+    for policy in ('clip', 'reject', 'reject'):
+        device = Device(
+            'MotionCam', STM32.STM32_L0, DevRadio.INTRUSION,
+            id_address=0x08000000,
+        )
+        flasher = STLinkFlasher(
+            device, path, '1ABC2D3E', prepared_image=True,
+            out_of_range=policy,
+        )
+        with patch.object(STLinkFlasher, 'execute_cmd', return_value=True):
+            results.append(flasher.run())
+    assert results == [True, False, False]
+
+
+def test_bad_id_address_fails_before_programmer(tmp_path):
+    firmware = FirmwareImage.from_bytes(b'\x00' * 16, 0x08000000).write_hex(
+        str(tmp_path / 'fw.hex'),
+    )
+    device = Device(
+        'MotionCam', STM32.STM32_L0, DevRadio.INTRUSION,
+        id_address=0x09000000,
+    )
+    flasher = STLinkFlasher(device, firmware, '1ABC2D3E')
+    flasher.cfg_folder = str(tmp_path)
+    with patch.object(STLinkFlasher, 'execute_cmd') as execute_cmd:
+        assert flasher.run() is False
+    execute_cmd.assert_not_called()
+
+
+def test_erase_plan_joins_touched_sectors():
+    f4 = memory_map(STM32.STM32_F4X)
+    spans = [
+        (0x08000010, 0x08000020),
+        (0x08007FF0, 0x08008010),  # sectors 1 and 2
+        (0x08030000, 0x08030004),  # 128K sector 6
+        (0x1FFFC000, 0x1FFFC004),  # option bytes, not flash
+    ]
+
+    assert f4.erase_plan(spans) == [
+        (0x08000000, 0xC000), (0x08020000, 0x20000),
+    ]
+    assert f4.erase_plan([]) == []
+
+
+def test_flashers_erase_only_image_sectors(tmp_path):
+    image = FirmwareImage.from_bytes(b'\x01' * 0x3000, 0x08000000)
+    path = image.write_hex(str(tmp_path / 'fw.hex'))
+    device = Device(
+        'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+        id_address=0x08000400,
+    )
+    flasher = STLinkFlasher(device, path, '00000001')
+    flasher.stm32_cfg()
+    flasher.search_apply_device_id()
+    flasher.target_stm32()
+
+    assert "-c 'flash erase_address 0x8000000 0x4000'" in flasher.flash_cmd
+    assert 'write_image erase' not in flasher.flash_cmd
+    flasher.full_erase = True
+    assert 'erase_address' not in flasher.stm32_flash_cmd()
+
+    device = Device(
+        'StreetSiren', STM32.STM32_L0, DevRadio.INTRUSION,
+        id_address=0x08000400,
+    )
+    flasher = JLinkFlasher(device, path, '00000001')
+    flasher.search_apply_device_id()
+    assert flasher.erase_lines() == ['erase']  # may be locked, unlock it
+    flasher.full_erase = False
+    assert flasher.erase_lines() == ['erase 0x8000000 0x8002fff']
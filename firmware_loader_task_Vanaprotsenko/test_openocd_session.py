@@ -0,0 +1,214 @@
+import re
+import socket
+import threading
+
+import pytest
+
+from firmware_tools import STM32, Device, STLinkFlasher
+from firmware_tools.BaseFlasher import CalledProcessError, VerificationError
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.FlashPipeline import StepState
+from firmware_tools.OpenOCDSession import OpenOCDSession
+
+
+class FakeTclServer:
+    """Answer OpenOCD Tcl RPC requests, fail 'bad command' scripts"""
+
+    def __init__(self):
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.scripts = []
+        self.results = {}  # script substring -> Tcl result
+        self.connections = 0
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(
+                target=self.handle, args=(conn,), daemon=True,
+            ).start()
+
+    def handle(self, conn):
+        buffer = b''
+        with conn:
+            while chunk := conn.recv(4096):
+                buffer += chunk
+                while b'\x1a' in buffer:
+                    request, buffer = buffer.split(b'\x1a', 1)
+                    script = request.decode()
+                    inner = re.search(r'capture \{(.*)\}\} msg', script)
+                    script = inner.group(1) if inner else script
+                    self.scripts.append(script)
+                    if 'slow command' in script:
+                        continue  # no answer before the client timeout
+                    status = 'ERR' if 'bad command' in script else 'OK'
+                    result = next(
+                        (value for key, value in self.results.items()
+                         if key in script), 'done',
+                    )
+                    conn.sendall(f'{status} {result}'.encode() + b'\x1a')
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def server():
+    fake = FakeTclServer()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def session(server):
+    with OpenOCDSession([], port=server.port, spawn=False) as session:
+        yield session
+
+
+def test_execute_returns_output(server, session):
+    assert session.execute('reset halt') == 'done'
+    assert server.scripts == ['reset halt']
+
+
+def test_execute_raises_on_tcl_error(session):
+    with pytest.raises(CalledProcessError):
+        session.execute('bad command')
+
+
+def test_timeout_closes_session(server):
+    session = OpenOCDSession(
+        [], port=server.port, spawn=False, command_timeout=0.1,
+    ).start()
+    with pytest.raises(CalledProcessError, match='No answer from OpenOCD'):
+        session.execute('slow command')
+
+    assert not session.alive
+    session.close()
+
+
+def test_command_line_selects_probe():
+    cmd = OpenOCDSession(['-f', 'interface/stlink.cfg'], 'SN1', port=6666)
+    assert cmd.command_line()[:5] == [
+        'openocd', '-f', 'interface/stlink.cfg',
+        '-c', 'adapter serial SN1',
+    ]
+    assert '-c' in cmd.command_line() and 'tcl_port 6666' in cmd.command_line()
+
+
+def test_flasher_reuses_session_for_many_devices(
+        tmp_path, monkeypatch, server, session,
+):
+    monkeypatch.setattr(
+        OpenOCDSession, 'for_probe',
+        classmethod(lambda cls, config_args, sn='': session),
+    )
+    for device_id in ('00000001', '00000002'):
+        firmware = tmp_path / 'fw.hex'
+        firmware.write_text(':00000001FF\n')
+        device = Device(
+            'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+            id_address=0x08000200,
+        )
+        flasher = STLinkFlasher(
+            device, str(firmware), device_id, openocd_session=True,
+        )
+        flasher.cfg_folder = str(tmp_path)
+        assert flasher.run() is True
+
+    assert server.connections == 1
+    assert len(server.scripts) == 6
+    assert server.scripts[0] == 'reset halt; stm32u5x unlock 0; reset halt'
+    assert server.scripts[1].startswith(
+        'reset init; flash erase_address 0x8000000 0x2000;'
+        ' flash write_image {',
+    )
+
+
+def test_differential_flash_programs_only_changed_sectors(
+        tmp_path, server, session,
+):
+    image = FirmwareImage.from_bytes(b'\x00' * 0x6000, 0x08000000)
+    device = Device(
+        'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+        id_address=0x08002010,
+    )
+    flasher = STLinkFlasher(
+        device, 'fw.hex', '00000001', openocd_session=True, differential=True,
+    )
+    flasher.cfg_folder = str(tmp_path)
+    flasher.session, flasher.image = session, image
+    server.results['verify_image_checksum'] = '0x8002000'
+
+    assert flasher.flash() is True
+    assert len(flasher.sector_files()) == 3
+    assert 'foreach' in server.scripts[0]
+    assert server.scripts[1].count('flash write_image') == 1
+    assert server.scripts[1].startswith(
+        'flash erase_address 0x8002000 0x2000;',
+    )
+
+    # only the written sector is checked again, the split is reused
+    flasher.verify_image = True
+    server.results['verify_image_checksum'] = ''
+    assert flasher.verify() is True
+    assert flasher.sector_files() is flasher.sector_files()
+    assert '0x8002000' in server.scripts[-1]
+    assert '0x8000000' not in server.scripts[-1]
+
+
+def test_prepared_image_is_verified(tmp_path, server, session):
+    firmware = FirmwareImage.from_bytes(b'\x00' * 0x4000, 0x08000000)
+    path = firmware.write_hex(str(tmp_path / 'fw.hex'))
+    device = Device(
+        'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+        id_address=0x08002010,
+    )
+    flasher = STLinkFlasher(
+        device, path, '00000001', openocd_session=True, verify=True,
+        prepared_image=True,
+    )
+    flasher.cfg_folder = str(tmp_path)
+    flasher.write_id_with_intelhex()
+    flasher.session = session
+    flasher.unlock_cmd = flasher.flash_cmd = flasher.lock_cmd = 'reset'
+    server.results['verify_image_checksum'] = ''
+
+    assert flasher.flash_stm() is True
+    checks = [script for script in server.scripts if 'foreach' in script]
+    assert len(checks) == 1
+    assert '0x8000000' in checks[0] and '0x8002000' in checks[0]
+    sector = next(
+        path for address, _, path, _ in flasher.sector_files()
+        if address == 0x08002000
+    )
+    with open(sector, 'rb') as file:
+        assert file.read(0x14)[0x10:] == bytes.fromhex('01000000')
+
+
+def test_verify_mismatch_sends_pipeline_back_to_flash(
+        tmp_path, server, session,
+):
+    device = Device(
+        'MotionCam', STM32.STM32_U5, DevRadio.INTRUSION,
+        id_address=0x08000010,
+    )
+    flasher = STLinkFlasher(
+        device, 'fw.hex', '00000001', openocd_session=True, verify=True,
+    )
+    flasher.cfg_folder = str(tmp_path)
+    flasher.image = FirmwareImage.from_bytes(b'\x00' * 0x100, 0x08000000)
+    flasher.session = session
+    flasher.unlock_cmd = flasher.flash_cmd = flasher.lock_cmd = 'reset'
+    server.results['verify_image_checksum'] = '0x8000000'
+
+    with pytest.raises(VerificationError, match='0x8000000: '):
+        flasher.flash_stm()
+    assert flasher.pipeline.records['unlock'].state == StepState.DONE
+    assert flasher.pipeline.records['flash'].state == StepState.PENDING
+    assert not any('lock 0' in script for script in server.scripts)
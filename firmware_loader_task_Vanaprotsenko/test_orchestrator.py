@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from firmware_tools import STM8, Device, FlasherFactory, FlashJob
+from firmware_tools import FlashOrchestrator
+from firmware_tools.BaseFlasher import BaseFlasher
+from firmware_tools.classes import DevRadio
+
+
+class SleepyFlasher(BaseFlasher):
+    delay = 0.2
+    active: set[str] = set()
+    lock = threading.Lock()
+
+    def setup_firmware_flashing(self) -> None:
+        with self.lock:
+            # one job per probe at a time
+            assert self.programmer_sn not in self.active
+            self.active.add(self.programmer_sn)
+
+    def flash_firmware(self) -> bool:
+        time.sleep(self.delay)
+        with self.lock:
+            self.active.discard(self.programmer_sn)
+        return self.device_id != 'BAD000'
+
+
+@pytest.fixture
+def fake_flasher(monkeypatch):
+    monkeypatch.setitem(FlasherFactory.flashers_dict, 'Fake', SleepyFlasher)
+    return 'Fake'
+
+
+@pytest.fixture
+def device():
+    return Device('DoorProtect', STM8.STM8_6, DevRadio.INTRUSION)
+
+
+def test_jobs_run_in_parallel_across_probes(fake_flasher, device):
+    jobs = [
+        FlashJob(device, 'fw.hex', f'00000{i}', f'SN{i}', fake_flasher)
+        for i in range(4)
+    ]
+    batch = FlashOrchestrator().run(jobs)
+
+    assert len(batch.succeeded) == 4
+    assert batch.wall_time < 4 * SleepyFlasher.delay
+    assert [result.job for result in batch.results] == jobs
+
+
+def test_jobs_on_same_probe_are_serialized(fake_flasher, device):
+    jobs = [
+        FlashJob(device, 'fw.hex', device_id, 'SN1', fake_flasher)
+        for device_id in ('000001', 'BAD000', '000002')
+    ]
+    batch = FlashOrchestrator().run(jobs)
+
+    assert batch.wall_time >= 3 * SleepyFlasher.delay
+    assert [result.success for result in batch.results] == [True, False, True]
+    assert batch.failed[0].error == 'flasher reported failure'
+
+
+def test_job_exception_becomes_failed_result(device):
+    job = FlashJob(device, 'fw.hex', '000001', flasher='Missing')
+    result = FlashOrchestrator.run_job(job)
+
+    assert result.success is False
+    assert 'Missing' in result.error
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from firmware_tools import STM8, Device, FlasherFactory, FlashJob
+from firmware_tools import FlashOrchestrator
+from firmware_tools.BaseFlasher import BaseFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.ProbePool import (FakeProbeBackend, NoProbeError,
+                                      ProbePool, UsbProbeBackend)
+
+
+def usb_device(root, name, vendor, product, serial):
+    folder = root / name
+    folder.mkdir()
+    (folder / 'idVendor').write_text(f'{vendor}\n')
+    (folder / 'idProduct').write_text(f'{product}\n')
+    (folder / 'serial').write_text(f'{serial}\n')
+
+
+def test_usb_backend_finds_probes(tmp_path):
+    usb_device(tmp_path, '1-1', '0483', '3748', '066DFF515055')
+    usb_device(tmp_path, '1-2', '1366', '0105', '000260123456')
+    usb_device(tmp_path, '1-3', '0483', '5740', 'VCP0001')  # ST serial port
+    usb_device(tmp_path, '1-4', '046d', 'c52b', 'MOUSE')
+    (tmp_path / 'usb1').mkdir()  # root hub without attributes
+
+    assert UsbProbeBackend(str(tmp_path)).discover() == [
+        ('STlink', '066DFF515055'), ('JLink', '260123456'),
+    ]
+    assert UsbProbeBackend(str(tmp_path / 'missing')).discover() == []
+
+
+@pytest.fixture
+def pool():
+    pool = ProbePool(
+        FakeProbeBackend([('STlink', 'A'), ('STlink', 'B'), ('JLink', 'J')]),
+        cooldown=0.3,
+    )
+    pool.discover()
+    return pool
+
+
+def test_lease_waits_for_release(pool):
+    first = pool.lease('STlink')
+    second = pool.lease('STlink')
+    assert {first.serial, second.serial} == {'A', 'B'}
+    with pytest.raises(NoProbeError):
+        pool.lease('STlink', timeout=0.05)
+
+    threading.Timer(0.1, pool.release, (second, True, 1.0)).start()
+    assert pool.lease('STlink', timeout=2) is second
+    assert pool.lease('JLink').serial == 'J'
+
+
+def test_lease_errors(pool):
+    with pytest.raises(NoProbeError, match='No Fake probe connected'):
+        pool.lease('Fake')
+    with pytest.raises(NoProbeError, match='Probe X is not connected'):
+        pool.lease('STlink', serial='X')
+    with pytest.raises(NoProbeError, match='Probe J is a JLink'):
+        pool.lease('STlink', serial='J')
+
+
+def test_degraded_probe_rests(pool):
+    for _ in range(3):
+        probe = pool.lease('STlink', serial='A')
+        pool.release(probe, False, 1.0)
+
+    # A rests, B gets the work even while busy
+    b = pool.lease('STlink')
+    assert b.serial == 'B'
+    with pytest.raises(NoProbeError):
+        pool.lease('STlink', timeout=0.05)
+    summary = {probe['serial']: probe for probe in pool.summary()}
+    assert summary['A']['degraded'] and summary['A']['failures'] == 3
+
+    time.sleep(0.3)
+    assert pool.lease('STlink', timeout=0).serial == 'A'
+
+
+def test_failure_rate_prefers_better_probe(pool):
+    for success in (True, False, True, True):
+        probe = pool.lease('STlink', serial='A')
+        pool.release(probe, success, 1.0)
+    probe = pool.lease('STlink', serial='B')
+    pool.release(probe, True, 1.0)
+
+    assert pool.lease('STlink').serial == 'B'
+
+
+def test_discover_keeps_history(pool):
+    probe = pool.lease('JLink')
+    pool.release(probe, True, 2.0)
+    pool.backend.attached = [('STlink', 'A')]
+
+    assert [probe.serial for probe in pool.discover()] == ['A']
+    assert len(pool) == 1
+    with pytest.raises(NoProbeError):
+        pool.lease('JLink')
+    assert pool.probes['J'].mean_cycle_time == 2.0
+
+
+class ProbeFlasher(BaseFlasher):
+    delay = 0.1
+    broken = 'B'
+
+    def setup_firmware_flashing(self) -> None:
+        pass
+
+    def flash_firmware(self) -> bool:
+        time.sleep(self.delay)
+        return self.programmer_sn != self.broken
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    monkeypatch.setitem(FlasherFactory.flashers_dict, 'STlink', ProbeFlasher)
+    device = Device('DoorProtect', STM8.STM8_6, DevRadio.INTRUSION)
+    return [
+        FlashJob(device, 'fw.hex', f'0000{i:02}', flasher='STlink')
+        for i in range(12)
+    ]
+
+
+def test_orchestrator_leases_probes(pool, jobs, monkeypatch):
+    monkeypatch.setattr(ProbeFlasher, 'broken', '')
+    batch = FlashOrchestrator(pool=pool).run(jobs)
+
+    assert len(batch.succeeded) == 12
+    assert batch.wall_time < 12 * ProbeFlasher.delay * 0.75
+    used = Counter(result.job.programmer_sn for result in batch.results)
+    assert set(used) == {'A', 'B'}
+
+
+def test_orchestrator_routes_around_bad_probe(pool, jobs):
+    pool.cooldown = 60
+    batch = FlashOrchestrator(pool=pool).run(jobs)
+
+    failed = [result.job.programmer_sn for result in batch.failed]
+    assert set(failed) == {'B'}
+    assert len(failed) <= pool.max_consecutive_failures
+    assert pool.probes['A'].jobs == len(batch.succeeded) >= 9
+
+
+def test_orchestrator_pinned_probe(pool, jobs):
+    jobs[0].programmer_sn = 'A'
+    jobs[1].programmer_sn = 'X'
+    batch = FlashOrchestrator(pool=pool).run(jobs[:2])
+
+    assert batch.results[0].success
+    assert batch.results[1].error == 'Probe X is not connected'
@@ -0,0 +1,166 @@
+import os
+
+from firmware_tools import CC, STM32, Device, JLinkFlasher, STLinkFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.ScriptCache import ScriptCache
+
+
+def test_same_content_reuses_file(tmp_path):
+    cache = ScriptCache(str(tmp_path))
+    path = cache.get('init\n', '.cfg')
+    mtime = os.stat(path).st_mtime_ns
+
+    assert cache.get('init\n', '.cfg') == path
+    assert os.stat(path).st_mtime_ns == mtime
+    assert cache.get('exit\n', '.cfg') != path
+
+
+def test_mismatched_file_on_disk_is_rewritten(tmp_path):
+    path = ScriptCache(str(tmp_path)).get('lock\n', '.cfg')
+    with open(path, 'w') as file:
+        file.write('garbage\n')
+
+    assert ScriptCache(str(tmp_path)).get('lock\n', '.cfg') == path
+    with open(path) as file:
+        assert file.read() == 'lock\n'
+
+
+def test_file_changed_after_write_is_rewritten(tmp_path):
+    cache = ScriptCache(str(tmp_path))
+    path = cache.get('reset\n', '.cfg')
+    with open(path, 'w') as file:
+        file.write('res')
+
+    assert cache.get('reset\n', '.cfg') == path
+    with open(path) as file:
+        assert file.read() == 'reset\n'
+
+
+def test_files_of_earlier_runs_count_to_limit(tmp_path):
+    old = ScriptCache(str(tmp_path)).get('aaaa\n', '.cfg')
+    os.utime(old, ns=(0, 0))
+    open(tmp_path / 'x.cfg.1.2', 'w').close()  # unfinished write
+
+    cache = ScriptCache(str(tmp_path), max_bytes=8)
+    assert cache.size == 5
+    cache.get('bbbb\n', '.cfg')
+    assert not os.path.isfile(old)
+    assert cache.size == 5
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = ScriptCache(str(tmp_path), max_bytes=10)
+    first = cache.get('aaaa\n', '.cfg')
+    second = cache.get('bbbb\n', '.cfg')
+    cache.get('aaaa\n', '.cfg')
+    cache.get('cccc\n', '.cfg')
+
+    assert os.path.isfile(first)
+    assert not os.path.isfile(second)
+
+
+def test_pinned_files_are_kept_until_unpinned(tmp_path):
+    cache = ScriptCache(str(tmp_path), max_bytes=10)
+    pinned = cache.get('aaaa\n', '.bin', pin=True)
+    second = cache.get('bbbb\n', '.bin')
+    cache.get('cccc\n', '.bin')
+    assert os.path.isfile(pinned)
+    assert not os.path.isfile(second)
+
+    cache.unpin([pinned])
+    cache.get('dddd\n', '.bin')
+    assert not os.path.isfile(pinned)
+
+
+def test_sector_files_survive_other_processor_jobs(tmp_path):
+    jobs = [
+        (STM32.STM32_L0, FirmwareImage.from_bytes(bytes(0x1000), 0x08000000)),
+        # larger than 4 * the L0 flash, the first cap of a shared folder
+        (STM32.STM32_U5, FirmwareImage.from_bytes(
+            os.urandom(0x50000), 0x08000000,
+        )),
+    ]
+    for processor, image in jobs:
+        device = Device(
+            'MotionCam', processor, DevRadio.INTRUSION, id_address=0x08000010,
+        )
+        flasher = STLinkFlasher(device, 'fw.hex', '00000001', verify=True)
+        flasher.cfg_folder = str(tmp_path)
+        flasher.image = image
+        files = flasher.sector_files()
+        assert all(os.path.isfile(path) for _, _, path, _ in files)
+        flasher.cleanup()
+
+
+def test_jlink_config_is_cached_and_kept(tmp_path):
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x1000,
+    )
+    flasher = JLinkFlasher(device, 'fw.hex', '1ABC2D')
+    flasher.cfg_folder = str(tmp_path)
+    config = flasher.cc13x0_cfg()
+
+    assert flasher.cc13x0_cfg() == config
+    assert config not in flasher.files_to_remove
+    with open(config) as file:
+        assert 'w1 0001FFE6 00\n' in file.read()
+
+
+def test_jlink_verify_runs_before_lock_registers(tmp_path):
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x1000,
+    )
+    flasher = JLinkFlasher(device, 'fw.hex', '1ABC2D', verify=True)
+    flasher.cfg_folder = str(tmp_path)
+    flasher.image = FirmwareImage.from_bytes(b'\x01' * 0x1800, 0)
+    with open(flasher.cc13x0_cfg()) as file:
+        lines = file.read().splitlines()
+
+    verify = [line for line in lines if line.startswith('verifybin')]
+    assert [line.split()[-1] for line in verify] == ['0x0', '0x1000']
+    assert lines.index(verify[-1]) < lines.index('w1 0001FFD8 00')
+
+
+def test_jlink_jobs_share_one_script(tmp_path):
+    firmware = FirmwareImage.from_bytes(bytes(0x100), 0x8000).write_hex(
+        str(tmp_path / 'fw.hex'),
+    )
+    configs = []
+    for device_id in ('1ABC2D', '1ABC2E'):
+        device = Device(
+            'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x8080,
+        )
+        flasher = JLinkFlasher(device, firmware, device_id)
+        flasher.cfg_folder = str(tmp_path / 'cfg')
+        flasher.setup_firmware_flashing()
+        configs.append(flasher.config_file)
+        with open(flasher.config_file) as file:
+            assert 'loadfile firmware_to_flash.hex\n' in file.read()
+        assert os.path.isfile(
+            os.path.join(flasher.cwd, 'firmware_to_flash.hex'),
+        )
+        flasher.cleanup()
+
+    assert configs[0] == configs[1]
+    assert len(os.listdir(tmp_path / 'cfg' / 'scripts')) == 1
+
+
+def test_jlink_script_paths_do_not_depend_on_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    FirmwareImage.from_bytes(bytes(0x100), 0x8000).write_hex('fw.hex')
+    FirmwareImage.from_bytes(bytes(0x10), 0).write_hex('boot.hex')
+    device = Device(
+        'KeyPadCombi', CC.CC_1310, DevRadio.SMART_HOME, id_address=0x8080,
+    )
+    flasher = JLinkFlasher(
+        device, 'fw.hex', '1ABC2D', bootloader='boot.hex', cfg_folder='cfg',
+    )
+    flasher.setup_firmware_flashing()
+
+    # JLinkExe runs in the job workspace, not in this folder
+    assert flasher.cwd != str(tmp_path)
+    assert f'-CommandFile {tmp_path / "cfg"}' in flasher.jlink_cmd()
+    with open(flasher.config_file) as file:
+        assert f'loadfile {tmp_path / "boot.hex"} 0x8080\n' in file.read()
+    flasher.cleanup()
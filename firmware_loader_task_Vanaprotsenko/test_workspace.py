@@ -0,0 +1,51 @@
+import os
+
+from firmware_tools import STM8, Device, STLinkFlasher
+from firmware_tools.classes import DevRadio
+from firmware_tools.FirmwareImage import FirmwareImage
+from firmware_tools.Workspace import Workspace
+
+
+def make_flasher(firmware, device_id):
+    device = Device(
+        'DoorProtect', STM8.STM8_6, DevRadio.INTRUSION, id_address=0x8080,
+    )
+    return STLinkFlasher(device, firmware, device_id)
+
+
+def test_workspace_cleanup(workspace_root):
+    with Workspace() as workspace:
+        assert os.path.dirname(workspace.path) == workspace_root
+        with open(workspace.file('a.hex'), 'w') as file:
+            file.write('data')
+    assert not os.path.exists(workspace.path)
+
+
+def test_parallel_jobs_never_share_files(tmp_path):
+    firmware = FirmwareImage.from_bytes(b'\xFF' * 256, 0x8000).write_hex(
+        str(tmp_path / '[DoorProtect][1][EU][0][3B].hex'),
+    )
+    first = make_flasher(firmware, '1ABC2D')
+    second = make_flasher(firmware, '3E4F5A')
+    first.write_id_with_intelhex()
+    second.write_id_with_intelhex()
+
+    assert first.firmware != second.firmware
+    assert first.firmware.name == second.firmware.name == (
+        'firmware_to_flash.hex'
+    )
+    assert FirmwareImage.from_hex(first.firmware)[0x8080] == 0x1A
+    assert FirmwareImage.from_hex(second.firmware)[0x8080] == 0x3E
+    assert os.listdir(tmp_path) == [os.path.basename(firmware)]
+
+
+def test_run_removes_workspace(monkeypatch, tmp_path):
+    firmware = FirmwareImage.from_bytes(b'\xFF' * 16, 0x8000).write_hex(
+        str(tmp_path / 'fw.hex'),
+    )
+    flasher = make_flasher(firmware, '1ABC2D')
+    monkeypatch.setattr(flasher, 'flash_firmware', lambda: True)
+
+    assert flasher.run() is True
+    assert flasher._workspace is None
+    assert not os.path.exists(os.path.dirname(flasher.firmware))